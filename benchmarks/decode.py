@@ -0,0 +1,85 @@
+"""Documents per second decoded by MongoDBModel.from_mongo.
+
+Compares the precompiled per-model decoder against the previous implementation, which inspected
+every model field on every document, and against trusted (non-validating) decoding.
+
+Usage:
+    PYTHONPATH=. python benchmarks/decode.py [number of documents]
+"""
+import json
+import sys
+import time
+from typing import Any, Optional
+
+from bson import ObjectId
+from pydantic import create_model
+
+from mongomantic import MongoDBModel
+
+FIELDS = 40
+
+
+def legacy_from_mongo(cls, data):
+    if not data:
+        return None
+
+    id = data.pop("_id", None)
+    for k, v in cls.__fields__.items():
+        fields_data = str(v).split(" ")
+        for e in fields_data:
+            if "Optional[Any]".lower() in e.lower() and "type" in e.lower():
+                if k in data and data[k]:
+                    data[k] = json.dumps(data[k])
+    return cls(**dict(data, id=id))
+
+
+def build_model():
+    fields = {}
+    for i in range(FIELDS):
+        if i % 10 == 0:
+            fields[f"field_{i}"] = (Optional[Any], None)
+        elif i % 2:
+            fields[f"field_{i}"] = (int, ...)
+        else:
+            fields[f"field_{i}"] = (str, ...)
+    return create_model("Wide", __base__=MongoDBModel, **fields)
+
+
+def build_document(model):
+    document = {"_id": ObjectId()}
+    for name, field in model.__fields__.items():
+        if name == "id":
+            continue
+        if field.type_ is int:
+            document[name] = 42
+        elif field.type_ is str:
+            document[name] = "value"
+        else:
+            document[name] = {"nested": [1, 2, 3]}
+    return document
+
+
+def run(decode, model, document, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        decode(model, dict(document))
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    model = build_model()
+    document = build_document(model)
+
+    before = run(legacy_from_mongo, model, document, n)
+    after = run(lambda cls, data: cls.from_mongo(data), model, document, n)
+    trusted = run(lambda cls, data: cls.from_mongo(data, trusted=True), model, document, n)
+
+    print(f"{FIELDS}-field model, {n} documents")
+    print(f"before: {before:>10.0f} docs/s")
+    print(f"after:  {after:>10.0f} docs/s  ({after / before:.2f}x)")
+    print(f"trusted:{trusted:>10.0f} docs/s  ({trusted / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,25 @@ except PackageNotFoundError:  # pragma: no cover
     __version__ = "unknown"
 
 
-from mongomantic.core.base_repository import BaseRepository
-from mongomantic.core.database import connect, disconnect
+from mongomantic.core.advisor import IndexAdvisor
+from mongomantic.core.async_repository import AsyncBaseRepository
+from mongomantic.core.base_repository import BaseRepository, ensure_indexes
+from mongomantic.core.database import connect, disconnect, use_connection
 from mongomantic.core.index import Index
 from mongomantic.core.mongo_model import MongoDBModel
+from mongomantic.core.query import Q
+from mongomantic.core.reference import Reference
 
-__all__ = ["BaseRepository", "MongoDBModel", "connect", "disconnect", "Index"]
+__all__ = [
+    "AsyncBaseRepository",
+    "BaseRepository",
+    "MongoDBModel",
+    "connect",
+    "disconnect",
+    "ensure_indexes",
+    "Index",
+    "IndexAdvisor",
+    "Q",
+    "Reference",
+    "use_connection",
+]
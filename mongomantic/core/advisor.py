@@ -0,0 +1,304 @@
+"""Index coverage advisor, matching the shapes of the queries run by repositories against their declared indexes"""
+
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, List, Mapping, Optional, Sequence, Set, Tuple, Type
+
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+
+from pymongo import TEXT
+
+from .errors import UnindexedQueryError
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .base_repository import BaseRepository
+
+__all__ = ["AdvisorReport", "IndexAdvisor", "QueryShape", "ShapeUsage", "classify", "query_shapes"]
+
+INDEXED = "indexed"
+PARTIAL = "partial"
+UNINDEXED = "unindexed"
+
+# Operators that select on exact values, which an index serves like an equality
+EQUALITY_OPERATORS = frozenset({"$eq", "$in"})
+
+# Every collection has a unique index on _id
+_ID_INDEX = ("_id_", (("_id", 1),), True)
+
+_advisors: List["IndexAdvisor"] = []
+_advisors_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    """Fields a query filters on, by kind, and its sort, without the values"""
+
+    collection: str
+    equality: Tuple[str, ...] = ()
+    ranges: Tuple[str, ...] = ()
+    sort: Tuple[Tuple[str, int], ...] = ()
+
+    def __str__(self) -> str:
+        fields = [f"{name}: eq" for name in self.equality] + [f"{name}: range" for name in self.ranges]
+        text = f"{self.collection} {{{', '.join(fields)}}}"
+        if self.sort:
+            text += " sort [" + ", ".join(("-" if direction < 0 else "") + key for key, direction in self.sort) + "]"
+        return text
+
+
+@dataclass
+class ShapeUsage:
+    """Calls of a repository with a query shape, and how well the declared indexes cover it.
+
+    `index` is the name of the index that covers the shape, or that serves it best when it is partly indexed.
+    """
+
+    repository: str
+    shape: QueryShape
+    coverage: str
+    index: Optional[str]
+    calls: int
+    operations: Dict[str, int] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        operations = ", ".join(f"{name} x{count}" for name, count in sorted(self.operations.items()))
+        index = f" (index {self.index})" if self.index else ""
+        return f"{self.coverage:<9} {self.calls:>6} calls  {self.repository}: {self.shape}{index}  [{operations}]"
+
+
+@dataclass
+class AdvisorReport:
+    """Query shapes recorded by an IndexAdvisor, the least covered and most called first"""
+
+    shapes: List[ShapeUsage] = field(default_factory=list)
+
+    @property
+    def unindexed(self) -> List[ShapeUsage]:
+        return [usage for usage in self.shapes if usage.coverage == UNINDEXED]
+
+    @property
+    def partial(self) -> List[ShapeUsage]:
+        return [usage for usage in self.shapes if usage.coverage == PARTIAL]
+
+    def problems(self, allow_partial: bool = False) -> List[ShapeUsage]:
+        """Unindexed shapes, and partly indexed ones unless `allow_partial`"""
+        return self.unindexed if allow_partial else self.unindexed + self.partial
+
+    def check(self, allow_partial: bool = False) -> None:
+        """Raises UnindexedQueryError listing the problems, if any"""
+        problems = self.problems(allow_partial)
+        if problems:
+            lines = "\n".join(str(usage) for usage in problems)
+            raise UnindexedQueryError(f"{len(problems)} query shapes are not covered by the declared indexes:\n{lines}")
+
+    def __str__(self) -> str:
+        return "\n".join(str(usage) for usage in self.shapes)
+
+
+def _is_operator_document(value: Any) -> bool:
+    return isinstance(value, Mapping) and bool(value) and all(str(key).startswith("$") for key in value)
+
+
+def _combine(left: List[Tuple[FrozenSet[str], FrozenSet[str]]], right: List[Tuple[FrozenSet[str], FrozenSet[str]]]):
+    return [(le | re, lr | rr) for le, lr in left for re, rr in right]
+
+
+def query_shapes(query: Mapping[str, Any]) -> List[Tuple[FrozenSet[str], FrozenSet[str]]]:
+    """Equality and range fields of a filter document.
+
+    `$and` clauses are merged. Each `$or` clause has to be served by an index of its own, so a filter gives one
+    shape per combination of `$or` clauses. `$nor`, `$expr`, `$where` and `$text` cannot use the declared
+    (non text) indexes, and are left out.
+    """
+    equality: Set[str] = set()
+    ranges: Set[str] = set()
+    alternatives = [(frozenset(), frozenset())]
+    for key, value in query.items():
+        if key == "$and":
+            for part in value:
+                alternatives = _combine(alternatives, query_shapes(part))
+        elif key == "$or":
+            alternatives = _combine(alternatives, [shape for part in value for shape in query_shapes(part)])
+        elif key.startswith("$"):
+            continue
+        elif _is_operator_document(value) and not set(value) <= EQUALITY_OPERATORS:
+            ranges.add(key)
+        else:
+            equality.add(key)
+
+    shapes = []
+    for other_equality, other_ranges in alternatives:
+        all_equality = frozenset(equality | other_equality)
+        shapes.append((all_equality, frozenset((ranges | other_ranges) - all_equality)))
+    return shapes
+
+
+def _declared_indexes(repository: Type["BaseRepository"]) -> List[Tuple[str, Tuple[Tuple[str, int], ...], bool]]:
+    """Name, non text keys and uniqueness of the indexes declared by a repository, and of the _id index"""
+    indexes = [_ID_INDEX]
+    for index in getattr(repository.Meta, "indexes", None) or []:
+        document = index.to_index_model().document
+        keys = tuple((key, direction) for key, direction in document["key"].items() if direction != TEXT)
+        if keys:
+            indexes.append((document["name"], keys, bool(document.get("unique"))))
+    return indexes
+
+
+def _covers(keys: Sequence[Tuple[str, int]], shape: QueryShape) -> bool:
+    """Whether an index serves a shape following the equality, sort, range rule.
+
+    Equality fields must be the first keys of the index in any order, followed by the sort keys in order (all
+    in the same or all in the opposite directions), followed by the remaining range fields.
+    """
+    fields = [key for key, _ in keys]
+    equality = set(shape.equality)
+    position = len(equality)
+    if set(fields[:position]) != equality:
+        return False
+
+    sort = [(key, direction) for key, direction in shape.sort if key not in equality]
+    if sort:
+        window = keys[position : position + len(sort)]
+        if [key for key, _ in window] != [key for key, _ in sort]:
+            return False
+        same = all(index_direction == direction for (_, index_direction), (_, direction) in zip(window, sort))
+        opposite = all(index_direction == -direction for (_, index_direction), (_, direction) in zip(window, sort))
+        if not (same or opposite):
+            return False
+        position += len(sort)
+
+    ranges = set(shape.ranges) - set(fields[:position])
+    return set(fields[position : position + len(ranges)]) == ranges
+
+
+def _leading_matches(fields: Sequence[str], shape: QueryShape) -> int:
+    """Number of leading keys of an index the shape filters on, or starts sorting on"""
+    used = set(shape.equality) | set(shape.ranges)
+    sort = [key for key, _ in shape.sort if key not in used]
+    used.update(sort[:1])
+    count = 0
+    for key in fields:
+        if key not in used:
+            break
+        count += 1
+    return count
+
+
+def classify(repository: Type["BaseRepository"], shape: QueryShape) -> Tuple[str, Optional[str]]:
+    """Coverage of a shape by the indexes of a repository, and the name of the index serving it best.
+
+    Shapes that neither filter nor sort read the whole collection by design, and count as indexed. So do
+    shapes with equalities on all the keys of a unique index, which match at most one document.
+    """
+    if not (shape.equality or shape.ranges or shape.sort):
+        return INDEXED, None
+
+    indexes = _declared_indexes(repository)
+    for name, keys, unique in indexes:
+        if _covers(keys, shape) or (unique and {key for key, _ in keys} <= set(shape.equality)):
+            return INDEXED, name
+
+    best, best_count = None, 0
+    for name, keys, _ in indexes:
+        count = _leading_matches([key for key, _ in keys], shape)
+        if count > best_count:
+            best, best_count = name, count
+    return (PARTIAL, best) if best is not None else (UNINDEXED, None)
+
+
+class IndexAdvisor:
+    """Records the query shapes of repository calls while active, and reports how the declared indexes cover them.
+
+    A shape is the set of fields a query filters on by equality (`field=value`, `$in`) and by range (any other
+    operator), and its sort. Shapes are matched against `Meta.indexes` and the `_id` index: a shape is
+    `indexed` when an index serves its filter and sort (see `_covers`), `partial` when an index can be used for
+    its leading fields only, and `unindexed` when the query needs a collection scan.
+
+    Recording is opt-in and happens in `find`, `get`, `count`, `exists`, `find_one`, `distinct`, `paginate`,
+    `find_with_total`, `find_columns`, `update_one`, `delete`, `delete_many`, `get_or_create` and
+    `create_or_update`. Nothing is recorded while no advisor is active.
+
+    Example::
+
+        def test_queries_are_indexed(mongodb):
+            with IndexAdvisor() as advisor:
+                run_scenario()
+            advisor.report().check(allow_partial=True)
+    """
+
+    def __init__(self):
+        self._calls: Counter = Counter()
+        self._repositories: Dict[str, Type["BaseRepository"]] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "IndexAdvisor":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Starts recording the queries of all repositories"""
+        with _advisors_lock:
+            if self not in _advisors:
+                _advisors.append(self)
+
+    def stop(self) -> None:
+        with _advisors_lock:
+            if self in _advisors:
+                _advisors.remove(self)
+
+    def reset(self) -> None:
+        """Forgets the recorded queries"""
+        with self._lock:
+            self._calls.clear()
+
+    def record(
+        self,
+        repository: Type["BaseRepository"],
+        operation: str,
+        query: Mapping[str, Any],
+        sort: Optional[Sequence[Tuple[str, int]]] = None,
+    ) -> None:
+        """Records the shapes of a compiled filter document and sort"""
+        sort_shape = tuple((key, direction) for key, direction in sort or ())
+        shapes = [
+            QueryShape(repository.Meta.collection, tuple(sorted(equality)), tuple(sorted(ranges)), sort_shape)
+            for equality, ranges in query_shapes(query)
+        ]
+        with self._lock:
+            self._repositories[repository.__name__] = repository
+            for shape in shapes:
+                self._calls[(repository.__name__, shape, operation)] += 1
+
+    def report(self) -> AdvisorReport:
+        """Recorded shapes with their call counts and coverage"""
+        with self._lock:
+            calls = dict(self._calls)
+            repositories = dict(self._repositories)
+
+        usages: Dict[Tuple[str, QueryShape], ShapeUsage] = {}
+        for (name, shape, operation), count in calls.items():
+            usage = usages.get((name, shape))
+            if usage is None:
+                coverage, index = classify(repositories[name], shape)
+                usage = usages[(name, shape)] = ShapeUsage(name, shape, coverage, index, 0)
+            usage.calls += count
+            usage.operations[operation] = usage.operations.get(operation, 0) + count
+
+        order = {UNINDEXED: 0, PARTIAL: 1, INDEXED: 2}
+        shapes = sorted(usages.values(), key=lambda usage: (order[usage.coverage], -usage.calls, str(usage.shape)))
+        return AdvisorReport(shapes)
+
+
+def record_query(
+    repository: Type["BaseRepository"],
+    operation: str,
+    query: Mapping[str, Any],
+    sort: Optional[Sequence[Tuple[str, int]]] = None,
+) -> None:
+    """Records a query with the active advisors, if any"""
+    if _advisors:
+        for advisor in list(_advisors):
+            advisor.record(repository, operation, query, sort)
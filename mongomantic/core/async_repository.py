@@ -0,0 +1,262 @@
+"""Asyncio repositories, running the queries of a synchronous repository on a pluggable backend"""
+
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type, TypeVar, Union
+
+import asyncio
+import contextvars
+import weakref
+from abc import ABC, ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
+from bson import ObjectId
+
+from .base_repository import SAVE_MANY_CHUNK_SIZE, ABRepositoryMeta, BaseRepository
+from .mongo_model import MongoDBModel
+from .pagination import Page
+from .query import Q
+
+__all__ = ["AsyncBackend", "AsyncBaseRepository", "ThreadPoolBackend", "set_default_backend"]
+
+T = TypeVar("T")
+
+ASYNC_POOL_SIZE = 32
+ASYNC_CHUNK_SIZE = 100
+
+
+class AsyncBackend(ABC):
+    """Runs the blocking calls of asynchronous repositories"""
+
+    @abstractmethod
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Runs `func(*args, **kwargs)` without blocking the event loop, and returns its result"""
+
+    def close(self) -> None:
+        """Releases the resources of the backend"""
+
+
+class ThreadPoolBackend(AsyncBackend):
+    """Runs blocking pymongo calls in a bounded thread pool.
+
+    This is how Motor drives pymongo as well, so it gives the same concurrency, with the same query
+    building and decoding as the synchronous repositories, and works with mongomock. Calls run in a copy of
+    the caller's context, so that `use_connection` overrides apply.
+    """
+
+    def __init__(self, max_workers: int = ASYNC_POOL_SIZE):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mongomantic")
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, partial(context.run, func, *args, **kwargs))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+_default_backend: Optional[AsyncBackend] = None
+
+
+def set_default_backend(backend: Optional[AsyncBackend]) -> None:
+    """Sets the backend of repositories without `Meta.async_backend`, a ThreadPoolBackend by default"""
+    global _default_backend
+    _default_backend = backend
+
+
+def _get_default_backend() -> AsyncBackend:
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = ThreadPoolBackend()
+    return _default_backend
+
+
+class _Unlimited:
+    async def __aenter__(self) -> None:
+        return None
+
+    async def __aexit__(self, *args: Any) -> None:
+        return None
+
+
+_UNLIMITED = _Unlimited()
+
+
+def _next_chunk(iterator: Iterator[T], size: int) -> List[T]:
+    return list(islice(iterator, size))
+
+
+class AsyncRepositoryMeta(ABCMeta):
+    """Builds the synchronous repository running the queries of an AsyncBaseRepository, from the same Meta"""
+
+    def __new__(cls, name: str, bases: Tuple[type, ...], namespace: Dict[str, Any], **kwds: Any):
+        repository = super().__new__(cls, name, bases, namespace, **kwds)
+        meta = repository.__dict__.get("Meta", False)
+        if not meta:
+            raise NotImplementedError("Internal 'Meta' not implemented")
+
+        model = meta.__dict__.get("model")
+        if isinstance(model, type) and issubclass(model, MongoDBModel):
+            repository.sync_repository = ABRepositoryMeta(
+                f"{name}Sync", (BaseRepository,), {"Meta": meta, "__module__": repository.__module__}
+            )
+        elif not (meta.__dict__.get("model", False) and meta.__dict__.get("collection", False)):
+            raise NotImplementedError("'model' or 'collection' properties are missing from internal Meta class")
+        repository._semaphores = weakref.WeakKeyDictionary()
+        return repository
+
+
+class AsyncBaseRepository(metaclass=AsyncRepositoryMeta):
+    """Asyncio counterpart of BaseRepository, declared with the same Meta.
+
+    Every query is run by the synchronous `sync_repository` built from the Meta, on the backend set in
+    `Meta.async_backend` (a shared ThreadPoolBackend by default), so filters, options, errors and decoding are
+    the same as with BaseRepository. `Meta.max_concurrency` bounds the number of queries of the repository
+    running at once, further queries wait for a slot.
+
+    Example::
+
+        class UserRepository(AsyncBaseRepository):
+            class Meta:
+                model = User
+                collection = "user"
+                max_concurrency = 20
+
+        user = await UserRepository.get(id=user_id)
+        async for user in UserRepository.find(age__gte=18):
+            ...
+    """
+
+    sync_repository: Type[BaseRepository]
+
+    class Meta:
+        @property
+        def model(self) -> Type[MongoDBModel]:
+            """Model class that subclasses MongoDBModel"""
+            raise NotImplementedError
+
+        @property
+        def collection(self) -> str:
+            """String representing the MongoDB collection to use when storing this model"""
+            raise NotImplementedError
+
+    @classmethod
+    def _backend(cls) -> AsyncBackend:
+        return getattr(cls.Meta, "async_backend", None) or _get_default_backend()
+
+    @classmethod
+    def _limit(cls) -> Union[asyncio.Semaphore, _Unlimited]:
+        """Semaphore bounding concurrent queries of the repository, per event loop"""
+        max_concurrency = getattr(cls.Meta, "max_concurrency", None)
+        if not max_concurrency:
+            return _UNLIMITED
+        loop = asyncio.get_running_loop()
+        semaphore = cls._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = cls._semaphores[loop] = asyncio.Semaphore(max_concurrency)
+        return semaphore
+
+    @classmethod
+    async def _run(cls, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        async with cls._limit():
+            return await cls._backend().run(func, *args, **kwargs)
+
+    @classmethod
+    async def _iterate(cls, results: Iterator[T], chunk_size: int) -> AsyncIterator[T]:
+        """Consumes a blocking generator in chunks on the backend"""
+        try:
+            while True:
+                chunk = await cls._run(_next_chunk, results, chunk_size)
+                if not chunk:
+                    return
+                for result in chunk:
+                    yield result
+        finally:
+            close = getattr(results, "close", None)
+            if close is not None:
+                await cls._run(close)
+
+    @classmethod
+    async def save(cls, model: MongoDBModel) -> MongoDBModel:
+        """See BaseRepository.save"""
+        return await cls._run(cls.sync_repository.save, model)
+
+    @classmethod
+    async def save_many(
+        cls, models: Iterable[MongoDBModel], chunk_size: int = SAVE_MANY_CHUNK_SIZE, returning: str = "models"
+    ) -> Union[List[MongoDBModel], List[ObjectId], int]:
+        """See BaseRepository.save_many"""
+        return await cls._run(cls.sync_repository.save_many, models, chunk_size=chunk_size, returning=returning)
+
+    @classmethod
+    async def update_one(cls, filter_query: Dict, update: Dict) -> bool:
+        """See BaseRepository.update_one"""
+        return await cls._run(cls.sync_repository.update_one, filter_query, update)
+
+    @classmethod
+    async def get(cls, *queries: Q, **kwargs) -> MongoDBModel:
+        """See BaseRepository.get"""
+        return await cls._run(cls.sync_repository.get, *queries, **kwargs)
+
+    @classmethod
+    async def get_many(cls, ids: Iterable[Any], **kwargs) -> List[Optional[MongoDBModel]]:
+        """See BaseRepository.get_many"""
+        return await cls._run(cls.sync_repository.get_many, ids, **kwargs)
+
+    @classmethod
+    async def find(cls, *queries: Q, chunk_size: int = ASYNC_CHUNK_SIZE, **kwargs) -> AsyncIterator[Any]:
+        """Async iterator over the results of BaseRepository.find, read `chunk_size` results per backend call"""
+        async for result in cls._iterate(cls.sync_repository.find(*queries, **kwargs), chunk_size):
+            yield result
+
+    @classmethod
+    async def find_one(cls, *queries: Q, **kwargs) -> Optional[MongoDBModel]:
+        """See BaseRepository.find_one"""
+        return await cls._run(cls.sync_repository.find_one, *queries, **kwargs)
+
+    @classmethod
+    async def exists(cls, *queries: Q, **kwargs) -> bool:
+        """See BaseRepository.exists"""
+        return await cls._run(cls.sync_repository.exists, *queries, **kwargs)
+
+    @classmethod
+    async def paginate(cls, *queries: Q, **kwargs) -> Page:
+        """See BaseRepository.paginate"""
+        return await cls._run(cls.sync_repository.paginate, *queries, **kwargs)
+
+    @classmethod
+    async def find_with_total(cls, *queries: Q, **kwargs) -> Tuple[List[MongoDBModel], int]:
+        """See BaseRepository.find_with_total"""
+        return await cls._run(cls.sync_repository.find_with_total, *queries, **kwargs)
+
+    @classmethod
+    async def aggregate(cls, pipeline: List[Dict], chunk_size: int = ASYNC_CHUNK_SIZE, **kwargs) -> AsyncIterator[Any]:
+        """Async iterator over the results of BaseRepository.aggregate, read `chunk_size` results per backend call"""
+        async for result in cls._iterate(cls.sync_repository.aggregate(pipeline, **kwargs), chunk_size):
+            yield result
+
+    @classmethod
+    async def count(cls, *queries: Q, **kwargs) -> int:
+        """See BaseRepository.count"""
+        return await cls._run(cls.sync_repository.count, *queries, **kwargs)
+
+    @classmethod
+    async def delete(cls, *queries: Q, **kwargs) -> bool:
+        """See BaseRepository.delete"""
+        return await cls._run(cls.sync_repository.delete, *queries, **kwargs)
+
+    @classmethod
+    async def delete_many(cls, *queries: Q, **kwargs) -> bool:
+        """See BaseRepository.delete_many"""
+        return await cls._run(cls.sync_repository.delete_many, *queries, **kwargs)
+
+    @classmethod
+    async def get_or_create(cls, defaults: Optional[Dict] = None, **kwargs) -> Tuple[MongoDBModel, bool]:
+        """See BaseRepository.get_or_create"""
+        return await cls._run(cls.sync_repository.get_or_create, defaults, **kwargs)
+
+    @classmethod
+    async def create_or_update(cls, defaults: Optional[Dict] = None, **kwargs) -> Tuple[MongoDBModel, bool]:
+        """See BaseRepository.create_or_update"""
+        return await cls._run(cls.sync_repository.create_or_update, defaults, **kwargs)
@@ -1,22 +1,136 @@
-from typing import Any, Dict, Iterator, List, Tuple, Type
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
 
+import threading
+import weakref
 from abc import ABCMeta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 
-from bson import ObjectId
+from bson import SON, ObjectId
 from bson.objectid import InvalidId
-from mongomantic.core.index import Index
+from mongomantic.config import logger
+from mongomantic.core.index import Index, IndexReport, sync_collection_indexes
+from pydantic import BaseModel, ValidationError
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
 from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError, OperationFailure
+from pymongo.read_preferences import _ServerMode
 
-from .database import MongomanticClient
+from .advisor import record_query
+from .bulk import BulkOperations
+from .cache import CacheStats, ModelCache
+from .columnar import COLUMNS_BATCH_SIZE, Column, model_columns, raw_collection, read_arrow, read_numpy
+from .database import DEFAULT_CONNECTION, connections, get_connection, route
 from .errors import (
+    UNRECOGNIZED_PIPELINE_STAGE,
     DoesNotExistError,
     FieldDoesNotExistError,
-    IndexCreationError,
     InvalidQueryError,
     MultipleObjectsReturnedError,
+    PartialWriteError,
     WriteError,
 )
+from .lazy import from_raw
+from .loader import DataLoader
+from .metrics import measure
 from .mongo_model import MongoDBModel
+from .pagination import Page, decode_token, encode_token, keyset_filter
+from .parallel import parallel_scan, partition_bounds, range_filters, read_ahead
+from .query import Q, compile_lookups
+from .reference import Reference
+from .writer import BatchWriter, ErrorCallback
+
+
+SAVE_MANY_CHUNK_SIZE = 1000
+# Documents per chunk handed over by the read-ahead thread, when find is not given a batch_size
+READ_AHEAD_BATCH_SIZE = 101
+
+_cache_lock = threading.Lock()
+
+
+def _cache_copy(model: MongoDBModel) -> MongoDBModel:
+    """Shallow copy of a model going in or out of the cache, with its own changed fields tracking"""
+    model = model.copy()
+    model.track_changes()
+    return model
+
+
+def _itemgetter_or_none(key: str):
+    """Like operator.itemgetter, returning None for documents missing the key"""
+
+    def getter(document):
+        return document.get(key)
+
+    return getter
+
+
+def _tuplegetter_or_none(keys: List[str]):
+    """Tuple of the values of keys in a document, None for missing keys"""
+
+    def getter(document):
+        return tuple(document.get(key) for key in keys)
+
+    return getter
+
+
+def _reference_type(model: Type[MongoDBModel], path: str) -> Type[Reference]:
+    """Reference type of the field at a dotted path, going through embedded models"""
+    segments = path.split(".")
+    for i, segment in enumerate(segments):
+        field = model.__fields__.get(segment)
+        if field is None:
+            raise FieldDoesNotExistError(f"Field {segment} does not exist for model {model}")
+        if i == len(segments) - 1:
+            if not (isinstance(field.type_, type) and issubclass(field.type_, Reference) and field.type_.model):
+                raise InvalidQueryError(f"Field {path} is not a typed Reference")
+            return field.type_
+        if not (isinstance(field.type_, type) and issubclass(field.type_, MongoDBModel)):
+            raise InvalidQueryError(f"Field {segment} of {path} is not an embedded model")
+        model = field.type_
+
+
+def _get_path(document: Dict, path: str) -> Any:
+    """Value at a dotted path in a document, None if missing"""
+    for segment in path.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(segment)
+    return document
+
+
+def _collect_path(objects: List[Any], segments: List[str]) -> List[Any]:
+    """Values found at a dotted path in objects, flattening lists along the way"""
+    for segment in segments:
+        values = []
+        for obj in objects:
+            value = getattr(obj, segment, None)
+            if isinstance(value, (list, tuple, set)):
+                values.extend(each for each in value if each is not None)
+            elif value is not None:
+                values.append(value)
+        objects = values
+    return objects
+
+
+def _result_decoder(model: Type[BaseModel], trusted: bool):
+    """Function decoding an aggregation result into `model`, a MongoDBModel or any pydantic model"""
+    if issubclass(model, MongoDBModel):
+        return partial(model.from_mongo, trusted=trusted)
+    if trusted:
+        return lambda data: model.construct(**data)
+    return model.parse_obj
+
+
+def _decode_documents(model: Type[MongoDBModel], trusted: bool, documents: List[Dict]) -> List[MongoDBModel]:
+    return [model.from_mongo(document, trusted=trusted) for document in documents]
+
+
+def _decode_in_pool(
+    pool: ProcessPoolExecutor, model: Type[MongoDBModel], trusted: bool, documents: List[Dict]
+) -> List[MongoDBModel]:
+    return pool.submit(_decode_documents, model, trusted, documents).result()
 
 
 class ABRepositoryMeta(ABCMeta):
@@ -24,8 +138,11 @@ class ABRepositoryMeta(ABCMeta):
 
     This Metaclass ensures that any concrete implementations of BaseRepository
     include all necessary definitions, in order to decrease user errors.
+    It also keeps track of all concrete repositories.
     """
 
+    _registry: "weakref.WeakSet[ABRepositoryMeta]" = weakref.WeakSet()
+
     def __new__(cls, name: str, bases: Tuple[type, ...], namespace: Dict[str, Any], **kwds: Any):
         base_repo = super().__new__(cls, name, bases, namespace, **kwds)
         meta = base_repo.__dict__.get("Meta", False)
@@ -35,8 +152,17 @@ class ABRepositoryMeta(ABCMeta):
         if not (meta.__dict__.get("model", False) and meta.__dict__.get("collection", False)):
             raise NotImplementedError("'model' or 'collection' properties are missing from internal Meta class")
 
+        model = meta.__dict__["model"]
+        if isinstance(model, type) and issubclass(model, MongoDBModel):
+            ABRepositoryMeta._registry.add(base_repo)
+
         return base_repo
 
+    @classmethod
+    def repositories(mcs) -> List["ABRepositoryMeta"]:
+        """Concrete repositories defined so far"""
+        return list(mcs._registry)
+
 
 class BaseRepository(metaclass=ABRepositoryMeta):
     class Meta:
@@ -62,61 +188,101 @@ class BaseRepository(metaclass=ABRepositoryMeta):
         return data
 
     @classmethod
-    def save_many_to_db(cls, data) -> Type[List]:
-        data_final = list()
-        for each in data:
-            data_final.append(cls.Meta.model(**each))
-        data = cls.save_many(data_final)
-        return data
+    def save_many_to_db(cls, data, **kwargs):
+        return cls.save_many((cls.Meta.model(**each) for each in data), **kwargs)
+
+    @classmethod
+    def _route(cls) -> Tuple[str, Optional[_ServerMode]]:
+        """Connection alias and read preference of the repository, see `Meta.connection` and `use_connection`"""
+        return route(
+            cls, getattr(cls.Meta, "connection", DEFAULT_CONNECTION), getattr(cls.Meta, "read_preference", None)
+        )
+
+    @classmethod
+    def _collection_handles(cls) -> Dict[str, Tuple[Database, Collection, Dict[str, Collection]]]:
+        """Collection handles of the repository by connection alias, with their read preference variants"""
+        handles = cls.__dict__.get("_handles")
+        if handles is None:
+            handles = cls._handles = {}
+        return handles
 
     @classmethod
     def _get_collection(cls) -> Collection:
-        """Returns a reference to the MongoDB collection, and initializes indexes if first time"""
-        if not hasattr(cls, "_indexes") or cls._indexes is None:
-            cls._indexes = True  # State to know that already checked
+        """Returns a reference to the MongoDB collection, and initializes indexes if first time.
 
+        The collection is read from the connection named by `Meta.connection` (the default connection
+        otherwise), with the read preference of `Meta.read_preference`, both overridable with `use_connection`.
+        Collection handles are cached per repository and connection.
+        """
+        alias, read_preference = cls._route()
+        db = get_connection(alias).db
+        handles = cls._collection_handles()
+        cached = handles.get(alias)
+        if cached is None or cached[0] is not db:
+            cached = handles[alias] = (db, db[cls.Meta.collection], {})
             if getattr(cls.Meta, "auto_create_index", True):
-                cls._create_indexes()
+                try:
+                    cls._create_indexes(cached[1])
+                except Exception:
+                    # Retry on next use
+                    handles.pop(alias, None)
+                    raise
 
-        return MongomanticClient.db.__getattr__(cls.Meta.collection)
+        if read_preference is None:
+            return cached[1]
+        # Read preferences are not hashable, their repr covers mode, tag sets and max staleness
+        key = repr(read_preference)
+        collection = cached[2].get(key)
+        if collection is None:
+            collection = cached[2][key] = cached[1].with_options(read_preference=read_preference)
+        return collection
 
     @classmethod
-    def _create_indexes(cls):
+    def _create_indexes(cls, collection: Optional[Collection] = None):
+        """Creates the declared indexes missing from the collection, leaving conflicting ones in place"""
         indexes: List[Index] = getattr(cls.Meta, "indexes", False)
         if indexes:
-            try:
-                existing_indexes = cls._get_collection().index_information()
-                pymongo_indexes = []
-                for index in indexes:
-                    index_py = index.to_pymongo(existing_indexes)
-                    if index_py:
-                        pymongo_indexes.append(index_py)
-                if len(pymongo_indexes) == 0:
-                    # print("No indexes to create.", cls.Meta.collection)
-                    return
-                cls._get_collection().create_indexes(pymongo_indexes)
-            except Exception as e:
-                message = str(e)
-                raise IndexCreationError(f"Error creating index: {message}")
+            collection = collection if collection is not None else cls._get_collection()
+            report = sync_collection_indexes(collection, indexes)
+            if report.conflicting:
+                logger.warning(
+                    f"Indexes {', '.join(report.conflicting)} of {report.collection} conflict with the indexes"
+                    f" declared by {cls.__name__}, use ensure_indexes(drop=True) to replace them"
+                )
 
     @classmethod
-    def _process_kwargs(cls, kwargs: Dict) -> Tuple:
-        """Update keyword arguments from human readable to mongo specific"""
-        if "id" in kwargs:
-            try:
-                oid = str(kwargs.pop("id"))
-                oid = ObjectId(oid)
-                kwargs["_id"] = oid
-            except InvalidId:
-                raise InvalidQueryError(f"Invalid ObjectId {oid}.")
+    def sync_indexes(cls, drop: bool = False) -> IndexReport:
+        """Syncs the indexes of the collection with `Meta.indexes`, see `ensure_indexes`"""
+        return sync_collection_indexes(cls._get_collection(), getattr(cls.Meta, "indexes", None) or [], drop=drop)
 
+    @classmethod
+    def _process_kwargs(cls, kwargs: Dict, queries: Iterable[Q] = (), lookups: bool = True) -> Tuple:
+        """Update keyword arguments from human readable to mongo specific
+
+        Filter keyword arguments (`field=value` or `field__operator=value` lookups) and Q expressions are
+        compiled in place into a MongoDB filter document. With `lookups=False`, as for update documents,
+        only field names are checked and `id` is converted.
+        """
         projection = kwargs.pop("projection", None)
         skip = kwargs.pop("skip", 0)
         limit = kwargs.pop("limit", 0)
 
-        for key in kwargs:
-            if key != "_id" and key not in cls.Meta.model.__fields__:
-                raise FieldDoesNotExistError(f"Field {key} does not exist for model {cls.Meta.model}")
+        if not lookups:
+            cls._process_ID(kwargs)
+            for key in kwargs:
+                if key != "_id" and key not in cls.Meta.model.__fields__:
+                    raise FieldDoesNotExistError(f"Field {key} does not exist for model {cls.Meta.model}")
+            return projection, skip, limit
+
+        parts = [compile_lookups(cls.Meta.model, kwargs)] if kwargs else []
+        parts.extend(query.compile(cls.Meta.model) for query in queries)
+        parts = [part for part in parts if part]
+
+        kwargs.clear()
+        if len(parts) == 1:
+            kwargs.update(parts[0])
+        elif parts:
+            kwargs["$and"] = parts
 
         return projection, skip, limit
 
@@ -132,12 +298,32 @@ class BaseRepository(metaclass=ABRepositoryMeta):
                 raise InvalidQueryError(f"Invalid ObjectId {oid}.")
         return data
 
+    @classmethod
+    def _is_trusted(cls, trusted: Optional[bool] = None) -> bool:
+        """Resolves a per-call `trusted` override against the `Meta.trusted_reads` default.
+
+        Trusted reads build models without pydantic validation, which is only safe for collections
+        exclusively written through this repository.
+        """
+        if trusted is None:
+            return getattr(cls.Meta, "trusted_reads", False)
+        return trusted
+
     @classmethod
     def save(cls, model) -> Type[MongoDBModel]:
-        """Saves object in MongoDB"""
+        """Saves object in MongoDB
+
+        Models loaded from the database (with an id) are saved with a `$set`/`$unset` of their changed fields
+        only, and nothing is sent if no field changed. Other models are inserted.
+        """
+        changed = model.get_changed_fields()
+        if changed is not None and model.id is not None:
+            return cls._save_changes(model, changed)
+
         try:
             document = model.to_mongo()
-            res = cls._get_collection().insert_one(document)
+            with measure(cls, "save", {}):
+                res = cls._get_collection().insert_one(document)
         except Exception as e:
             raise WriteError(f"Error inserting document: \n{e}")
 
@@ -145,41 +331,149 @@ class BaseRepository(metaclass=ABRepositoryMeta):
         return cls.Meta.model.from_mongo(document)
 
     @classmethod
-    def save_many(cls, models) -> Type[List]:
-        """Saves object in MongoDB"""
-        result = list()
+    def _save_changes(cls, model: MongoDBModel, changed) -> MongoDBModel:
+        changed.discard("id")
+        if not changed:
+            return model
+
+        document = model.to_mongo(include=changed)
+        update = {}
+        # None is stored as null, unsetting the field would load its default back
+        if document:
+            update["$set"] = document
+        fields = model.__fields__
+        unset_fields = {
+            fields[name].alias: "" for name in changed if name in fields and fields[name].alias not in document
+        }
+        if unset_fields:
+            update["$unset"] = unset_fields
+
         try:
-            document = list()
-            for each in models:
-                document.append(each.to_mongo())
-            res = cls._get_collection().insert_many(document)
-            for each in document:
-                result.append(cls.Meta.model.from_mongo(each))
+            with measure(cls, "save", {"_id": model.id}):
+                res = cls._get_collection().update_one({"_id": model.id}, update)
         except Exception as e:
-            raise WriteError(f"Error inserting document: \n{e}")
+            raise WriteError(f"Error updating document: \n{e}")
+        cls._invalidate_cache({"_id": model.id})
+        if res.matched_count == 0:
+            raise WriteError(f"Error updating document: document {model.id} does not exist")
+
+        model.track_changes()
+        return model
+
+    @classmethod
+    def save_many(
+        cls, models: Iterable[MongoDBModel], chunk_size: int = SAVE_MANY_CHUNK_SIZE, returning: str = "models"
+    ) -> Union[List[MongoDBModel], List[ObjectId], int]:
+        """Saves models in MongoDB, inserting them in unordered chunks.
 
+        Models are consumed lazily, so any iterable or generator can be passed and at most one chunk of
+        documents is held in memory (plus the returned models, if requested).
+
+        Args:
+            models: Iterable of models to save
+            chunk_size: Number of documents sent per insert_many call
+            returning: "models" for a list of saved models, "ids" for a list of inserted ids,
+                       "count" for the number of inserted documents
+
+        Raises:
+            PartialWriteError: If some documents could not be inserted, e.g. because of duplicate keys.
+                               All other documents are still inserted.
+            WriteError: If inserting failed altogether
+
+        Returns:
+            Union[List[MongoDBModel], List[ObjectId], int]: Depending on `returning`
+        """
+        if returning not in ("models", "ids", "count"):
+            raise ValueError(f"Invalid returning value {returning}, expected 'models', 'ids' or 'count'")
+
+        result: List[Any] = []
+        count = 0
+        errors: List[Dict] = []
+        offset = 0
+        models = iter(models)
+        collection = cls._get_collection()
+
+        while True:
+            documents = [model.to_mongo() for model in islice(models, chunk_size)]
+            if not documents:
+                break
+
+            failed = set()
+            try:
+                with measure(cls, "save_many", {}):
+                    collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    failed.add(error["index"])
+                    errors.append(dict(error, index=error["index"] + offset))
+            except Exception as e:
+                raise WriteError(f"Error inserting document: \n{e}")
+
+            for i, document in enumerate(documents):
+                if i in failed:
+                    continue
+                count += 1
+                if returning == "models":
+                    result.append(cls.Meta.model.from_mongo(document))
+                elif returning == "ids":
+                    result.append(document["_id"])
+            offset += len(documents)
+
+        if returning == "count":
+            result = count
+        if errors:
+            raise PartialWriteError(f"{len(errors)} of {offset} documents could not be inserted", errors, result)
         return result
 
+    @classmethod
+    def bulk(cls) -> BulkOperations:
+        """Returns a builder collecting bulk inserts, updates, upserts and deletes for this repository"""
+        return BulkOperations(cls)
+
+    @classmethod
+    def writer(
+        cls,
+        batch_size: int = 500,
+        max_age: float = 1.0,
+        max_pending: int = 10000,
+        on_error: Optional[ErrorCallback] = None,
+    ) -> BatchWriter:
+        """Returns a write-behind writer buffering saves and upserts, flushed in batches from a background thread.
+
+        See BatchWriter for the flush, backpressure and error reporting rules.
+        """
+        return BatchWriter(cls, batch_size=batch_size, max_age=max_age, max_pending=max_pending, on_error=on_error)
+
     @classmethod
     def update_one(cls, filter_query, update) -> bool:
         """Saves object in MongoDB"""
         try:
             cls._process_kwargs(filter_query)
-            cls._process_kwargs(update)
+            cls._process_kwargs(update, lookups=False)
             filter_query = cls._process_ID(filter_query)
             update = {"$set": update}
-            res = cls._get_collection().update_one(filter_query, update)
+            record_query(cls, "update_one", filter_query)
+            with measure(cls, "update_one", filter_query):
+                res = cls._get_collection().update_one(filter_query, update)
+            cls._invalidate_cache(filter_query)
             return True
         except Exception as e:
             raise WriteError(f"Error updating document: \n{e}")
         return False
 
     @classmethod
-    def get(cls, **kwargs) -> Type[MongoDBModel]:
+    def get(cls, *queries: Q, **kwargs) -> Type[MongoDBModel]:
         """Get a unique document based on some filter.
 
         Args:
-            kwargs: Filter keyword arguments
+            queries: Q expressions, combined with the filter keyword arguments
+            kwargs: Filter keyword arguments, `field=value` or `field__operator=value` (see query.OPERATORS)
+
+            Reserved *optional* field names:
+            trusted: build the model without validation, overrides `Meta.trusted_reads`
+            cache: set to False to bypass the repository cache (see `Meta.cache_size`)
+            lazy: read the document as raw BSON and decode each field on first access (see `lazy.from_raw`).
+                  Lazy models are not stored in the cache.
 
         Raises:
             DoesNotExistError: If object not found
@@ -188,34 +482,189 @@ class BaseRepository(metaclass=ABRepositoryMeta):
         Returns:
             Type[MongoDBModel]: Matching model
         """
-        cls._process_kwargs(kwargs)
+        trusted = cls._is_trusted(kwargs.pop("trusted", None))
+        use_cache = kwargs.pop("cache", True)
+        lazy = kwargs.pop("lazy", False)
+        cls._process_kwargs(kwargs, queries)
 
-        try:
-            res = cls._get_collection().find(filter=kwargs, limit=2)
-            document = next(res)
-        except StopIteration:
-            raise DoesNotExistError("Document not found")
+        by_id = list(kwargs) == ["_id"] and isinstance(kwargs["_id"], ObjectId)
+        cache = cls._get_cache() if use_cache and by_id else None
+        if cache is not None:
+            model = cache.get(cls._cache_key(kwargs["_id"]))
+            if model is not None:
+                return _cache_copy(model)
 
-        try:
-            next(res)
-            raise MultipleObjectsReturnedError("2 or more items returned, instead of 1")
-        except StopIteration:
-            return cls.Meta.model.from_mongo(document)
+        record_query(cls, "get", kwargs)
+        collection = raw_collection(cls._get_collection()) if lazy else cls._get_collection()
+        decode = partial(from_raw, cls.Meta.model) if lazy else cls.Meta.model.from_mongo
+        with measure(cls, "get", kwargs) as measurement:
+            res = collection.find(filter=kwargs, limit=2)
+            if measurement is not None:
+                res = measurement.iterate(res)
+                decode = measurement.timed(decode)
+            try:
+                document = next(res)
+            except StopIteration:
+                raise DoesNotExistError("Document not found")
+
+            try:
+                next(res)
+                raise MultipleObjectsReturnedError("2 or more items returned, instead of 1")
+            except StopIteration:
+                model = decode(document, trusted=trusted)
+        # Lazy models are not cached
+        if cache is not None and not lazy:
+            cache.set(cls._cache_key(model.id), _cache_copy(model))
+        return model
+
+    @classmethod
+    def get_many(
+        cls, ids: Iterable[Any], trusted: Optional[bool] = None, raise_missing: bool = False
+    ) -> List[Optional[MongoDBModel]]:
+        """Gets documents by id with a single `$in` query.
+
+        Args:
+            ids: Ids to fetch, as ObjectIds or strings. Duplicates are allowed.
+            trusted: Build models without validation, overrides `Meta.trusted_reads`
+            raise_missing: Raise instead of returning None for ids that do not exist
+
+        Raises:
+            InvalidQueryError: If an id is not a valid ObjectId
+            DoesNotExistError: If `raise_missing` is set and some ids do not exist
+
+        Returns:
+            List[Optional[MongoDBModel]]: Models in the order of `ids`, None for missing ids
+        """
+        trusted = cls._is_trusted(trusted)
+        oids = [cls._process_ID({"id": id})["_id"] for id in ids]
+
+        found: Dict[ObjectId, MongoDBModel] = {}
+        cache = cls._get_cache()
+        if cache is not None:
+            for oid in oids:
+                model = cache.get(cls._cache_key(oid))
+                if model is not None:
+                    found[oid] = model
+        # Cached instances are copied before being returned
+        seen = set(found)
+
+        query = list({oid: None for oid in oids if oid not in found})
+        if query:
+            decode = cls.Meta.model.from_mongo
+            try:
+                with measure(cls, "get_many", {"_id": {"$in": query}}) as measurement:
+                    documents = cls._get_collection().find(filter={"_id": {"$in": query}})
+                    if measurement is not None:
+                        documents = measurement.iterate(documents)
+                        decode = measurement.timed(decode)
+                    models = [decode(document, trusted=trusted) for document in documents]
+                for model in models:
+                    found[model.id] = model
+                    if cache is not None:
+                        cache.set(cls._cache_key(model.id), _cache_copy(model))
+            except Exception as e:
+                raise InvalidQueryError(f"Error executing pipeline: {e}")
+
+        missing = [oid for oid in oids if oid not in found]
+        if missing and raise_missing:
+            raise DoesNotExistError(f"Documents not found: {', '.join(str(oid) for oid in missing)}")
+
+        # Every position gets its own instance, the same id may be requested more than once
+        result = []
+        for oid in oids:
+            model = found.get(oid)
+            if model is not None and oid in seen:
+                model = _cache_copy(model)
+            seen.add(oid)
+            result.append(model)
+        return result
+
+    @classmethod
+    def loader(cls, trusted: Optional[bool] = None) -> DataLoader:
+        """Returns a new DataLoader batching `get(id=...)` lookups on this repository, meant to live for one request"""
+        return DataLoader(cls, trusted=trusted)
+
+    @classmethod
+    def _get_cache(cls) -> Optional[ModelCache]:
+        """Returns the model cache of this repository, None if `Meta.cache_size` is not set.
+
+        The cache stores models fetched by `get(id=...)`, keyed by connection alias and id, in an LRU bounded by
+        `Meta.cache_size` entries, expiring after `Meta.cache_ttl` seconds if set. Writes made through the
+        repository invalidate it.
+        """
+        cache = cls.__dict__.get("_model_cache")
+        if cache is None:
+            size = getattr(cls.Meta, "cache_size", 0)
+            if not size:
+                return None
+            with _cache_lock:
+                cache = cls.__dict__.get("_model_cache")
+                if cache is None:
+                    cache = ModelCache(size, ttl=getattr(cls.Meta, "cache_ttl", None))
+                    cls._model_cache = cache
+        return cache
+
+    @classmethod
+    def _invalidate_cache(cls, filter_query: Optional[Dict] = None) -> None:
+        """Drops the cached model matching a filter on `_id`, or the whole cache for any other filter"""
+        cache = cls._get_cache()
+        if cache is None:
+            return
+        oid = (filter_query or {}).get("_id")
+        if isinstance(oid, ObjectId):
+            cache.invalidate(cls._cache_key(oid))
+        else:
+            cache.clear()
+
+    @classmethod
+    def _cache_key(cls, oid: ObjectId) -> Tuple[str, ObjectId]:
+        """Cache key of a document, the same id may belong to other documents on other connections"""
+        return cls._route()[0], oid
 
     @classmethod
-    def find(cls, **kwargs) -> Iterator[Type[MongoDBModel]]:
+    def cache_clear(cls) -> None:
+        """Empties the model cache of this repository"""
+        cache = cls._get_cache()
+        if cache is not None:
+            cache.clear()
+
+    @classmethod
+    def cache_stats(cls) -> Optional[CacheStats]:
+        """Hit, miss and eviction counters of the model cache, None if caching is disabled"""
+        cache = cls._get_cache()
+        return cache.stats() if cache is not None else None
+
+    @classmethod
+    def find(cls, *queries: Q, **kwargs) -> Iterator[Type[MongoDBModel]]:
         """Queries database and filters on kwargs provided.
 
         Args:
-            kwargs: Filter keyword arguments
+            queries: Q expressions, combined with the filter keyword arguments
+            kwargs: Filter keyword arguments, `field=value` or `field__operator=value` (see query.OPERATORS)
 
             Reserved *optional* field names:
             projection: can either be a list of field names that should be returned in the result set
                         or a dict specifying the fields to include or exclude. If projection is a list
                         “_id” will always be returned. Use a dict to exclude fields from the result
-                        (e.g. projection={‘_id’: False}).
+                        (e.g. projection={‘_id’: False}). Projected documents are decoded into a partial
+                        model class that only has the projected fields.
             skip: the number of documents to omit when returning results
             limit: the maximum number of results to return
+            sort: field name or list of field names to sort on, prefixed with '-' for descending order
+                  (e.g. sort=["-age", "first_name"])
+            trusted: build models without validation, overrides `Meta.trusted_reads`
+            raw: yield the raw MongoDB documents instead of models
+            values_list: list of field names, yields a tuple of their values per document instead of models.
+                         Only these fields are requested from the server.
+            flat: with a single field in `values_list`, yields the value itself instead of a 1-tuple
+            prefetch: list of Reference field paths (e.g. "customer" or "items.product") to load once the
+                      cursor is exhausted, with one `$in` query per path. The referenced models are set
+                      as the `document` of each Reference.
+            lazy: read documents as raw BSON and yield models decoding each field on first access
+                  (see `lazy.from_raw`), for large documents of which only a few fields are read
+            batch_size: number of documents per batch returned by the server
+            read_ahead: number of batches fetched ahead by a background thread while documents are decoded
+                        and consumed, so that network reads overlap with decoding. Disabled if 0.
 
         Note that invalid query errors may not be detected until the generator is consumed.
         This is because the query is not executed until the result is needed.
@@ -226,96 +675,728 @@ class BaseRepository(metaclass=ABRepositoryMeta):
         Yields:
             Iterator[Type[MongoDBModel]]: Generator that wraps PyMongo cursor and transforms documents to models
         """
-        projection, skip, limit = cls._process_kwargs(kwargs)
+        trusted = cls._is_trusted(kwargs.pop("trusted", None))
+        raw = kwargs.pop("raw", False)
+        values_list = kwargs.pop("values_list", None)
+        flat = kwargs.pop("flat", False)
+        prefetch = kwargs.pop("prefetch", None)
+        lazy = kwargs.pop("lazy", False)
+        batch_size = kwargs.pop("batch_size", 0)
+        depth = kwargs.pop("read_ahead", 0)
+        sort = cls._process_sort(kwargs.pop("sort", None))
+        projection, skip, limit = cls._process_kwargs(kwargs, queries)
+
+        if lazy and (raw or values_list is not None):
+            raise InvalidQueryError("lazy can only be used when returning models")
+
+        if prefetch:
+            if raw or values_list is not None:
+                raise InvalidQueryError("prefetch can only be used when returning models")
+            prefetch = [(path, _reference_type(cls.Meta.model, path)) for path in prefetch]
+
+        if values_list is not None:
+            keys = cls._field_keys(values_list)
+            projection = cls._keys_projection(keys)
+            if flat:
+                if len(keys) != 1:
+                    raise InvalidQueryError("flat requires exactly one field in values_list")
+                transform = _itemgetter_or_none(keys[0])
+            else:
+                transform = _tuplegetter_or_none(keys)
+        elif raw:
+            transform = None
+        elif lazy:
+            transform = partial(from_raw, cls._projected_model(projection), trusted=trusted)
+        else:
+            transform = partial(cls._projected_model(projection).from_mongo, trusted=trusted)
+
+        record_query(cls, "find", kwargs, sort)
+        collection = raw_collection(cls._get_collection()) if lazy else cls._get_collection()
+        with measure(cls, "find", kwargs, sort) as measurement:
+            try:
+                results = collection.find(
+                    filter=kwargs, projection=projection, skip=skip, limit=limit, sort=sort, batch_size=batch_size
+                )
+                if measurement is not None:
+                    results = measurement.iterate(results)
+                    transform = measurement.timed(transform)
+                if depth:
+                    results = read_ahead(results, depth, batch_size or READ_AHEAD_BATCH_SIZE)
+                if prefetch:
+                    models = [transform(result) for result in results]
+                    cls._prefetch(models, prefetch)
+                    yield from models
+                elif transform is None:
+                    yield from results
+                else:
+                    for result in results:
+                        yield transform(result)
+            except Exception as e:
+                raise InvalidQueryError(f"Invalid argument types: {e}")
+
+    @classmethod
+    def parallel_find(
+        cls,
+        *queries: Q,
+        partitions: int = 4,
+        partition_key: str = "_id",
+        workers: Optional[int] = None,
+        processes: int = 0,
+        ordered: bool = True,
+        queue_size: int = 16,
+        chunk_size: int = 500,
+        **kwargs,
+    ) -> Iterator[Any]:
+        """Scans the documents matching the filter with several cursors read in parallel, for batch jobs.
+
+        The documents are split into `partitions` ranges of `partition_key`, which should be indexed, and each
+        range is read on its own cursor (and connection) in a thread pool. Results are passed through bounded
+        queues, so memory stays flat whatever the size of the collection.
+
+        Args:
+            queries: Q expressions, combined with the filter keyword arguments
+            partitions: Number of ranges to split the documents into
+            partition_key: Field the ranges are taken on
+            workers: Number of reading threads, defaults to one per partition
+            processes: Number of processes decoding models, decoding happens in the reading threads if 0.
+                       The model must be importable by the worker processes.
+            ordered: Yield results in `partition_key` order, otherwise in the order they are read
+            queue_size: Number of chunks buffered per queue
+            chunk_size: Number of documents read and decoded together
+            kwargs: Filter keyword arguments, and `projection`, `trusted` and `raw` as in `find`
+
+        Raises:
+            InvalidQueryError: In case one or more arguments were invalid, or a cursor failed
+
+        Yields:
+            Iterator[Any]: Models, or raw documents with `raw`
+        """
+        trusted = cls._is_trusted(kwargs.pop("trusted", None))
+        raw = kwargs.pop("raw", False)
+        projection, skip, limit = cls._process_kwargs(kwargs, queries)
+        if skip or limit:
+            raise InvalidQueryError("skip and limit are not supported by parallel_find")
+        key = cls._process_sort(partition_key)[0][0]
+        model = cls._projected_model(projection)
+        if processes and model is not cls.Meta.model:
+            raise InvalidQueryError("processes cannot decode partial models, use raw or drop the projection")
+
+        pool = ProcessPoolExecutor(max_workers=processes) if processes and not raw else None
+        if raw:
+            transform = None
+        elif pool is not None:
+            transform = partial(_decode_in_pool, pool, model, trusted)
+        else:
+            transform = partial(_decode_documents, model, trusted)
 
+        sort = [(key, ASCENDING)] if ordered else None
+        with measure(cls, "parallel_find", kwargs, sort) as measurement:
+            try:
+                collection = cls._get_collection()
+                bounds = partition_bounds(collection, kwargs, key, partitions)
+                results = parallel_scan(
+                    collection,
+                    range_filters(kwargs, key, bounds),
+                    projection=projection,
+                    sort=sort,
+                    transform=transform,
+                    workers=workers,
+                    ordered=ordered,
+                    queue_size=queue_size,
+                    chunk_size=chunk_size,
+                )
+                # Reading and decoding happen in the workers, the time spent waiting for them counts as server time
+                if measurement is not None:
+                    results = measurement.iterate(results)
+                yield from results
+            except Exception as e:
+                raise InvalidQueryError(f"Error executing parallel scan: {e}")
+            finally:
+                if pool is not None:
+                    pool.shutdown(wait=True)
+
+    @classmethod
+    def find_columns(
+        cls, *queries: Q, columns: Optional[List[str]] = None, batch_size: int = COLUMNS_BATCH_SIZE, **kwargs
+    ) -> Dict[str, Any]:
+        """Reads the documents matching the filter into a NumPy array per field, without building models.
+
+        Only the requested columns are fetched, and the cursor is read in batches of `batch_size` documents,
+        as RawBSONDocuments which only decode the values that are read. Arrays are typed from the field
+        declarations of the model, see `columnar.read_numpy`. Requires NumPy (`mongomantic[numpy]`).
+
+        Args:
+            queries: Q expressions, combined with the filter keyword arguments
+            columns: Field names to read, all fields of the model (and `id`) by default
+            batch_size: Number of documents read per batch
+            kwargs: Filter keyword arguments, and `skip`, `limit` and `sort` as in `find`
+
+        Raises:
+            InvalidQueryError: In case one or more arguments were invalid
+            FieldDoesNotExistError: If a column is not a field of the model
+
+        Returns:
+            Dict[str, numpy.ndarray]: Array of every column, keyed by field name
+        """
+        cursor, specs = cls._column_cursor(queries, columns, batch_size, kwargs)
         try:
-            results = cls._get_collection().find(filter=kwargs, projection=projection, skip=skip, limit=limit)
-            for result in results:
-                yield cls.Meta.model.from_mongo(result)
+            return read_numpy(cursor, specs, batch_size)
+        except RuntimeError:
+            raise
         except Exception as e:
             raise InvalidQueryError(f"Invalid argument types: {e}")
 
     @classmethod
-    def find_one(cls, **kwargs):
-        cls._process_kwargs(kwargs)
+    def to_arrow(
+        cls, *queries: Q, columns: Optional[List[str]] = None, batch_size: int = COLUMNS_BATCH_SIZE, **kwargs
+    ):
+        """Reads the documents matching the filter into an Arrow table, without building models.
+
+        Same as `find_columns`, see `columnar.read_arrow` for the column types. Requires PyArrow (`mongomantic[arrow]`).
+
+        Returns:
+            pyarrow.Table: Table with a column per requested field
+        """
+        cursor, specs = cls._column_cursor(queries, columns, batch_size, kwargs)
         try:
-            res = cls._get_collection().find_one(filter=kwargs)
-            return res
+            return read_arrow(cursor, specs, batch_size)
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise InvalidQueryError(f"Invalid argument types: {e}")
+
+    @classmethod
+    def _column_cursor(
+        cls, queries: Tuple[Q, ...], columns: Optional[List[str]], batch_size: int, kwargs: Dict
+    ) -> Tuple[Any, List[Column]]:
+        """Raw cursor over the keys of the requested columns, and the columns"""
+        if columns is None:
+            columns = list(cls.Meta.model.__fields__)
+        keys = cls._field_keys(columns)
+        sort = cls._process_sort(kwargs.pop("sort", None))
+        _, skip, limit = cls._process_kwargs(kwargs, queries)
+
+        record_query(cls, "find_columns", kwargs, sort)
+        collection = raw_collection(cls._get_collection())
+        cursor = collection.find(
+            filter=kwargs,
+            projection=cls._keys_projection(keys),
+            skip=skip,
+            limit=limit,
+            sort=sort,
+            batch_size=batch_size,
+        )
+        return cursor, model_columns(cls.Meta.model, columns, keys)
+
+    @classmethod
+    def _process_sort(cls, sort) -> Optional[List[Tuple[str, int]]]:
+        """Maps sort field names, optionally prefixed with '+' or '-', to a pymongo sort specification"""
+        if not sort:
+            return None
+        if isinstance(sort, str):
+            sort = [sort]
+
+        spec = []
+        for field in sort:
+            if isinstance(field, tuple):
+                field, direction = field
+            elif field.startswith("-"):
+                field, direction = field[1:], DESCENDING
+            else:
+                field, direction = field.lstrip("+"), ASCENDING
+            root, _, rest = field.partition(".")
+            key = cls._field_keys([root])[0]
+            spec.append((f"{key}.{rest}" if rest else key, direction))
+        return spec
+
+    @classmethod
+    def paginate(
+        cls, *queries: Q, sort: str = "_id", limit: int = 20, after: Optional[str] = None, **kwargs
+    ) -> Page:
+        """Keyset (cursor based) pagination over the documents matching the filter keyword arguments.
+
+        Documents are ordered on `sort`, with `_id` as tiebreaker, and each page continues after the last
+        document of the previous one, so every page costs the same whatever its depth. Declare an index on
+        the sort field (e.g. `Index(fields=["-created", "-_id"])`) in `Meta.indexes` so that pages are read
+        from the index.
+
+        Args:
+            queries: Q expressions, combined with the filter keyword arguments
+            sort: Field to sort on, prefixed with '-' for descending order
+            limit: Maximum number of models per page
+            after: `next_token` of the previous page, None for the first page
+            kwargs: Filter keyword arguments, `trusted` is also accepted
+
+        Raises:
+            InvalidQueryError: If the arguments or the token are invalid
+
+        Returns:
+            Page: Models of the page, and the token of the next page
+        """
+        if limit <= 0:
+            raise InvalidQueryError("limit must be positive")
+        trusted = cls._is_trusted(kwargs.pop("trusted", None))
+        spec = cls._process_sort(sort)
+        if not spec or len(spec) != 1:
+            raise InvalidQueryError("paginate sorts on a single field")
+        key, direction = spec[0]
+        cls._process_kwargs(kwargs, queries)
+
+        filter_query = kwargs
+        if after is not None:
+            value, last_id = decode_token(after, key, direction)
+            keyset = keyset_filter(key, direction, value, last_id)
+            filter_query = {"$and": [kwargs, keyset]} if kwargs else keyset
+
+        order = [(key, direction)] if key == "_id" else [(key, direction), ("_id", direction)]
+        record_query(cls, "paginate", filter_query, order)
+        decode = cls.Meta.model.from_mongo
+        with measure(cls, "paginate", filter_query, order) as measurement:
+            try:
+                documents = cls._get_collection().find(filter=filter_query, sort=order, limit=limit + 1)
+                if measurement is not None:
+                    documents = measurement.iterate(documents)
+                    decode = measurement.timed(decode)
+                documents = list(documents)
+            except Exception as e:
+                raise InvalidQueryError(f"Invalid argument types: {e}")
+
+            next_token = None
+            if len(documents) > limit:
+                documents = documents[:limit]
+                last = documents[-1]
+                next_token = encode_token(key, direction, _get_path(last, key), last["_id"])
+
+            items = [decode(document, trusted=trusted) for document in documents]
+        return Page(items=items, next_token=next_token)
+
+    @classmethod
+    def _prefetch(cls, models: List[MongoDBModel], paths: List[Tuple[str, Type[Reference]]]) -> None:
+        """Loads the documents referenced by `models` at each path, with one query per path"""
+        for path, reference_type in paths:
+            references = _collect_path(models, path.split("."))
+            if not references:
+                continue
+            repository = cls._reference_repository(path, reference_type.model)
+            ids = list({reference: None for reference in references})
+            loaded = dict(zip(ids, repository.get_many(ids)))
+            for reference in references:
+                reference.document = loaded[reference]
+
+    @classmethod
+    def _reference_repository(cls, path: str, model: Type[MongoDBModel]) -> Type["BaseRepository"]:
+        """Repository storing the referenced model, from `Meta.references` or the repositories of that model"""
+        repository = getattr(cls.Meta, "references", {}).get(path)
+        if repository is not None:
+            return repository
+
+        candidates = {
+            repo.Meta.collection: repo for repo in ABRepositoryMeta.repositories() if repo.Meta.model is model
+        }
+        if len(candidates) != 1:
+            raise InvalidQueryError(
+                f"Cannot choose a repository for {model.__name__} references at {path}, "
+                f"set it in Meta.references of {cls.__name__}"
+            )
+        return next(iter(candidates.values()))
+
+    @classmethod
+    def _field_keys(cls, fields: List[str]) -> List[str]:
+        """Maps model field names to the keys they are stored under in MongoDB"""
+        keys = []
+        for field in fields:
+            if field in ("id", "_id"):
+                keys.append("_id")
+            elif field in cls.Meta.model.__fields__:
+                keys.append(cls.Meta.model.__fields__[field].alias)
+            else:
+                raise FieldDoesNotExistError(f"Field {field} does not exist for model {cls.Meta.model}")
+        return keys
+
+    @classmethod
+    def _projected_model(cls, projection) -> Type[MongoDBModel]:
+        """Model class to decode documents returned with the given projection"""
+        model = cls.Meta.model
+        if not projection:
+            return model
+
+        aliases = {field.alias: name for name, field in model.__fields__.items()}
+        if isinstance(projection, dict):
+            included = {key for key, value in projection.items() if value and key != "_id"}
+            if not included and projection.get("_id"):
+                # Inclusion of the id only
+                return model.partial(set())
+            if not included:
+                excluded = {aliases.get(key.split(".")[0]) for key in projection if key != "_id"}
+                return model.partial(set(model.__fields__) - excluded)
+        else:
+            included = set(projection)
+
+        # Embedded paths narrow the embedded models to the projected fields
+        fields = set()
+        for key in included:
+            alias, dot, rest = key.partition(".")
+            fields.add(aliases.get(alias, alias) + dot + rest)
+        return model.partial(fields)
+
+    @staticmethod
+    def _keys_projection(keys: List[str]) -> Dict[str, int]:
+        """Inclusion projection for the given keys, excluding _id unless requested"""
+        projection = {key: 1 for key in keys}
+        if "_id" not in projection:
+            projection["_id"] = 0
+        return projection
+
+    @classmethod
+    def find_with_total(cls, *queries: Q, **kwargs) -> Tuple[List[MongoDBModel], int]:
+        """Page of models and total number of matching documents, in a single round trip.
+
+        Runs one aggregation with a `$match` on the filter and a `$facet` computing both the page and the
+        count. Falls back to `count` and `find` on servers (or mocks) that do not support `$facet`.
+
+        Args:
+            queries: Q expressions, combined with the filter keyword arguments
+            kwargs: Filter keyword arguments. `projection`, `skip`, `limit`, `sort` and `trusted` are accepted
+                    as in `find`.
+
+        Raises:
+            InvalidQueryError: In case one or more arguments were invalid
+
+        Returns:
+            Tuple[List[MongoDBModel], int]: Models of the page, and total number of matching documents
+        """
+        options = {key: kwargs.pop(key) for key in ("projection", "skip", "limit", "sort") if key in kwargs}
+        trusted = cls._is_trusted(kwargs.pop("trusted", None))
+        sort = cls._process_sort(options.get("sort"))
+        filters = dict(kwargs)
+        cls._process_kwargs(kwargs, queries)
+
+        stages: List[Dict] = []
+        if sort:
+            stages.append({"$sort": SON(sort)})
+        if options.get("skip"):
+            stages.append({"$skip": options["skip"]})
+        if options.get("limit"):
+            stages.append({"$limit": options["limit"]})
+        projection = options.get("projection")
+        if projection:
+            if not isinstance(projection, dict):
+                projection = {key: 1 for key in projection}
+            stages.append({"$project": projection})
+        pipeline = [
+            {"$match": kwargs},
+            {"$facet": {"items": stages or [{"$skip": 0}], "total": [{"$count": "count"}]}},
+        ]
+
+        with measure(cls, "find_with_total", kwargs, sort) as measurement:
+            try:
+                result = next(cls._get_collection().aggregate(pipeline), None)
+            except (OperationFailure, NotImplementedError) as e:
+                if isinstance(e, OperationFailure) and e.code != UNRECOGNIZED_PIPELINE_STAGE:
+                    raise InvalidQueryError(f"Error executing pipeline: {e}")
+                # No $facet support, run the filter twice
+                models = list(cls.find(*queries, trusted=trusted, **options, **filters))
+                return models, cls.count(*queries, **filters)
+            except Exception as e:
+                raise InvalidQueryError(f"Error executing pipeline: {e}")
+
+            # The fallback records its find and count calls instead
+            record_query(cls, "find_with_total", kwargs, sort)
+            total = result["total"][0]["count"] if result and result["total"] else 0
+            documents = result["items"] if result else []
+            decode = cls._projected_model(options.get("projection")).from_mongo
+            if measurement is not None:
+                # Counts the bytes of the single result holding the page, and the documents of the page
+                measurement.fetched(result)
+                measurement.event.documents = len(documents)
+                decode = measurement.timed(decode)
+            models = [decode(document, trusted=trusted) for document in documents]
+        return models, total
+
+    @classmethod
+    def distinct(cls, field: str, *queries: Q, **kwargs) -> List[Any]:
+        """Distinct values of a field among the documents matching the filter keyword arguments"""
+        key = cls._field_keys([field])[0]
+        cls._process_kwargs(kwargs, queries)
+        try:
+            record_query(cls, "distinct", kwargs)
+            with measure(cls, "distinct", kwargs):
+                return cls._get_collection().distinct(key, filter=kwargs)
         except Exception as e:
             raise InvalidQueryError(f"Error executing pipeline: {e}")
 
     @classmethod
-    def aggregate(cls, pipeline: List[Dict]):
+    def exists(cls, *queries: Q, **kwargs) -> bool:
+        """Whether any document matches the filter keyword arguments. Only `_id` is read from the server."""
+        cls._process_kwargs(kwargs, queries)
         try:
-            results = cls._get_collection().aggregate(pipeline)
-            for result in results:
-                yield cls.Meta.model.from_mongo(result)
+            record_query(cls, "exists", kwargs)
+            with measure(cls, "exists", kwargs) as measurement:
+                document = cls._get_collection().find_one(filter=kwargs, projection={"_id": 1})
+                if measurement is not None:
+                    measurement.fetched(document)
+            return document is not None
         except Exception as e:
             raise InvalidQueryError(f"Error executing pipeline: {e}")
 
     @classmethod
-    def delete(cls, **kwargs):
-        cls._process_kwargs(kwargs)
+    def find_one(cls, *queries: Q, **kwargs):
+        cls._process_kwargs(kwargs, queries)
         try:
-            res = cls._get_collection().delete_one(filter=kwargs)
+            record_query(cls, "find_one", kwargs)
+            with measure(cls, "find_one", kwargs) as measurement:
+                res = cls._get_collection().find_one(filter=kwargs)
+                if measurement is not None:
+                    measurement.fetched(res)
+            return res
+        except Exception as e:
+            raise InvalidQueryError(f"Error executing pipeline: {e}")
+
+    @classmethod
+    def aggregate(
+        cls,
+        pipeline: List[Dict],
+        trusted: Optional[bool] = None,
+        output_model: Optional[Type[BaseModel]] = None,
+        raw: bool = False,
+        allow_disk_use: Optional[bool] = None,
+        batch_size: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+    ) -> Iterator[Any]:
+        """Runs an aggregation pipeline, yielding its results as they are read from the server.
+
+        Results are decoded one at a time while the cursor is consumed, the server returning them in batches
+        of `batch_size` documents, so the full result set is never held in memory.
+
+        Args:
+            pipeline: Aggregation pipeline
+            trusted: Skip validation when decoding results, see `find`
+            output_model: Pydantic model of the results, for pipelines reshaping documents (`$group`,
+                          `$project`...). Defaults to the repository model.
+            raw: Yield raw dicts instead of models
+            allow_disk_use: Allow stages to write temporary data to disk
+            batch_size: Number of documents per batch returned by the server
+            max_time_ms: Time limit of the aggregation on the server
+
+        Raises:
+            InvalidQueryError: In case the pipeline failed, or a result could not be decoded
+        """
+        trusted = cls._is_trusted(trusted)
+        options: Dict[str, Any] = {}
+        if allow_disk_use is not None:
+            options["allowDiskUse"] = allow_disk_use
+        if batch_size is not None:
+            options["batchSize"] = batch_size
+        if max_time_ms is not None:
+            options["maxTimeMS"] = max_time_ms
+
+        decode = None if raw else _result_decoder(output_model or cls.Meta.model, trusted)
+        with measure(cls, "aggregate", pipeline) as measurement:
+            try:
+                results = cls._get_collection().aggregate(pipeline, **options)
+                if measurement is not None:
+                    results = measurement.iterate(results)
+                    decode = measurement.timed(decode)
+                for result in results:
+                    yield result if decode is None else decode(result)
+            except Exception as e:
+                raise InvalidQueryError(f"Error executing pipeline: {e}")
+
+    @classmethod
+    def delete(cls, *queries: Q, **kwargs):
+        cls._process_kwargs(kwargs, queries)
+        try:
+            record_query(cls, "delete", kwargs)
+            with measure(cls, "delete", kwargs):
+                res = cls._get_collection().delete_one(filter=kwargs)
+            cls._invalidate_cache(kwargs)
             return True
         except Exception as e:
             raise InvalidQueryError(f"Error executing pipeline: {e}")
 
     @classmethod
-    def delete_many(cls, **kwargs):
-        cls._process_kwargs(kwargs)
+    def delete_many(cls, *queries: Q, **kwargs):
+        cls._process_kwargs(kwargs, queries)
         try:
-            res = cls._get_collection().delete_many(filter=kwargs)
+            record_query(cls, "delete_many", kwargs)
+            with measure(cls, "delete_many", kwargs):
+                res = cls._get_collection().delete_many(filter=kwargs)
+            cls._invalidate_cache(kwargs)
             return True
         except Exception as e:
             raise InvalidQueryError(f"Error executing pipeline: {e}")
 
     @classmethod
-    def count(cls, **kwargs):
-        cls._process_kwargs(kwargs)
+    def count(cls, *queries: Q, **kwargs):
+        cls._process_kwargs(kwargs, queries)
         try:
-            count = cls._get_collection().count_documents(filter=kwargs)
+            record_query(cls, "count", kwargs)
+            with measure(cls, "count", kwargs):
+                count = cls._get_collection().count_documents(filter=kwargs)
             return count
         except Exception as e:
             raise InvalidQueryError(f"Error executing pipeline: {e}")
 
+    @classmethod
+    def _upsert(cls, filter_query: Dict, document: Optional[Dict], update: Dict) -> Tuple[Dict, bool]:
+        """Atomically applies `update` to the document matching `filter_query`, or inserts `document`.
+
+        Runs as a single find_one_and_update round trip. When the filter does not pin `_id`, the `_id` of the
+        document to insert is generated client side, so comparing it with the returned document tells
+        whether the document was created.
+
+        Raises:
+            DoesNotExistError: If no document matches and there is no `document` to insert
+
+        Returns:
+            Tuple[Dict, bool]: Stored document, and whether it was created
+        """
+        if document is None:
+            # Not enough data to create a document, it can only be fetched or updated
+            if update:
+                stored = cls._get_collection().find_one_and_update(
+                    filter_query, {"$set": update}, return_document=ReturnDocument.AFTER
+                )
+            else:
+                stored = cls._get_collection().find_one(filter_query)
+            if stored is None:
+                raise DoesNotExistError("Document not found, and filter and defaults are not a valid model to create")
+            return stored, False
+
+        set_on_insert = {k: v for k, v in document.items() if k not in update and k != "_id"}
+        new_id = None
+        if "_id" not in filter_query:
+            new_id = set_on_insert["_id"] = ObjectId()
+
+        operations = {}
+        if update:
+            operations["$set"] = update
+        if set_on_insert:
+            operations["$setOnInsert"] = set_on_insert
+
+        if new_id is not None:
+            stored = cls._get_collection().find_one_and_update(
+                filter_query, operations, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            return stored, stored["_id"] == new_id
+
+        # _id is known in advance, the previous version of the document tells whether it existed
+        before = cls._get_collection().find_one_and_update(
+            filter_query, operations, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return {**document, "_id": filter_query["_id"]}, True
+        return {**before, **update}, False
+
+    @classmethod
+    def _upsert_document(cls, defaults: Dict, kwargs: Dict) -> Optional[Dict]:
+        """Validated MongoDB document built from filter keyword arguments and defaults, None if not a valid model"""
+        defaults.pop("id", None)
+        defaults.pop("_id", None)
+        try:
+            return cls.Meta.model.from_mongo({**kwargs, **defaults}).to_mongo()
+        except ValidationError:
+            return None
+
     @classmethod
     def get_or_create(cls, defaults=None, **kwargs):
-        defaults = defaults or {}
+        """Gets the document matching the filter keyword arguments, creating it from them and `defaults` if missing.
+
+        Runs as a single atomic round trip, so concurrent calls cannot create duplicates
+        (given a unique index on the filter fields).
+
+        Returns:
+            Tuple[MongoDBModel, bool]: Stored model, and whether it was created
+        """
+        defaults = dict(defaults or {})
         cls._process_kwargs(kwargs)
         try:
-            try:
-                return cls.get(**kwargs), False
-            except DoesNotExistError:
-                if "id" in defaults:
-                    defaults.pop("id")
-                if "_id" in defaults:
-                    defaults.pop("_id")
-                createObj = cls.Meta.model.from_mongo({**kwargs, **defaults})
-                createdDoc = cls.save(createObj)
-                return createdDoc, True
+            document = cls._upsert_document(defaults, kwargs)
+            record_query(cls, "get_or_create", kwargs)
+            with measure(cls, "get_or_create", kwargs):
+                stored, created = cls._upsert(kwargs, document, {})
+            return cls.Meta.model.from_mongo(stored, trusted=cls._is_trusted()), created
         except Exception as e:
             raise InvalidQueryError(f"Error executing pipeline: {e}")
 
     @classmethod
     def create_or_update(cls, defaults=None, **kwargs):
-        defaults = defaults or {}
+        """Sets `defaults` on the document matching the filter keyword arguments, creating it if missing.
+
+        A `created` field in `defaults` is only written when the document is created. Runs as a single
+        atomic round trip.
+
+        Returns:
+            Tuple[MongoDBModel, bool]: Stored model, and whether it was created
+        """
+        defaults = dict(defaults or {})
         cls._process_kwargs(kwargs)
         try:
-            try:
-                data = cls.get(**kwargs)
-                if "created" in defaults:
-                    defaults.pop("created")
-                cls.update_one({"_id": data.id}, {**defaults})
-                return cls.Meta.model.from_mongo({**data.dict(), **defaults, "_id": data.id}), False
-            except DoesNotExistError:
-                if "id" in defaults:
-                    defaults.pop("id")
-                if "_id" in defaults:
-                    defaults.pop("_id")
-                createObj = cls.Meta.model.from_mongo({**kwargs, **defaults})
-                createdDoc = cls.save(createObj)
-                return createdDoc, True
+            document = cls._upsert_document(defaults, kwargs)
+            values = {name: value for name, value in defaults.items() if name != "created"}
+            for name in values:
+                if name not in cls.Meta.model.__fields__:
+                    raise FieldDoesNotExistError(f"Field {name} does not exist for model {cls.Meta.model}")
+            # Validated independently of the document to insert, which may not be a valid model
+            update = cls.Meta.model.partial(set(values))(**values).to_mongo() if values else {}
+            record_query(cls, "create_or_update", kwargs)
+            with measure(cls, "create_or_update", kwargs):
+                stored, created = cls._upsert(kwargs, document, update)
+            cls._invalidate_cache({"_id": stored["_id"]})
+            return cls.Meta.model.from_mongo(stored, trusted=cls._is_trusted()), created
         except Exception as e:
             raise InvalidQueryError(f"Error executing pipeline: {e}")
+
+
+def ensure_indexes(
+    repositories: Optional[Iterable[Type[BaseRepository]]] = None, drop: bool = False, max_workers: int = 8
+) -> List[IndexReport]:
+    """Syncs the declared indexes of all repositories, concurrently, e.g. at application startup.
+
+    Indexes declared in `Meta.indexes` are compared with the existing ones on their full specification
+    (keys, uniqueness, sparseness, TTL...), and the missing ones are created. Repositories sharing a
+    collection on the same connection are synced together, and collections of repositories without
+    `Meta.indexes` are left as is. Repositories are then marked as ready, so that their first query does not
+    check indexes again.
+
+    Args:
+        repositories: Repositories to sync, all repositories defined so far by default (skipping those of
+                      connections that are not registered)
+        drop: Drop stale indexes (existing but not declared), and drop and recreate conflicting indexes
+              (same name or keys as a declared index, but other options). Otherwise they are only reported.
+        max_workers: Number of collections synced at once
+
+    Raises:
+        IndexCreationError: If syncing the indexes of a collection failed
+
+    Returns:
+        List[IndexReport]: Report of every synced collection
+    """
+    registered = None
+    if repositories is None:
+        repositories = ABRepositoryMeta.repositories()
+        registered = connections()
+    by_collection: Dict[Tuple[str, str], List[Type[BaseRepository]]] = {}
+    for repository in repositories:
+        alias = repository._route()[0]
+        if registered is not None and alias not in registered:
+            continue
+        by_collection.setdefault((alias, repository.Meta.collection), []).append(repository)
+
+    def sync(key: Tuple[str, str], repositories: List[Type[BaseRepository]]) -> Optional[IndexReport]:
+        alias, name = key
+        declared = [getattr(repository.Meta, "indexes", None) for repository in repositories]
+        if all(indexes is None for indexes in declared):
+            return None
+        db = get_connection(alias).db
+        collection = db[name]
+        report = sync_collection_indexes(collection, [index for indexes in declared for index in indexes or []], drop)
+        for repository in repositories:
+            repository._collection_handles()[alias] = (db, collection, {})
+        return report
+
+    if not by_collection:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(by_collection)))) as executor:
+        reports = list(executor.map(sync, by_collection.keys(), by_collection.values()))
+    return [report for report in reports if report is not None]
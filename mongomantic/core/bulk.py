@@ -0,0 +1,167 @@
+"""Bulk write operations, collected on a repository and sent through pymongo's bulk_write"""
+
+from typing import TYPE_CHECKING, Any, Dict, List, Type
+
+from dataclasses import dataclass, field
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .errors import FieldDoesNotExistError, InvalidQueryError, WriteError
+from .mongo_model import MongoDBModel
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .base_repository import BaseRepository
+
+__all__ = ["BulkOperations", "BulkResult"]
+
+BULK_CHUNK_SIZE = 1000
+
+
+@dataclass
+class BulkResult:
+    """Aggregated result of all chunks sent by BulkOperations.execute.
+
+    Indexes in `upserted_ids` and `errors` refer to the position of the operation in the order it was added.
+    """
+
+    inserted_count: int = 0
+    matched_count: int = 0
+    modified_count: int = 0
+    upserted_count: int = 0
+    deleted_count: int = 0
+    inserted_ids: List[ObjectId] = field(default_factory=list)
+    upserted_ids: Dict[int, Any] = field(default_factory=dict)
+    errors: List[Dict] = field(default_factory=list)
+
+
+class BulkOperations:
+    """Collects inserts, updates, upserts and deletes for a repository, and sends them in chunked bulk writes.
+
+    Filters and updates are checked and converted the same way as in the repository methods, so `id` is
+    accepted in place of `_id` and unknown fields raise FieldDoesNotExistError.
+
+    Example::
+
+        bulk = UserRepository.bulk()
+        bulk.insert(User(...))
+        bulk.update({"id": user_id}, {"age": 30})
+        bulk.upsert(User(email="john@mail.com", ...), on=["email"])
+        bulk.delete(age=12)
+        result = bulk.execute()
+    """
+
+    def __init__(self, repository: Type["BaseRepository"]):
+        self.repository = repository
+        self._operations: List[Any] = []
+        # Documents of insert operations by position, pymongo sets their generated _id
+        self._inserts: Dict[int, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    def _process_filter(self, filter_query: Dict) -> Dict:
+        filter_query = dict(filter_query)
+        self.repository._process_kwargs(filter_query)
+        return self.repository._process_ID(filter_query)
+
+    def insert(self, model: MongoDBModel) -> "BulkOperations":
+        """Adds an insert of the model, under its id if it has one"""
+        document = model.to_mongo()
+        if model.id is not None:
+            document["_id"] = model.id
+        self._inserts[len(self._operations)] = document
+        self._operations.append(InsertOne(document))
+        return self
+
+    def update(self, filter_query: Dict, update: Dict, upsert: bool = False, many: bool = False) -> "BulkOperations":
+        """Adds a `$set` of the `update` fields on the documents matching `filter_query`"""
+        filter_query = self._process_filter(filter_query)
+        update = dict(update)
+        self.repository._process_kwargs(update, lookups=False)
+        operation = UpdateMany if many else UpdateOne
+        self._operations.append(operation(filter_query, {"$set": update}, upsert=upsert))
+        return self
+
+    def upsert(self, model: MongoDBModel, on: List[str]) -> "BulkOperations":
+        """Adds an upsert of the model, matching the stored document on the values of the `on` fields"""
+        if not on:
+            raise InvalidQueryError("upsert requires at least one field to match on")
+
+        document = model.to_mongo()
+        filter_query = {}
+        for name in on:
+            if name in ("id", "_id"):
+                if model.id is None:
+                    raise InvalidQueryError("Cannot upsert on id, the model has no id")
+                filter_query["_id"] = model.id
+                continue
+            if name not in model.__fields__:
+                raise FieldDoesNotExistError(f"Field {name} does not exist for model {type(model)}")
+            alias = model.__fields__[name].alias
+            filter_query[alias] = document.pop(alias)
+
+        # The filter is built from the stored document, so it is already keyed by alias
+        self._operations.append(UpdateOne(filter_query, {"$set": document}, upsert=True))
+        return self
+
+    def delete(self, many: bool = False, **kwargs) -> "BulkOperations":
+        """Adds a delete of the documents matching the filter keyword arguments"""
+        filter_query = self._process_filter(kwargs)
+        operation = DeleteMany if many else DeleteOne
+        self._operations.append(operation(filter_query))
+        return self
+
+    def execute(self, chunk_size: int = BULK_CHUNK_SIZE) -> BulkResult:
+        """Sends all collected operations as unordered bulk writes of `chunk_size` operations.
+
+        Operation errors (e.g. duplicate keys) do not stop the other operations, they are reported in
+        `BulkResult.errors`. The collected operations are cleared once sent.
+
+        Args:
+            chunk_size: Maximum number of operations sent per bulk_write call
+
+        Raises:
+            WriteError: If a chunk could not be written at all
+
+        Returns:
+            BulkResult: Aggregated counts, ids and errors
+        """
+        operations, inserts = self._operations, self._inserts
+        self._operations, self._inserts = [], {}
+
+        result = BulkResult()
+        collection = self.repository._get_collection()
+
+        for offset in range(0, len(operations), chunk_size):
+            chunk = operations[offset : offset + chunk_size]
+            try:
+                details = collection.bulk_write(chunk, ordered=False).bulk_api_result
+            except BulkWriteError as e:
+                details = e.details
+            except Exception as e:
+                raise WriteError(f"Error executing bulk write: \n{e}")
+
+            _add_details(result, details, offset)
+
+            failed = {error["index"] + offset for error in details.get("writeErrors", [])}
+            for i in range(offset, offset + len(chunk)):
+                if i in inserts and i not in failed:
+                    result.inserted_ids.append(inserts[i]["_id"])
+
+        self.repository._invalidate_cache()
+        return result
+
+
+def _add_details(result: BulkResult, details: Dict, offset: int) -> None:
+    result.inserted_count += details.get("nInserted", 0)
+    result.matched_count += details.get("nMatched", 0)
+    result.modified_count += details.get("nModified", 0)
+    result.upserted_count += details.get("nUpserted", 0)
+    result.deleted_count += details.get("nRemoved", 0)
+    for upserted in details.get("upserted", []):
+        result.upserted_ids[upserted["index"] + offset] = upserted["_id"]
+    for error in details.get("writeErrors", []):
+        result.errors.append(dict(error, index=error["index"] + offset))
+
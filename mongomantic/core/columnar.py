@@ -0,0 +1,197 @@
+"""Columnar reads of query results into NumPy arrays or Arrow tables, without building models"""
+
+from typing import Any, Dict, Iterable, List, Mapping, Type
+
+from datetime import datetime
+from itertools import islice
+
+import bson
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pydantic.fields import SHAPE_SINGLETON
+from pymongo.collection import Collection
+
+from .mongo_model import OID, MongoDBModel
+
+__all__ = ["Column", "model_columns", "raw_collection", "read_arrow", "read_numpy"]
+
+COLUMNS_BATCH_SIZE = 1000
+
+# Kinds of columns with a typed buffer, other values are kept as Python objects
+BOOL = "bool"
+INT = "int"
+FLOAT = "float"
+STR = "str"
+DATETIME = "datetime"
+OBJECT_ID = "object_id"
+OBJECT = "object"
+
+
+class Column:
+    """Field of a model read as a column: its name, the key it is stored under and the kind of its buffer"""
+
+    __slots__ = ("name", "key", "kind", "nullable")
+
+    def __init__(self, name: str, key: str, kind: str, nullable: bool):
+        self.name = name
+        self.key = key
+        self.kind = kind
+        self.nullable = nullable
+
+
+def _kind(type_: Any) -> str:
+    if not isinstance(type_, type):
+        return OBJECT
+    # bool is a subclass of int
+    if issubclass(type_, bool):
+        return BOOL
+    if issubclass(type_, int):
+        return INT
+    if issubclass(type_, float):
+        return FLOAT
+    if issubclass(type_, str):
+        return STR
+    if issubclass(type_, datetime):
+        return DATETIME
+    if issubclass(type_, (ObjectId, OID)):
+        return OBJECT_ID
+    return OBJECT
+
+
+def model_columns(model: Type[MongoDBModel], fields: List[str], keys: List[str]) -> List[Column]:
+    """Columns of the given model fields, stored under `keys`, typed from the field declarations"""
+    columns = []
+    for name, key in zip(fields, keys):
+        if key == "_id":
+            columns.append(Column(name, key, OBJECT_ID, False))
+            continue
+        field = model.__fields__[name]
+        kind = _kind(field.type_) if field.shape == SHAPE_SINGLETON else OBJECT
+        columns.append(Column(name, key, kind, field.allow_none))
+    return columns
+
+
+def raw_collection(collection: Collection) -> Collection:
+    """Collection returning RawBSONDocuments, whose values are decoded when accessed.
+
+    Falls back to the collection itself where raw documents are not supported (e.g. mongomock).
+    """
+    try:
+        return collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+    except NotImplementedError:
+        return collection
+
+
+def _plain(value: Any) -> Any:
+    """Decodes raw embedded documents of a value into dicts"""
+    if isinstance(value, RawBSONDocument):
+        return bson.decode(value.raw)
+    if isinstance(value, list):
+        return [_plain(each) for each in value]
+    return value
+
+
+def _values(batch: List[Mapping], column: Column) -> List[Any]:
+    key = column.key
+    if column.kind == OBJECT:
+        return [_plain(document.get(key)) for document in batch]
+    return [document.get(key) for document in batch]
+
+
+def _batches(documents: Iterable[Mapping], batch_size: int) -> Iterable[List[Mapping]]:
+    documents = iter(documents)
+    while True:
+        batch = list(islice(documents, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def read_numpy(documents: Iterable[Mapping], columns: List[Column], batch_size: int = COLUMNS_BATCH_SIZE):
+    """NumPy array of every column, keyed by column name.
+
+    Integer and float columns that may hold nulls are read as float64 with NaN, datetimes as datetime64[ms]
+    with NaT, and strings, ObjectIds and other values as object arrays.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise RuntimeError("NumPy needs to be installed for reading columns")
+
+    dtypes = {
+        BOOL: np.bool_,
+        INT: np.int64,
+        FLOAT: np.float64,
+        DATETIME: "datetime64[ms]",
+    }
+
+    def fill(column: Column, values: List[Any]):
+        kind = column.kind
+        if kind in (INT, FLOAT) and column.nullable:
+            return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=len(values))
+        if kind in (BOOL, INT, FLOAT) and None not in values:
+            return np.fromiter(values, dtype=dtypes[kind], count=len(values))
+        if kind == DATETIME:
+            return np.array(values, dtype=dtypes[kind])
+        # Strings, ObjectIds, nested values and columns with unexpected nulls
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    chunks: Dict[str, List[Any]] = {column.name: [] for column in columns}
+    for batch in _batches(documents, batch_size):
+        for column in columns:
+            chunks[column.name].append(fill(column, _values(batch, column)))
+
+    result = {}
+    for column in columns:
+        parts = chunks[column.name]
+        if not parts:
+            result[column.name] = fill(column, [])
+        elif any(part.dtype != parts[0].dtype for part in parts):
+            # A batch fell back to objects
+            result[column.name] = np.concatenate([part.astype(object) for part in parts])
+        else:
+            result[column.name] = np.concatenate(parts)
+    return result
+
+
+def read_arrow(documents: Iterable[Mapping], columns: List[Column], batch_size: int = COLUMNS_BATCH_SIZE):
+    """Arrow table with a column per model field.
+
+    Typed columns are built batch by batch into chunked arrays, ObjectIds are read as strings, and the type
+    of other values (e.g. embedded documents read as structs) is inferred by Arrow over the whole column.
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("PyArrow needs to be installed for reading Arrow tables")
+
+    types = {
+        BOOL: pa.bool_(),
+        INT: pa.int64(),
+        FLOAT: pa.float64(),
+        STR: pa.string(),
+        DATETIME: pa.timestamp("ms"),
+        OBJECT_ID: pa.string(),
+    }
+
+    chunks: Dict[str, List[Any]] = {column.name: [] for column in columns}
+    for batch in _batches(documents, batch_size):
+        for column in columns:
+            values = _values(batch, column)
+            if column.kind == OBJECT_ID:
+                values = [None if v is None else str(v) for v in values]
+            if column.kind == OBJECT:
+                chunks[column.name].extend(values)
+            else:
+                chunks[column.name].append(pa.array(values, type=types[column.kind]))
+
+    arrays = []
+    for column in columns:
+        if column.kind == OBJECT:
+            arrays.append(pa.array(chunks[column.name]))
+        else:
+            arrays.append(pa.chunked_array(chunks[column.name], type=types[column.kind]))
+    return pa.Table.from_arrays(arrays, names=[column.name for column in columns])
@@ -1,28 +1,223 @@
 # # Package # #
-from pymongo import MongoClient
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from pymongo import MongoClient, ReadPreference
 from pymongo.database import Database
+from pymongo.read_preferences import _ServerMode
+
+from .errors import ConnectionNotFoundError
+
+
+__all__ = [
+    "DEFAULT_CONNECTION",
+    "Connection",
+    "MongomanticClient",
+    "connect",
+    "connections",
+    "disconnect",
+    "get_connection",
+    "on_disconnect",
+    "to_read_preference",
+    "use_connection",
+]
 
+DEFAULT_CONNECTION = "default"
 
-__all__ = ["MongomanticClient"]
+ReadPreferenceLike = Union[str, _ServerMode]
+
+# Called with the alias being disconnected (None for all) before the clients are closed, e.g. to flush buffered writes
+_disconnect_hooks: List[Callable[[Optional[str]], None]] = []
+
+_connections: Dict[str, "Connection"] = {}
+_connections_lock = threading.Lock()
 
 
 class MongomanticClient:
+    """Client and database of the default connection"""
+
     client: MongoClient = None
     db: Database = None
 
 
-def connect(uri: str, database: str, mock: bool = False) -> None:
+@dataclass
+class Connection:
+    """Client and database registered under an alias"""
+
+    alias: str
+    client: MongoClient
+    db: Database
+
+
+def to_read_preference(value: Optional[ReadPreferenceLike]) -> Optional[_ServerMode]:
+    """Pymongo read preference from a read preference or a mode name ("secondaryPreferred", "secondary_preferred"...)"""
+    if value is None or isinstance(value, _ServerMode):
+        return value
+    name = value.replace("_", "").lower()
+    for mode in (
+        ReadPreference.PRIMARY,
+        ReadPreference.PRIMARY_PREFERRED,
+        ReadPreference.SECONDARY,
+        ReadPreference.SECONDARY_PREFERRED,
+        ReadPreference.NEAREST,
+    ):
+        if mode.mongos_mode.lower() == name:
+            return mode
+    raise ValueError(f"Invalid read preference {value}")
+
+
+def connect(
+    uri: str,
+    database: str,
+    mock: bool = False,
+    alias: str = DEFAULT_CONNECTION,
+    max_pool_size: Optional[int] = None,
+    min_pool_size: Optional[int] = None,
+    compressors: Optional[Union[str, List[str]]] = None,
+    read_preference: Optional[ReadPreferenceLike] = None,
+    **client_options: Any,
+) -> Connection:
+    """Connects to a database and registers the connection under `alias`, replacing any previous one.
+
+    Repositories use the default connection unless `Meta.connection` names another alias.
+
+    Args:
+        uri: MongoDB connection string
+        database: Name of the database
+        mock: Connect to an in-memory mongomock client instead
+        alias: Name of the connection
+        max_pool_size: Maximum number of connections of the client pool
+        min_pool_size: Number of connections kept open in the pool
+        compressors: Wire protocol compressors, e.g. ["zstd", "snappy", "zlib"]
+        read_preference: Default read preference of the connection, e.g. "secondaryPreferred"
+        client_options: Other MongoClient options
+
+    Example::
+
+        connect("mongodb://localhost:27017", "shop")
+        connect("mongodb://analytics:27017", "shop", alias="analytics", read_preference="secondaryPreferred")
+    """
+    options: Dict[str, Any] = dict(client_options)
+    if max_pool_size is not None:
+        options["maxPoolSize"] = max_pool_size
+    if min_pool_size is not None:
+        options["minPoolSize"] = min_pool_size
+    if compressors:
+        options["compressors"] = compressors if isinstance(compressors, str) else ",".join(compressors)
+    if read_preference is not None:
+        options["read_preference"] = to_read_preference(read_preference)
+
     if mock:
         try:
             import mongomock
         except ImportError:
             raise RuntimeError("Mongomock needs to be installed for mocking a connection")
-        MongomanticClient.client = mongomock.MongoClient(uri)
+        client = mongomock.MongoClient(uri, **options)
     else:
-        MongomanticClient.client = MongoClient(uri)
+        client = MongoClient(uri, **options)
+
+    connection = Connection(alias, client, client.__getattr__(database))
+    with _connections_lock:
+        _connections[alias] = connection
+        if alias == DEFAULT_CONNECTION:
+            MongomanticClient.client = connection.client
+            MongomanticClient.db = connection.db
+    return connection
+
+
+def get_connection(alias: str = DEFAULT_CONNECTION) -> Connection:
+    """Connection registered under `alias`
+
+    Raises:
+        ConnectionNotFoundError: If there is no such connection
+    """
+    connection = _connections.get(alias)
+    if connection is None:
+        raise ConnectionNotFoundError(f"No connection named {alias}, call connect(..., alias={alias!r}) first")
+    return connection
+
+
+def connections() -> Dict[str, Connection]:
+    """Registered connections by alias"""
+    with _connections_lock:
+        return dict(_connections)
+
+
+def on_disconnect(hook: Callable[[Optional[str]], None]) -> Callable[[Optional[str]], None]:
+    """Registers a function called by `disconnect` before the client is closed, with its alias or None for all"""
+    if hook not in _disconnect_hooks:
+        _disconnect_hooks.append(hook)
+    return hook
+
+
+def disconnect(alias: Optional[str] = None) -> None:
+    """Closes and unregisters the connection named `alias`, or all connections.
+
+    Disconnect hooks run with `alias` before the connections are closed.
+    """
+    for hook in list(_disconnect_hooks):
+        hook(alias)
+
+    with _connections_lock:
+        if alias is None:
+            closed = list(_connections.values())
+            _connections.clear()
+        else:
+            connection = _connections.pop(alias, None)
+            closed = [connection] if connection is not None else []
+        if DEFAULT_CONNECTION not in _connections:
+            MongomanticClient.client = None
+            MongomanticClient.db = None
+
+    for connection in closed:
+        connection.client.close()
+
+
+class _Override(NamedTuple):
+    alias: Optional[str]
+    read_preference: Optional[_ServerMode]
+    repositories: Optional[Tuple[type, ...]]
+
+
+_overrides: "ContextVar[Tuple[_Override, ...]]" = ContextVar("mongomantic_connection_overrides", default=())
+
+
+@contextmanager
+def use_connection(
+    alias: Optional[str] = None,
+    read_preference: Optional[ReadPreferenceLike] = None,
+    repositories: Optional[Iterable[type]] = None,
+) -> Iterator[None]:
+    """Routes repositories to another connection and/or read preference within the block.
+
+    Overrides apply to the current thread or asyncio task only, to `repositories` or to all of them, and the
+    innermost block wins. Asynchronous repositories can be given directly, their queries run on their
+    `sync_repository`. The connection is chosen when a query runs, so generators returned by `find` or
+    `aggregate` have to be consumed within the block.
+
+    Example::
 
-    MongomanticClient.db = MongomanticClient.client.__getattr__(database)
+        with use_connection("analytics", read_preference="secondary", repositories=[OrderRepository]):
+            report = list(OrderRepository.aggregate(pipeline))
+    """
+    if repositories is not None:
+        repositories = tuple(getattr(repository, "sync_repository", repository) for repository in repositories)
+    override = _Override(alias, to_read_preference(read_preference), repositories)
+    token = _overrides.set(_overrides.get() + (override,))
+    try:
+        yield
+    finally:
+        _overrides.reset(token)
 
 
-def disconnect() -> None:
-    MongomanticClient.client.close()
+def route(repository: type, alias: str, preference: Optional[ReadPreferenceLike]) -> Tuple[str, Optional[_ServerMode]]:
+    """Alias and read preference used by a repository, given those of its Meta and the active overrides"""
+    for override in _overrides.get():
+        if override.repositories is None or repository in override.repositories:
+            alias = override.alias or alias
+            preference = override.read_preference or preference
+    return alias, to_read_preference(preference)
@@ -4,8 +4,13 @@ __all__ = [
     "DoesNotExistError",
     "MultipleObjectsReturnedError",
     "FieldDoesNotExistError",
+    "PartialWriteError",
+    "UnindexedQueryError",
 ]
 
+# Server error code of aggregation stages it does not know, e.g. $facet before MongoDB 3.4
+UNRECOGNIZED_PIPELINE_STAGE = 40324
+
 
 class WriteError(Exception):
     pass
@@ -33,3 +38,25 @@ class IndexCreationError(Exception):
 
 class DuplicateKeyError(Exception):
     pass
+
+
+class ConnectionNotFoundError(Exception):
+    pass
+
+
+class UnindexedQueryError(Exception):
+    """Raised by IndexAdvisor reports when query shapes are not covered by the declared indexes"""
+
+
+class PartialWriteError(WriteError):
+    """Raised when some documents of a batch write failed while the rest were written.
+
+    Attributes:
+        errors: Write errors reported by MongoDB, with `index` relative to the whole batch
+        result: What the call would have returned, covering the documents that were written
+    """
+
+    def __init__(self, message, errors, result):
+        super().__init__(message)
+        self.errors = errors
+        self.result = result
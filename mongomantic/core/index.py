@@ -1,8 +1,13 @@
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple
+
 import re
-from typing import List, Optional
+from dataclasses import dataclass, field
 
 from pydantic import BaseModel, Field
 from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.collection import Collection
+
+from .errors import IndexCreationError
 
 
 def getIndexNameFromError(error_message):
@@ -47,8 +52,8 @@ class Index(BaseModel):
         description="If True, documents will not expire after <int> seconds.",
     )
 
-    def to_pymongo(self, existing_indexes):
-        # Create pymongo index models
+    def to_index_model(self) -> IndexModel:
+        """Pymongo index model of this index"""
         pymongo_fields = []
         for field in self.fields:
             # Process prefix
@@ -74,8 +79,105 @@ class Index(BaseModel):
             index_dict["name"] = self.name
         if not self.ignore_expire_after_seconds and self.expire_after_seconds > 0 and len(pymongo_fields) == 1:
             index_dict["expireAfterSeconds"] = self.expire_after_seconds
-        index = IndexModel(**index_dict)
+        return IndexModel(**index_dict)
+
+    def to_pymongo(self, existing_indexes):
+        index = self.to_index_model()
         if index.document.get("name") in existing_indexes:
             # print(f"Index {index.document['name']} already exists. skipping this index")
             return None
         return index
+
+
+@dataclass
+class IndexReport:
+    """Result of syncing the declared indexes of a collection with the existing ones, by index name.
+
+    Conflicting indexes exist with the same name or keys as a declared index, but different options.
+    Stale indexes exist but are not declared. Both are only dropped (and conflicting ones recreated) on request.
+    """
+
+    collection: str
+    created: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    conflicting: List[str] = field(default_factory=list)
+    stale: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+
+def index_spec(document: Mapping[str, Any]) -> Tuple:
+    """Comparable specification of an index, from an IndexModel document or an `index_information()` entry.
+
+    Covers the keys and directions, text fields, and the unique, sparse, TTL and partial filter options.
+    """
+    keys = []
+    text_fields: FrozenSet[str] = frozenset()
+    for key, direction in document["key"].items() if isinstance(document["key"], Mapping) else document["key"]:
+        if direction == TEXT:
+            text_fields |= {key}
+        elif key in ("_fts", "_ftsx"):
+            # Text index as stored by the server, its fields are the keys of `weights`
+            text_fields = frozenset(document.get("weights", {}))
+        else:
+            keys.append((key, int(direction) if isinstance(direction, (int, float)) else direction))
+    return (
+        tuple(keys),
+        text_fields,
+        bool(document.get("unique", False)),
+        bool(document.get("sparse", False)),
+        document.get("expireAfterSeconds"),
+        document.get("partialFilterExpression"),
+    )
+
+
+def sync_collection_indexes(collection: Collection, indexes: List[Index], drop: bool = False) -> IndexReport:
+    """Creates the declared indexes missing from a collection, comparing full index specifications.
+
+    Args:
+        collection: Collection to sync
+        indexes: Declared indexes
+        drop: Drop stale indexes, and drop and recreate conflicting ones
+
+    Raises:
+        IndexCreationError: If creating or dropping an index failed
+    """
+    report = IndexReport(collection=collection.name)
+    try:
+        existing = {name: index_spec(info) for name, info in collection.index_information().items()}
+        existing.pop("_id_", None)
+
+        declared: Dict[str, IndexModel] = {}
+        for index in indexes:
+            model = index.to_index_model()
+            declared.setdefault(model.document["name"], model)
+
+        to_create = []
+        for name, model in declared.items():
+            spec = index_spec(model.document)
+            if existing.get(name) == spec:
+                report.unchanged.append(name)
+                continue
+            # Same name with other options, or same keys under another name, which the server refuses
+            conflicts = [
+                other
+                for other, other_spec in existing.items()
+                if other == name or other_spec[:2] == spec[:2]
+                if other not in report.conflicting
+            ]
+            report.conflicting.extend(conflicts)
+            if drop or not conflicts:
+                to_create.append(model)
+
+        declared_names = set(declared)
+        report.stale = [name for name in existing if name not in declared_names and name not in report.conflicting]
+
+        if drop:
+            for name in report.conflicting + report.stale:
+                collection.drop_index(name)
+                report.dropped.append(name)
+        if to_create:
+            collection.create_indexes(to_create)
+            report.created = [model.document["name"] for model in to_create]
+    except Exception as e:
+        raise IndexCreationError(f"Error syncing indexes of {collection.name}: {e}")
+    return report
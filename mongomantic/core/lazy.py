@@ -0,0 +1,223 @@
+"""Models decoded field by field from raw BSON, on first access"""
+
+from typing import Any, Dict, Mapping, Optional, Tuple, Type
+
+import struct
+from functools import lru_cache
+
+import bson
+from bson.codec_options import DEFAULT_CODEC_OPTIONS
+from bson.raw_bson import RawBSONDocument
+from pydantic import PrivateAttr, ValidationError
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import MissingError
+
+from .mongo_model import MongoDBModel
+
+__all__ = ["from_raw", "lazy_model", "element_offsets"]
+
+LAZY_MODEL_CACHE_SIZE = 128
+
+_MISSING = object()
+_INT32 = struct.Struct("<i")
+
+# Size of fixed size BSON values, by element type
+_FIXED_SIZES = {
+    0x01: 8,  # double
+    0x06: 0,  # undefined
+    0x07: 12,  # ObjectId
+    0x08: 1,  # boolean
+    0x09: 8,  # UTC datetime
+    0x0A: 0,  # null
+    0x10: 4,  # int32
+    0x11: 8,  # timestamp
+    0x12: 8,  # int64
+    0x13: 16,  # decimal128
+    0x7F: 0,  # max key
+    0xFF: 0,  # min key
+}
+# Element types prefixed by their int32 length, plus a constant
+_LENGTH_PREFIXED = {
+    0x02: 4,  # string
+    0x03: 0,  # embedded document
+    0x04: 0,  # array
+    0x05: 5,  # binary, length and subtype
+    0x0D: 4,  # JavaScript code
+    0x0E: 4,  # symbol
+    0x0F: 0,  # code with scope
+}
+
+
+def element_offsets(raw: bytes) -> Dict[str, Tuple[int, int]]:
+    """(start, end) offsets of every top level element of a BSON document, keyed by element name.
+
+    Only element headers and lengths are read, values are left undecoded.
+    """
+    offsets = {}
+    position = 4
+    end = len(raw) - 1
+    while position < end:
+        start = position
+        element_type = raw[position]
+        name_end = raw.index(b"\x00", position + 1)
+        name = raw[position + 1 : name_end].decode("utf-8")
+        position = name_end + 1
+
+        if element_type in _FIXED_SIZES:
+            position += _FIXED_SIZES[element_type]
+        elif element_type in _LENGTH_PREFIXED:
+            position += _INT32.unpack_from(raw, position)[0] + _LENGTH_PREFIXED[element_type]
+        elif element_type == 0x0B:  # regular expression, pattern and options cstrings
+            position = raw.index(b"\x00", raw.index(b"\x00", position) + 1) + 1
+        elif element_type == 0x0C:  # DBPointer, string and ObjectId
+            position += 4 + _INT32.unpack_from(raw, position)[0] + 12
+        else:
+            raise bson.InvalidBSON(f"Unknown BSON element type {element_type:#x}")
+        offsets[name] = (start, position)
+    return offsets
+
+
+def _decode_element(raw: bytes, start: int, end: int) -> Any:
+    """Decodes the single element between the given offsets"""
+    element = raw[start:end]
+    document = bson.decode(_INT32.pack(len(element) + 5) + element + b"\x00", DEFAULT_CODEC_OPTIONS)
+    return next(iter(document.values()))
+
+
+class _LazyState:
+    """Raw document of a lazy model, with the offsets of its elements"""
+
+    __slots__ = ("document", "offsets", "trusted")
+
+    def __init__(self, document: Mapping, trusted: bool):
+        self.document = document
+        self.trusted = trusted
+        self.offsets = element_offsets(document.raw) if isinstance(document, RawBSONDocument) else None
+
+    def keys(self):
+        return self.offsets.keys() if self.offsets is not None else self.document.keys()
+
+    def get(self, key: str) -> Any:
+        if self.offsets is None:
+            return self.document.get(key, _MISSING)
+        offsets = self.offsets.get(key)
+        if offsets is None:
+            return _MISSING
+        return _decode_element(self.document.raw, *offsets)
+
+
+def _load(model: MongoDBModel, name: str) -> Any:
+    """Decodes, validates and caches the value of a field"""
+    state: _LazyState = model._lazy_state
+    field = model.__fields__[name]
+    decoder = type(model).decoder()
+
+    value = state.get("_id" if name == "id" else field.alias)
+    if value is _MISSING and name != field.alias:
+        value = state.get(name)
+
+    if value is _MISSING:
+        if field.required and not state.trusted:
+            raise ValidationError([ErrorWrapper(MissingError(), loc=field.alias)], type(model))
+        value = field.get_default()
+    else:
+        value = decoder.prepare_value(name, value)
+        if state.trusted:
+            value = decoder.construct_value(name, value)
+        else:
+            value, errors = field.validate(value, {}, loc=field.alias, cls=type(model))
+            if errors:
+                raise ValidationError([errors], type(model))
+
+    model.__dict__[name] = value
+    return value
+
+
+def _load_all(model: MongoDBModel) -> None:
+    """Decodes all remaining fields, after which the raw document is released"""
+    state: Optional[_LazyState] = model._lazy_state
+    if state is None:
+        return
+    values = model.__dict__
+    for name in model.__fields__:
+        if name not in values:
+            _load(model, name)
+    # Same order as a model decoded at once
+    ordered = {name: values.pop(name) for name in model.__fields__}
+    ordered.update(values)
+    if type(model).decoder().keep_extra:
+        known = {field.alias for field in model.__fields__.values()} | set(model.__fields__) | {"_id"}
+        for key in state.keys():
+            if key not in known and key not in ordered:
+                ordered[key] = state.get(key)
+    object.__setattr__(model, "__dict__", ordered)
+    object.__setattr__(model, "_lazy_state", None)
+
+
+@lru_cache(maxsize=LAZY_MODEL_CACHE_SIZE)
+def lazy_model(model: Type[MongoDBModel]) -> Type[MongoDBModel]:
+    """Subclass of `model` whose instances decode each field on first access, see `from_raw`"""
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes that are not set, i.e. fields not decoded yet
+        if not name.startswith("_") and name in self.__fields__ and self._lazy_state is not None:
+            return _load(self, name)
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    def _iter(self, *args, **kwargs):
+        _load_all(self)
+        return model._iter(self, *args, **kwargs)
+
+    def __iter__(self):
+        _load_all(self)
+        return model.__iter__(self)
+
+    def __repr_args__(self):
+        _load_all(self)
+        return model.__repr_args__(self)
+
+    def __getstate__(self):
+        _load_all(self)
+        return model.__getstate__(self)
+
+    namespace = {
+        "__module__": model.__module__,
+        "__getattr__": __getattr__,
+        "_iter": _iter,
+        "__iter__": __iter__,
+        "__repr_args__": __repr_args__,
+        "__getstate__": __getstate__,
+        "_lazy_state": PrivateAttr(default=None),
+    }
+    # Subclassing keeps the config, validators and methods of the model, and isinstance checks working
+    return type(model)(f"Lazy{model.__name__}", (model,), namespace)
+
+
+def from_raw(model: Type[MongoDBModel], document: Mapping, trusted: bool = False) -> Optional[MongoDBModel]:
+    """Model whose fields are decoded and validated from `document` on first access, then cached.
+
+    With a RawBSONDocument, only the offsets of its elements are read upfront, and each field is decoded from
+    the raw bytes when accessed, so that a model holds little more than the raw BSON until its fields are read.
+    Plain dict documents are supported as well. Fields are validated on their own, so validators depending on
+    other fields and root validators are not run. Serializing the model (`dict`, `json`, `to_mongo`, `save`...)
+    decodes all fields.
+
+    Raises:
+        ValidationError: When accessing a field with an invalid value, unless `trusted`
+
+    Returns:
+        Optional[MongoDBModel]: Lazy model instance, or None if the document is empty
+    """
+    if not document:
+        return None
+
+    lazy = lazy_model(model)
+    state = _LazyState(document, trusted)
+    instance = lazy.__new__(lazy)
+    object.__setattr__(instance, "__dict__", {})
+    aliases = {"_id": "id", **{field.alias: name for name, field in model.__fields__.items()}}
+    object.__setattr__(instance, "__fields_set__", {aliases[key] for key in state.keys() if key in aliases})
+    instance._init_private_attributes()
+    object.__setattr__(instance, "_lazy_state", state)
+    instance.track_changes()
+    return instance
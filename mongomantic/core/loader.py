@@ -0,0 +1,130 @@
+"""Request-scoped loader batching lookups by id into single `$in` queries"""
+
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Type
+
+import asyncio
+import contextvars
+from functools import partial
+
+from bson import ObjectId
+
+from .mongo_model import MongoDBModel
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .base_repository import BaseRepository
+
+__all__ = ["DataLoader", "LoadResult"]
+
+
+class LoadResult:
+    """Pending result of DataLoader.load, resolved together with all other pending loads on first access"""
+
+    __slots__ = ("_loader", "_id")
+
+    def __init__(self, loader: "DataLoader", id: ObjectId):
+        self._loader = loader
+        self._id = id
+
+    def result(self) -> Optional[MongoDBModel]:
+        """Returns the loaded model, or None if it does not exist"""
+        return self._loader._resolve(self._id)
+
+
+class DataLoader:
+    """Batches `get(id=...)` lookups of a repository.
+
+    All ids requested through `load` are fetched with one `get_many` query when the first result is
+    accessed. In asyncio code, all `load_async` calls made in the same event loop iteration are fetched
+    with one query, run in the default executor. Loaded models are memoized for the lifetime of the loader,
+    so a loader should be created per request.
+
+    Example::
+
+        loader = UserRepository.loader()
+        results = [loader.load(order.user_id) for order in orders]
+        users = [result.result() for result in results]  # Single query
+
+        users = await asyncio.gather(*(loader.load_async(order.user_id) for order in orders))  # Single query
+    """
+
+    def __init__(self, repository: Type["BaseRepository"], trusted: Optional[bool] = None):
+        self.repository = repository
+        self.trusted = trusted
+        self._loaded: Dict[ObjectId, Optional[MongoDBModel]] = {}
+        self._pending: Dict[ObjectId, None] = {}  # Insertion ordered set
+        self._futures: Dict[ObjectId, "asyncio.Future"] = {}
+        self._scheduled = False
+
+    def __enter__(self) -> "DataLoader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.clear()
+
+    def _key(self, id: Any) -> ObjectId:
+        return self.repository._process_ID({"id": id})["_id"]
+
+    def load(self, id: Any) -> LoadResult:
+        """Queues an id for the next batch, returning its pending result"""
+        oid = self._key(id)
+        if oid not in self._loaded:
+            self._pending[oid] = None
+        return LoadResult(self, oid)
+
+    def load_many(self, ids: List[Any]) -> List[Optional[MongoDBModel]]:
+        """Loads several ids at once, None for ids that do not exist"""
+        results = [self.load(id) for id in ids]
+        return [result.result() for result in results]
+
+    def dispatch(self) -> None:
+        """Fetches all queued ids with a single query"""
+        if not self._pending:
+            return
+        ids = list(self._pending)
+        self._pending.clear()
+        for id, model in zip(ids, self.repository.get_many(ids, trusted=self.trusted)):
+            self._loaded[id] = model
+
+    def _resolve(self, id: ObjectId) -> Optional[MongoDBModel]:
+        if id not in self._loaded:
+            self.dispatch()
+        return self._loaded.get(id)
+
+    async def load_async(self, id: Any) -> Optional[MongoDBModel]:
+        """Loads an id, batched with all other `load_async` calls made in the same event loop iteration"""
+        oid = self._key(id)
+        if oid in self._loaded:
+            return self._loaded[oid]
+
+        future = self._futures.get(oid)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[oid] = loop.create_future()
+            if not self._scheduled:
+                self._scheduled = True
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch_async()))
+        return await future
+
+    async def _dispatch_async(self) -> None:
+        self._scheduled = False
+        futures, self._futures = self._futures, {}
+        ids = list(futures)
+        try:
+            loop = asyncio.get_running_loop()
+            # Run in a copy of the context, so that connection overrides apply in the executor thread
+            run = partial(contextvars.copy_context().run, self.repository.get_many, ids, self.trusted)
+            models = await loop.run_in_executor(None, run)
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for id, model in zip(ids, models):
+            self._loaded[id] = model
+            if not futures[id].done():
+                futures[id].set_result(model)
+
+    def clear(self) -> None:
+        """Forgets memoized models, so that they are loaded again"""
+        self._loaded.clear()
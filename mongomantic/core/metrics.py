@@ -0,0 +1,458 @@
+"""Operation metrics of repositories, delivered to hooks, with a collector, an exporter and a slow query log"""
+
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+import bisect
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+import bson
+from bson.raw_bson import RawBSONDocument
+from mongomantic.config import logger
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .base_repository import BaseRepository
+
+__all__ = [
+    "Histogram",
+    "MetricsCollector",
+    "OperationStats",
+    "QueryEvent",
+    "SlowQueryLog",
+    "SlowQuerySummary",
+    "add_hook",
+    "fingerprint",
+    "measure_sizes",
+    "remove_hook",
+]
+
+Hook = Callable[["QueryEvent"], None]
+
+# Upper bounds in seconds, as the default buckets of Prometheus client libraries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_hooks: List[Hook] = []
+_hooks_lock = threading.Lock()
+_measure_sizes = False
+
+
+def add_hook(hook: Hook) -> Hook:
+    """Registers a function called with a QueryEvent after each repository operation.
+
+    Operations are only measured while at least one hook is registered. Hooks run in the thread that ran the
+    operation, once its results are consumed, and exceptions they raise are logged.
+    """
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook: Hook) -> None:
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def _normalize(value: Any) -> Any:
+    """Query with its values replaced by '?', keeping field names and operators"""
+    if isinstance(value, Mapping):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [_normalize(item) for item in value]
+        # Lists of values ($in, $all...) have the same shape whatever their length
+        return items if any(isinstance(item, (dict, list)) for item in items) else ["?"]
+    return "?"
+
+
+def fingerprint(query: Any, sort: Optional[Sequence[Tuple[str, int]]] = None) -> str:
+    """Normalized text of a filter document or pipeline and its sort, identical for queries differing by values only"""
+    text = json.dumps(_normalize(query), sort_keys=True)
+    if sort:
+        text += " sort " + json.dumps([[key, direction] for key, direction in sort])
+    return text
+
+
+@dataclass
+class QueryEvent:
+    """Measurement of one repository operation, times in seconds.
+
+    `server_time` covers the calls to the server, including reading cursor batches, and `decode_time` the
+    decoding and validation of the documents into models. `documents` and `bytes` count the documents read
+    from the server and their BSON size, known for raw documents only unless `measure_sizes` is on.
+    """
+
+    repository: str
+    collection: str
+    operation: str
+    query: Any
+    sort: Optional[Sequence[Tuple[str, int]]] = None
+    server_time: float = 0.0
+    decode_time: float = 0.0
+    documents: int = 0
+    bytes: int = 0
+    error: Optional[BaseException] = None
+
+    @property
+    def total_time(self) -> float:
+        return self.server_time + self.decode_time
+
+    @property
+    def fingerprint(self) -> str:
+        return fingerprint(self.query, self.sort)
+
+    @property
+    def fingerprint_id(self) -> str:
+        """Short hash of the fingerprint, e.g. for metric labels"""
+        return hashlib.sha1(self.fingerprint.encode()).hexdigest()[:16]
+
+
+def measure_sizes(enabled: bool = True) -> None:
+    """Turns on (or off) the BSON size measurement of decoded documents.
+
+    The size of raw documents is always known, that of decoded ones is measured by encoding them again, which
+    is about as costly as decoding them, so `QueryEvent.bytes` only counts raw documents by default.
+    """
+    global _measure_sizes
+    _measure_sizes = enabled
+
+
+def _size(document: Any) -> int:
+    if isinstance(document, RawBSONDocument):
+        return len(document.raw)
+    if not _measure_sizes or not isinstance(document, Mapping):
+        return 0
+    try:
+        return len(bson.encode(document))
+    except Exception:
+        return 0
+
+
+class Measurement:
+    """Times an operation while it runs, and emits its QueryEvent when the `with` block exits.
+
+    Single round trip operations count the time of the block, minus decoding, as server time. Operations
+    reading a cursor only count the time spent fetching documents, the rest being spent by the caller.
+    """
+
+    __slots__ = ("event", "started", "streaming")
+
+    def __init__(self, event: QueryEvent):
+        self.event = event
+        self.started = 0.0
+        self.streaming = False
+
+    def __enter__(self) -> "Measurement":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        event = self.event
+        if not self.streaming:
+            event.server_time = max(time.perf_counter() - self.started - event.decode_time, 0.0)
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            event.error = exc
+        _emit(event)
+        return False
+
+    def fetched(self, document: Any) -> None:
+        """Counts a document read from the server"""
+        if document is not None:
+            self.event.documents += 1
+            self.event.bytes += _size(document)
+
+    def iterate(self, documents: Iterable[Any]) -> Iterator[Any]:
+        """Iterates over a cursor, counting the time spent fetching documents as server time"""
+        self.streaming = True
+        event = self.event
+        iterator = iter(documents)
+        while True:
+            start = time.perf_counter()
+            try:
+                document = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                event.server_time += time.perf_counter() - start
+            self.fetched(document)
+            yield document
+
+    def timed(self, transform: Optional[Callable[..., Any]]) -> Optional[Callable[..., Any]]:
+        """Wraps a decoding function, counting its time as decode time"""
+        if transform is None:
+            return None
+        event = self.event
+
+        def decode(document: Any, *args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return transform(document, *args, **kwargs)
+            finally:
+                event.decode_time += time.perf_counter() - start
+
+        return decode
+
+
+class _NotMeasured:
+    """Stands for a Measurement while no hook is registered"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *args) -> bool:
+        return False
+
+
+_NOT_MEASURED = _NotMeasured()
+
+
+def measure(
+    repository: Type["BaseRepository"],
+    operation: str,
+    query: Any,
+    sort: Optional[Sequence[Tuple[str, int]]] = None,
+):
+    """Context manager measuring an operation, whose `as` target is None when metrics are off"""
+    if not _hooks:
+        return _NOT_MEASURED
+    return Measurement(QueryEvent(repository.__name__, repository.Meta.collection, operation, query, sort))
+
+
+def _emit(event: QueryEvent) -> None:
+    for hook in list(_hooks):
+        try:
+            hook(event)
+        except Exception:
+            logger.exception("Metrics hook failed")
+
+
+@dataclass
+class Histogram:
+    """Counts of observations per bucket, `counts[i]` for values up to `buckets[i]` and the last one above all"""
+
+    buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    counts: List[int] = field(default_factory=list)
+    count: int = 0
+    sum: float = 0.0
+
+    def __post_init__(self):
+        if not self.counts:
+            self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Upper bound and number of observations up to it per bucket, ending with +Inf as in Prometheus"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def copy(self) -> "Histogram":
+        return Histogram(self.buckets, list(self.counts), self.count, self.sum)
+
+
+@dataclass
+class OperationStats:
+    """Metrics of one operation of a repository"""
+
+    calls: int = 0
+    errors: int = 0
+    documents: int = 0
+    bytes: int = 0
+    server_time: Histogram = field(default_factory=Histogram)
+    decode_time: Histogram = field(default_factory=Histogram)
+
+    def copy(self) -> "OperationStats":
+        return OperationStats(
+            self.calls, self.errors, self.documents, self.bytes, self.server_time.copy(), self.decode_time.copy()
+        )
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsCollector:
+    """Hook aggregating events into OperationStats per repository and operation.
+
+    `snapshot` gives a consistent copy of the metrics, e.g. for OpenTelemetry observable callbacks, and
+    `prometheus` renders them in the Prometheus text format.
+
+    Example::
+
+        collector = add_hook(MetricsCollector())
+        ...
+        stats = collector.snapshot()[("UserRepository", "find")]
+        print(stats.calls, stats.server_time.mean, stats.documents)
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._stats: Dict[Tuple[str, str], OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: QueryEvent) -> None:
+        key = (event.repository, event.operation)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = OperationStats(
+                    server_time=Histogram(self.buckets), decode_time=Histogram(self.buckets)
+                )
+            stats.calls += 1
+            stats.errors += event.error is not None
+            stats.documents += event.documents
+            stats.bytes += event.bytes
+            stats.server_time.observe(event.server_time)
+            stats.decode_time.observe(event.decode_time)
+
+    def snapshot(self) -> Dict[Tuple[str, str], OperationStats]:
+        """Copy of the metrics, by repository name and operation"""
+        with self._lock:
+            return {key: stats.copy() for key, stats in self._stats.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def prometheus(self, prefix: str = "mongomantic") -> str:
+        """Metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for name, kind, help_text in (
+            ("operations_total", "counter", "Repository operations"),
+            ("errors_total", "counter", "Repository operations that raised"),
+            ("documents_total", "counter", "Documents read from the server"),
+            ("bytes_total", "counter", "BSON bytes of the documents read from the server"),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            attribute = {"operations_total": "calls"}.get(name, name[: -len("_total")])
+            for (repository, operation), stats in sorted(snapshot.items()):
+                labels = f'repository="{_label(repository)}",operation="{_label(operation)}"'
+                lines.append(f"{prefix}_{name}{{{labels}}} {getattr(stats, attribute)}")
+
+        for name, help_text in (
+            ("server_seconds", "Time spent in server calls"),
+            ("decode_seconds", "Time spent decoding and validating documents"),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for (repository, operation), stats in sorted(snapshot.items()):
+                labels = f'repository="{_label(repository)}",operation="{_label(operation)}"'
+                histogram = stats.server_time if name == "server_seconds" else stats.decode_time
+                for bound, count in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{prefix}_{name}_bucket{{{labels},le="{le}"}} {count}')
+                lines.append(f"{prefix}_{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{prefix}_{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class SlowQuerySummary:
+    """Slow queries sharing a fingerprint"""
+
+    fingerprint: str
+    repository: str
+    operation: str
+    count: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+
+class SlowQueryLog:
+    """Hook keeping the most recent operations slower than a threshold, and logging them as warnings.
+
+    Thresholds are in seconds of server and decode time. `thresholds` overrides `threshold` per repository
+    name or per `"Repository.operation"`.
+
+    Example::
+
+        slow_queries = add_hook(SlowQueryLog(threshold=0.2, thresholds={"ReportRepository": 2.0}))
+        ...
+        for summary in slow_queries.summary():
+            print(summary.count, summary.max_time, summary.fingerprint)
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.1,
+        thresholds: Optional[Dict[str, float]] = None,
+        max_entries: int = 1000,
+        log: bool = True,
+    ):
+        self.threshold = threshold
+        self.thresholds = dict(thresholds or {})
+        self.log = log
+        self._entries: "deque[QueryEvent]" = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def threshold_for(self, repository: str, operation: str) -> float:
+        key = f"{repository}.{operation}"
+        if key in self.thresholds:
+            return self.thresholds[key]
+        return self.thresholds.get(repository, self.threshold)
+
+    def __call__(self, event: QueryEvent) -> None:
+        if event.total_time < self.threshold_for(event.repository, event.operation):
+            return
+        with self._lock:
+            self._entries.append(event)
+        if self.log:
+            logger.warning(
+                f"Slow {event.repository}.{event.operation} on {event.collection}: {event.total_time:.3f}s"
+                f" (server {event.server_time:.3f}s, decode {event.decode_time:.3f}s, {event.documents} documents)"
+                f" {event.fingerprint}"
+            )
+
+    def entries(self) -> List[QueryEvent]:
+        """Slow operations, oldest first"""
+        with self._lock:
+            return list(self._entries)
+
+    def summary(self) -> List[SlowQuerySummary]:
+        """Slow operations grouped by repository, operation and fingerprint, slowest in total first"""
+        groups: Dict[Tuple[str, str, str], SlowQuerySummary] = {}
+        for event in self.entries():
+            key = (event.repository, event.operation, event.fingerprint)
+            summary = groups.get(key)
+            if summary is None:
+                summary = groups[key] = SlowQuerySummary(event.fingerprint, event.repository, event.operation)
+            summary.count += 1
+            summary.total_time += event.total_time
+            summary.max_time = max(summary.max_time, event.total_time)
+        return sorted(groups.values(), key=lambda summary: -summary.total_time)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
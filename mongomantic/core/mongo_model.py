@@ -1,13 +1,31 @@
 import json
 
-from typing import Any, Dict, Optional, Type
+from typing import AbstractSet, Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple, Type
 
 from abc import ABC
+from copy import copy
 from datetime import datetime
+from functools import lru_cache, partial
 
 from bson import ObjectId
 from bson.objectid import InvalidId
-from pydantic import BaseConfig, BaseModel
+from pydantic import BaseConfig, BaseModel, Extra, PrivateAttr, ValidationError
+from pydantic.fields import (
+    SHAPE_DICT,
+    SHAPE_FROZENSET,
+    SHAPE_LIST,
+    SHAPE_MAPPING,
+    SHAPE_SET,
+    SHAPE_SINGLETON,
+    SHAPE_TUPLE_ELLIPSIS,
+    ModelField,
+)
+
+from .errors import InvalidQueryError
+from .reference import Reference
+
+
+PARTIAL_MODEL_CACHE_SIZE = 128
 
 
 class OID:
@@ -23,10 +41,208 @@ class OID:
             raise ValueError("Invalid object ID")
 
 
+def _needs_json(field: ModelField) -> bool:
+    """Whether values of this field are stored as JSON strings on the model (Optional[Any] fields)"""
+    for e in str(field).split(" "):
+        if "Optional[Any]".lower() in e.lower() and "type" in e.lower():
+            return True
+    return False
+
+
+# Container built for the values of sequence shaped fields on the trusted path
+_SEQUENCE_SHAPES: Dict[int, Callable[[Iterable[Any]], Any]] = {
+    SHAPE_LIST: list,
+    SHAPE_SET: set,
+    SHAPE_FROZENSET: frozenset,
+    SHAPE_TUPLE_ELLIPSIS: tuple,
+}
+_MAPPING_SHAPES = frozenset({SHAPE_MAPPING, SHAPE_DICT})
+
+
+def _needs_conversion(field: ModelField) -> bool:
+    """Whether values of the field hold embedded models, ObjectIds or references, at any depth"""
+    type_ = field.type_
+    if type_ is OID or (isinstance(type_, type) and issubclass(type_, (BaseModel, Reference))):
+        return True
+    return any(_needs_conversion(sub_field) for sub_field in field.sub_fields or ())
+
+
+def _supported_shape(shape: int) -> bool:
+    return shape == SHAPE_SINGLETON or shape in _SEQUENCE_SHAPES or shape in _MAPPING_SHAPES
+
+
+def _items(shape: int, value: Any) -> Iterable[Any]:
+    """Elements held by the value of a field of the given shape"""
+    if shape == SHAPE_SINGLETON:
+        return (value,)
+    if shape in _MAPPING_SHAPES:
+        return value.values() if isinstance(value, dict) else ()
+    if shape in _SEQUENCE_SHAPES:
+        return value if isinstance(value, list) else ()
+    return ()
+
+
+def _convert(shape: int, convert: Callable[[Any], Any], value: Any) -> Any:
+    """Applies `convert` to the elements of the value of a field of a supported shape"""
+    if shape == SHAPE_SINGLETON:
+        return convert(value)
+    if shape in _MAPPING_SHAPES:
+        return {key: convert(each) for key, each in value.items()}
+    return _SEQUENCE_SHAPES[shape](convert(each) for each in value)
+
+
+class ModelDecoder:
+    """Decoding plan for a MongoDBModel class.
+
+    Inspecting the model fields is done once, when the decoder is built, so that decoding a document
+    only does the per-field work: mapping `_id` to `id`, JSON coercion of Optional[Any] fields and
+    mapping `_id` to `id` in embedded MongoDBModel documents.
+
+    Documents are either validated by pydantic, or constructed without validation when `trusted` is set,
+    which is meant for documents that were written through the repository in the first place. On the trusted
+    path, embedded models and ObjectId values are converted in single, list, set, tuple and dict fields,
+    fields of other shapes holding them are validated.
+    """
+
+    __slots__ = ("model", "json_fields", "nested", "fields", "converted_fields", "validated_fields", "keep_extra")
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.json_fields: Tuple[str, ...] = tuple(k for k, v in model.__fields__.items() if _needs_json(v))
+        # (field name, shape, model) for every field holding embedded pydantic models
+        nested = [
+            (k, v.shape, v.type_)
+            for k, v in model.__fields__.items()
+            if isinstance(v.type_, type) and issubclass(v.type_, BaseModel)
+        ]
+        # (field name, shape, validator) for ObjectId and Reference fields
+        converted = [
+            (k, v.shape, v.type_.validate)
+            for k, v in model.__fields__.items()
+            if v.type_ is OID or (isinstance(v.type_, type) and issubclass(v.type_, Reference))
+        ]
+        self.nested: Tuple[Tuple[str, int, Type[BaseModel]], ...] = tuple(
+            field for field in nested if _supported_shape(field[1])
+        )
+        self.converted_fields: Tuple[Tuple[str, int, Callable[[Any], Any]], ...] = tuple(
+            field for field in converted if _supported_shape(field[1])
+        )
+        # Used by the trusted path only
+        self.fields: Tuple[Tuple[str, str], ...] = tuple((k, v.alias) for k, v in model.__fields__.items())
+        handled = {name for name, _, _ in self.nested + self.converted_fields}
+        self.validated_fields: Tuple[ModelField, ...] = tuple(
+            v for k, v in model.__fields__.items() if k not in handled and _needs_conversion(v)
+        )
+        self.keep_extra = model.__config__.extra == Extra.allow
+
+    def prepare(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Maps a mongodb document to model keyword arguments"""
+        id = data.pop("_id", None)  # Convert _id into id
+        for k in self.json_fields:
+            if k in data and data[k]:
+                data[k] = json.dumps(data[k])
+        for k, shape, model in self.nested:
+            value = data.get(k)
+            if value and issubclass(model, MongoDBModel):
+                for each in _items(shape, value):
+                    _map_embedded_id(each)
+        data["id"] = id
+        return data
+
+    def decode(self, data: Dict[str, Any], trusted: bool = False) -> "MongoDBModel":
+        data = self.prepare(data)
+        if trusted:
+            return self.construct(data)
+        return self.model(**data)
+
+    def construct(self, data: Dict[str, Any]) -> BaseModel:
+        """Builds a model from prepared keyword arguments without running pydantic validation"""
+        values = {}
+        for name, alias in self.fields:
+            if alias in data:
+                values[name] = data.pop(alias)
+            elif name in data:
+                values[name] = data.pop(name)
+        if self.keep_extra:
+            values.update(data)
+
+        for name, shape, validate in self.converted_fields:
+            value = values.get(name)
+            if value is not None:
+                values[name] = _convert(shape, validate, value)
+
+        for name, shape, model in self.nested:
+            value = values.get(name)
+            if value:
+                values[name] = _convert(shape, partial(_construct_embedded, model), value)
+
+        for field in self.validated_fields:
+            if values.get(field.name) is not None:
+                values[field.name] = self._validate(field, values[field.name])
+
+        return self.model.construct(_fields_set=set(values), **values)
+
+    def _validate(self, field: ModelField, value: Any) -> Any:
+        value, errors = field.validate(value, {}, loc=field.alias, cls=self.model)
+        if errors:
+            raise ValidationError([errors], self.model)
+        return value
+
+    def prepare_value(self, name: str, value: Any) -> Any:
+        """Maps the stored value of a single field like `prepare`, for documents decoded field by field"""
+        if not value:
+            return value
+        if name in self.json_fields:
+            return json.dumps(value)
+        for field, shape, model in self.nested:
+            if field == name and issubclass(model, MongoDBModel):
+                for each in _items(shape, value):
+                    _map_embedded_id(each)
+        return value
+
+    def construct_value(self, name: str, value: Any) -> Any:
+        """Converts a single prepared value like `construct`, without validation"""
+        if value is None:
+            return value
+        for field, shape, validate in self.converted_fields:
+            if field == name:
+                return _convert(shape, validate, value)
+        for field, shape, model in self.nested:
+            if field == name and value:
+                return _convert(shape, partial(_construct_embedded, model), value)
+        for field in self.validated_fields:
+            if field.name == name:
+                return self._validate(field, value)
+        return value
+
+
+def _map_embedded_id(document: Any) -> None:
+    if isinstance(document, dict) and "_id" in document and "id" not in document:
+        document["id"] = document.pop("_id")
+
+
+def _construct_embedded(model: Type[BaseModel], value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+    if issubclass(model, MongoDBModel):
+        _map_embedded_id(value)
+        return model.decoder().construct(value)
+    return _plain_decoder(model).construct(value)
+
+
+@lru_cache(maxsize=None)
+def _plain_decoder(model: Type[BaseModel]) -> ModelDecoder:
+    """Decoder of an embedded pydantic model that is not a MongoDBModel"""
+    return ModelDecoder(model)
+
+
 class MongoDBModel(BaseModel, ABC):
 
     id: Optional[OID]
 
+    # Names of the fields assigned since the model was loaded from the database, None if not loaded
+    _changed_fields: Optional[Set[str]] = PrivateAttr(default=None)
+
     class Config(BaseConfig):
         allow_population_by_field_name = True
         json_encoders = {
@@ -34,20 +250,79 @@ class MongoDBModel(BaseModel, ABC):
             ObjectId: str,
         }
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if self._changed_fields is not None and name in self.__fields__:
+            self._changed_fields.add(name)
+
+    def get_changed_fields(self) -> Optional[Set[str]]:
+        """Names of the fields assigned since the model was loaded from the database.
+
+        Returns:
+            Optional[Set[str]]: Changed field names, None if the model was not loaded from the database
+        """
+        if self._changed_fields is None:
+            return None
+        return set(self._changed_fields)
+
+    def mark_changed(self, *fields: str) -> None:
+        """Marks fields as changed, for values mutated in place (e.g. appending to a list or editing an
+        embedded model), which cannot be detected on assignment"""
+        if self._changed_fields is not None:
+            self._changed_fields.update(fields)
+
+    def track_changes(self) -> None:
+        """Starts tracking changed fields from the current state, as if the model was just loaded"""
+        object.__setattr__(self, "_changed_fields", set())
+
     @classmethod
-    def from_mongo(cls, data: Dict[str, Any]) -> Optional[Type["MongoDBModel"]]:
-        """Constructs a pydantic object from mongodb compatible dictionary"""
+    def from_mongo(cls, data: Dict[str, Any], trusted: bool = False) -> Optional[Type["MongoDBModel"]]:
+        """Constructs a pydantic object from mongodb compatible dictionary
+
+        Args:
+            data: MongoDB document
+            trusted: If True, skips pydantic validation. Only use for documents written by this model.
+
+        Returns:
+            Optional[Type[MongoDBModel]]: Model instance, or None if the document is empty
+        """
         if not data:
             return None
 
-        id = data.pop("_id", None)  # Convert _id into id
-        for k, v in cls.__fields__.items():
-            fields_data = str(v).split(" ")
-            for e in fields_data:
-                if "Optional[Any]".lower() in e.lower() and "type" in e.lower():
-                    if k in data and data[k]:
-                        data[k] = json.dumps(data[k])
-        return cls(**dict(data, id=id))
+        model = cls.decoder().decode(data, trusted=trusted)
+        model.track_changes()
+        return model
+
+    @classmethod
+    def decoder(cls) -> ModelDecoder:
+        """Returns the decoder of this model class, building it on first use"""
+        decoder = cls.__dict__.get("__mongo_decoder__")
+        if decoder is None:
+            decoder = ModelDecoder(cls)
+            setattr(cls, "__mongo_decoder__", decoder)
+        return decoder
+
+    @classmethod
+    def partial(cls, fields: AbstractSet[str]) -> Type["MongoDBModel"]:
+        """Returns a subclass of this model that only has the given fields (and `id`).
+
+        Used to decode projected documents, where fields that were not requested are missing.
+        Dotted paths such as `address.city` keep an embedded model field, narrowed to a partial model of
+        the embedded fields in turn. Partial classes are cached per set of fields in a bounded LRU cache.
+
+        Args:
+            fields: Names of the fields to keep, or dotted paths of embedded fields
+
+        Raises:
+            InvalidQueryError: If a path narrows an embedded model held in a field of unsupported shape
+
+        Returns:
+            Type[MongoDBModel]: Partial model class, or this class if all fields are kept
+        """
+        fields = frozenset(fields) | {"id"}
+        if fields.issuperset(cls.__fields__):
+            return cls
+        return _partial_model(cls, fields)
 
     def to_mongo(self, **kwargs):
         """Maps a pydantic model to a mongodb compatible dictionary"""
@@ -80,3 +355,58 @@ class MongoDBModel(BaseModel, ABC):
         kwargs.setdefault("exclude", hidden_fields)
         return super().dict(**kwargs)
 
+
+@lru_cache(maxsize=PARTIAL_MODEL_CACHE_SIZE)
+def _partial_model(model: Type[BaseModel], fields: FrozenSet[str]) -> Type[BaseModel]:
+    # Embedded paths by top-level field, None when the whole field is kept
+    paths: Dict[str, Optional[Set[str]]] = {}
+    for path in fields:
+        name, _, rest = path.partition(".")
+        if not rest:
+            paths[name] = None
+        elif paths.get(name, set()) is not None:
+            paths.setdefault(name, set()).add(rest)
+
+    # Subclassing keeps the config, validators and methods of the model, and isinstance checks working
+    partial = type(model)(f"Partial{model.__name__}", (model,), {"__module__": model.__module__})
+    partial.__fields__ = {
+        k: v if paths[k] is None else _narrowed_field(model, v, paths[k])
+        for k, v in model.__fields__.items()
+        if k in paths
+    }
+    return partial
+
+
+def _narrowed_field(model: Type[BaseModel], field: ModelField, paths: Set[str]) -> ModelField:
+    """Copy of an embedded model field whose model only has the fields of the given paths"""
+    embedded = field.type_
+    if not (isinstance(embedded, type) and issubclass(embedded, BaseModel)):
+        # Embedded paths of other values (dicts, Any...) keep the whole field
+        return field
+
+    aliases = {v.alias: k for k, v in embedded.__fields__.items()}
+    names = set()
+    for path in paths:
+        name, dot, rest = path.partition(".")
+        names.add(aliases.get(name, name) + dot + rest)
+    if issubclass(embedded, MongoDBModel):
+        names.add("id")
+    if names.issuperset(embedded.__fields__):
+        return field
+    narrowed: Any = _partial_model(embedded, frozenset(names))
+
+    if field.shape == SHAPE_LIST:
+        narrowed = List[narrowed]
+    elif field.shape in _MAPPING_SHAPES:
+        narrowed = Dict[field.key_field.type_, narrowed]
+    elif field.shape != SHAPE_SINGLETON:
+        raise InvalidQueryError(f"Cannot project embedded fields of {field.name}, project the whole field instead")
+    if field.allow_none:
+        narrowed = Optional[narrowed]
+    return ModelField.infer(
+        name=field.name,
+        value=copy(field.field_info),
+        annotation=narrowed,
+        class_validators=dict(field.class_validators),
+        config=model.__config__,
+    )
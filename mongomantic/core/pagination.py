@@ -0,0 +1,64 @@
+"""Keyset pagination continuation tokens"""
+
+from typing import Any, Dict, Generic, List, Optional, Tuple, TypeVar
+
+import base64
+import binascii
+from dataclasses import dataclass, field
+
+import bson
+from bson.errors import BSONError
+
+from .errors import InvalidQueryError
+
+__all__ = ["Page", "decode_token", "encode_token", "keyset_filter"]
+
+T = TypeVar("T")
+
+
+@dataclass
+class Page(Generic[T]):
+    """Page of results, with the token to pass as `after` to get the next page (None on the last page)"""
+
+    items: List[T] = field(default_factory=list)
+    next_token: Optional[str] = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_token is not None
+
+
+def encode_token(key: str, direction: int, value: Any, id: Any) -> str:
+    """Opaque token holding the sort key value and _id of the last document of a page"""
+    raw = bson.encode({"k": key, "d": direction, "v": value, "i": id})
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_token(token: str, key: str, direction: int) -> Tuple[Any, Any]:
+    """Sort key value and _id held by a token, which must have been created for the same sort"""
+    try:
+        data = bson.decode(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (BSONError, binascii.Error, ValueError) as e:
+        raise InvalidQueryError(f"Invalid continuation token: {e}")
+    if data.get("k") != key or data.get("d") != direction:
+        raise InvalidQueryError("Continuation token was created for a different sort")
+    return data["v"], data["i"]
+
+
+def keyset_filter(key: str, direction: int, value: Any, id: Any) -> Dict[str, Any]:
+    """Filter matching the documents after (value, id) in (key, _id) order.
+
+    Null and missing values sort before all others, and comparison operators never match them, so they are
+    matched explicitly: after a null value in ascending order all non null values follow, and in descending
+    order null values follow all others.
+    """
+    op = "$gt" if direction > 0 else "$lt"
+    if key == "_id":
+        return {"_id": {op: id}}
+    same_value = {key: value, "_id": {op: id}}
+    if value is None:
+        return {"$or": [{key: {"$ne": None}}, same_value]} if direction > 0 else same_value
+    clauses = [{key: {op: value}}, same_value]
+    if direction < 0:
+        clauses.append({key: None})
+    return {"$or": clauses}
@@ -0,0 +1,238 @@
+"""Cursors read from background threads: parallel scans over ranges of an indexed field, and read-ahead"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Full, Queue
+
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+
+from .errors import UNRECOGNIZED_PIPELINE_STAGE
+
+__all__ = ["partition_bounds", "range_filters", "parallel_scan", "read_ahead"]
+
+PUT_TIMEOUT = 0.1
+
+
+class _Done:
+    """Marks the end of a partition"""
+
+
+class _Failure:
+    """Exception raised while reading a partition, re-raised to the consumer"""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def partition_bounds(collection: Collection, filter: Dict, key: str, partitions: int) -> List[Any]:
+    """Values of `key` splitting the documents matching `filter` into `partitions` ranges of similar size.
+
+    Bounds are the smallest values of the buckets of a single `$bucketAuto` aggregation on `key`. Servers
+    (and mocks) without `$bucketAuto` read them from the sort order of `key` at evenly spaced offsets instead,
+    which walks the index on `key` once per bound. Repeated values are dropped, so there may be fewer ranges
+    for fields with few distinct values.
+    """
+    if partitions <= 1:
+        return []
+
+    pipeline = [{"$match": filter}, {"$bucketAuto": {"groupBy": f"${key}", "buckets": partitions}}]
+    try:
+        buckets = list(collection.aggregate(pipeline, allowDiskUse=True))
+    except OperationFailure as e:
+        if e.code != UNRECOGNIZED_PIPELINE_STAGE:
+            raise
+        return _skip_bounds(collection, filter, key, partitions)
+    except NotImplementedError:
+        return _skip_bounds(collection, filter, key, partitions)
+
+    # The smallest value starts the first range, it is not a bound
+    bounds: List[Any] = []
+    for bucket in buckets[1:]:
+        value = bucket["_id"]["min"]
+        if value is not None and (not bounds or value != bounds[-1]):
+            bounds.append(value)
+    return bounds
+
+
+def _skip_bounds(collection: Collection, filter: Dict, key: str, partitions: int) -> List[Any]:
+    """Bounds of `partition_bounds`, read with one skip query per bound"""
+    count = collection.count_documents(filter)
+    if count < partitions:
+        return []
+
+    bounds: List[Any] = []
+    previous = None
+    for i in range(partitions):
+        documents = list(
+            collection.find(filter, projection={key: 1}, sort=[(key, ASCENDING)], skip=i * count // partitions, limit=1)
+        )
+        value = _get_key(documents[0], key) if documents else None
+        # The smallest value starts the first range, it is not a bound
+        if i and value is not None and value != previous:
+            bounds.append(value)
+        previous = value
+    return bounds
+
+
+def range_filters(filter: Dict, key: str, bounds: List[Any]) -> List[Dict]:
+    """Filter of every range delimited by `bounds`, together covering all documents matching `filter` once.
+
+    The first range also holds the documents where `key` is missing, null, or of another type than the bounds.
+    """
+    if not bounds:
+        return [filter]
+
+    ranges = [{key: {"$not": {"$gte": bounds[0]}}}]
+    ranges.extend({key: {"$gte": lower, "$lt": upper}} for lower, upper in zip(bounds, bounds[1:]))
+    ranges.append({key: {"$gte": bounds[-1]}})
+    if not filter:
+        return ranges
+    return [{"$and": [filter, part]} for part in ranges]
+
+
+def parallel_scan(
+    collection: Collection,
+    filters: List[Dict],
+    projection: Optional[Dict] = None,
+    sort: Optional[List[Tuple[str, int]]] = None,
+    transform: Optional[Callable[[List[Dict]], List[Any]]] = None,
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    queue_size: int = 16,
+    chunk_size: int = 500,
+) -> Iterator[Any]:
+    """Reads every filter on its own cursor in a thread pool, yielding documents (or transformed documents).
+
+    Documents are passed from the reading threads in chunks of `chunk_size`, through queues bounded to
+    `queue_size` chunks, so readers wait for the consumer instead of buffering the collection. `transform`
+    is called on every chunk in the reading thread. With `ordered`, all documents of a filter are yielded
+    before those of the next one, otherwise chunks are yielded as soon as they are read.
+
+    Closing the generator stops the readers.
+    """
+    stop = threading.Event()
+    if ordered:
+        queues = [Queue(maxsize=queue_size) for _ in filters]
+    else:
+        queues = [Queue(maxsize=queue_size)] * len(filters)
+
+    executor = ThreadPoolExecutor(max_workers=workers or len(filters))
+    futures = [
+        executor.submit(_read, collection, part, projection, sort, transform, chunk_size, queue, stop)
+        for part, queue in zip(filters, queues)
+    ]
+    try:
+        if ordered:
+            for queue in queues:
+                yield from _drain(queue, 1)
+        else:
+            yield from _drain(queues[0], len(filters))
+    finally:
+        stop.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def read_ahead(cursor: Iterable[Dict], depth: int, chunk_size: int) -> Iterator[Dict]:
+    """Iterates a cursor from a background thread, which fetches up to `depth` chunks of `chunk_size`
+    documents ahead of the consumer, so that network reads overlap with the work done on each document.
+
+    The cursor is only used by the background thread. Closing the generator stops the thread.
+    """
+    stop = threading.Event()
+    queue: Queue = Queue(maxsize=depth)
+    thread = threading.Thread(target=_fill, args=(cursor, None, chunk_size, queue, stop), daemon=True)
+    thread.start()
+    try:
+        yield from _drain(queue, 1)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _drain(queue: Queue, partitions: int) -> Iterator[Any]:
+    """Yields the documents of a queue until `partitions` partitions are done"""
+    while partitions:
+        item = queue.get()
+        if item is _Done:
+            partitions -= 1
+        elif isinstance(item, _Failure):
+            raise item.error
+        else:
+            yield from item
+
+
+def _read(
+    collection: Collection,
+    filter: Dict,
+    projection: Optional[Dict],
+    sort: Optional[List[Tuple[str, int]]],
+    transform: Optional[Callable[[List[Dict]], List[Any]]],
+    chunk_size: int,
+    queue: Queue,
+    stop: threading.Event,
+) -> None:
+    try:
+        cursor = collection.find(filter, projection=projection, sort=sort, batch_size=chunk_size)
+    except Exception as e:
+        _put(queue, _Failure(e), stop)
+        return
+    _fill(cursor, transform, chunk_size, queue, stop)
+
+
+def _fill(
+    cursor: Iterable[Dict],
+    transform: Optional[Callable[[List[Dict]], List[Any]]],
+    chunk_size: int,
+    queue: Queue,
+    stop: threading.Event,
+) -> None:
+    """Puts the documents of a cursor in a queue, in chunks, followed by _Done or a _Failure"""
+    try:
+        try:
+            chunk: List[Dict] = []
+            for document in cursor:
+                if stop.is_set():
+                    return
+                chunk.append(document)
+                if len(chunk) >= chunk_size:
+                    if not _put(queue, transform(chunk) if transform else chunk, stop):
+                        return
+                    chunk = []
+            if chunk and not _put(queue, transform(chunk) if transform else chunk, stop):
+                return
+        finally:
+            close = getattr(cursor, "close", None)
+            if close is not None:
+                close()
+    except Exception as e:
+        _put(queue, _Failure(e), stop)
+        return
+    _put(queue, _Done, stop)
+
+
+def _put(queue: Queue, item: Any, stop: threading.Event) -> bool:
+    """Puts an item, waiting for room in the queue unless the scan is stopped"""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=PUT_TIMEOUT)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def _get_key(document: Dict, key: str) -> Any:
+    value: Any = document
+    for segment in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(segment)
+    return value
@@ -0,0 +1,207 @@
+"""Query expressions: `field__operator=value` lookups and Q objects combined with &, | and ~"""
+
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from functools import lru_cache
+
+from bson import ObjectId
+from bson.objectid import InvalidId
+from pydantic.fields import SHAPE_DICT, SHAPE_MAPPING
+
+from .errors import FieldDoesNotExistError, InvalidQueryError
+from .mongo_model import MongoDBModel
+
+__all__ = ["Q", "OPERATORS", "compile_lookups"]
+
+LOOKUP_SEPARATOR = "__"
+_OPEN = object()
+QUERY_SHAPE_CACHE_SIZE = 1024
+
+OPERATORS = {
+    "ne": "$ne",
+    "gt": "$gt",
+    "gte": "$gte",
+    "lt": "$lt",
+    "lte": "$lte",
+    "in": "$in",
+    "nin": "$nin",
+    "all": "$all",
+    "exists": "$exists",
+    "regex": "$regex",
+    "size": "$size",
+}
+
+
+class Q:
+    """Query expression built from lookups, combined with `&` (and), `|` (or) and `~` (not).
+
+    Lookups are keyword arguments of the form `field=value` for equality, or `field__operator=value`
+    (see OPERATORS). Fields of embedded models are reached with `__` as well.
+
+    Example::
+
+        UserRepository.find(Q(age__gte=18) | Q(address__city__in=["Paris", "Beirut"]), active=True)
+        UserRepository.count(~Q(email__regex="@example.com$"))
+    """
+
+    __slots__ = ("connector", "children", "lookups", "negated")
+
+    AND = "$and"
+    OR = "$or"
+
+    def __init__(self, **lookups: Any):
+        self.connector = self.AND
+        self.children: List["Q"] = []
+        self.lookups = lookups
+        self.negated = False
+
+    @classmethod
+    def _combine(cls, connector: str, children: List["Q"]) -> "Q":
+        q = cls()
+        q.connector = connector
+        for child in children:
+            # Flatten nested expressions with the same connector
+            if child.connector == connector and not child.negated and not child.lookups:
+                q.children.extend(child.children)
+            else:
+                q.children.append(child)
+        return q
+
+    def __and__(self, other: "Q") -> "Q":
+        return self._combine(self.AND, [self, other])
+
+    def __or__(self, other: "Q") -> "Q":
+        return self._combine(self.OR, [self, other])
+
+    def __invert__(self) -> "Q":
+        # Copy with the negation toggled, so that ~~q compiles to the same filter as q
+        q = type(self)(**self.lookups)
+        q.connector = self.connector
+        q.children = list(self.children)
+        q.negated = not self.negated
+        return q
+
+    def __repr__(self) -> str:
+        parts = [f"{k}={v!r}" for k, v in self.lookups.items()] + [repr(child) for child in self.children]
+        joined = f" {'&' if self.connector == self.AND else '|'} ".join(parts)
+        return f"{'~' if self.negated else ''}Q({joined})"
+
+    def compile(self, model: Type[MongoDBModel]) -> Dict[str, Any]:
+        """MongoDB filter document of this expression, checked against the fields of `model`"""
+        parts = []
+        if self.lookups:
+            parts.append(compile_lookups(model, self.lookups))
+        parts.extend(child.compile(model) for child in self.children)
+        parts = [part for part in parts if part]
+
+        if not parts:
+            compiled: Dict[str, Any] = {}
+        elif len(parts) == 1:
+            compiled = parts[0]
+        else:
+            compiled = {self.connector: parts}
+
+        if self.negated:
+            return {"$nor": [compiled]}
+        return compiled
+
+
+def compile_lookups(model: Type[MongoDBModel], lookups: Dict[str, Any]) -> Dict[str, Any]:
+    """MongoDB filter document matching all lookups.
+
+    The keys are parsed once per model and set of keys (query shape), only values are processed per call.
+
+    Raises:
+        FieldDoesNotExistError: If a lookup refers to a field that does not exist
+        InvalidQueryError: If a lookup value is not a valid ObjectId for an id field
+    """
+    shape = _compile_shape(model, tuple(lookups))
+
+    compiled: Dict[str, Any] = {}
+    conflicts: List[Dict[str, Any]] = []
+    for key, path, operator, is_id in shape:
+        value = lookups[key]
+        if is_id:
+            value = _to_object_ids(value, operator)
+
+        if operator is None:
+            if path in compiled:
+                conflicts.append({path: value})
+            else:
+                compiled[path] = value
+            continue
+
+        existing = compiled.get(path)
+        if existing is None:
+            compiled[path] = {operator: value}
+        elif isinstance(existing, dict) and operator not in existing and not _is_document(existing):
+            compiled[path] = {**existing, operator: value}
+        else:
+            conflicts.append({path: {operator: value}})
+
+    if conflicts:
+        return {"$and": [compiled, *conflicts]}
+    return compiled
+
+
+@lru_cache(maxsize=QUERY_SHAPE_CACHE_SIZE)
+def _compile_shape(
+    model: Type[MongoDBModel], keys: Tuple[str, ...]
+) -> Tuple[Tuple[str, str, Optional[str], bool], ...]:
+    """(key, document path, operator, is an id path) for every lookup key"""
+    return tuple((key, *_parse_lookup(model, key)) for key in keys)
+
+
+def _parse_lookup(model: Type[MongoDBModel], key: str) -> Tuple[str, Optional[str], bool]:
+    if key == "_id" or key in model.__fields__:
+        # Plain `_id` values are passed through untouched, e.g. for raw operators
+        return _field_path(model, [key]), None, key == "id"
+
+    segments = key.split(LOOKUP_SEPARATOR)
+    operator = None
+    if len(segments) > 1 and segments[-1] in OPERATORS:
+        operator = OPERATORS[segments.pop()]
+    return _field_path(model, segments), operator, segments == ["id"] or segments == ["_id"]
+
+
+def _field_path(model: Type[MongoDBModel], segments: List[str]) -> str:
+    """Dotted document path of field segments, mapping field names to aliases through embedded models"""
+    if segments[0] in ("id", "_id"):
+        if len(segments) > 1:
+            raise FieldDoesNotExistError(f"Field {'.'.join(segments)} does not exist for model {model}")
+        return "_id"
+
+    path: List[str] = []
+    current: Optional[Type] = model
+    for segment in segments:
+        if current is _OPEN:
+            # Keys of dict or Any fields cannot be checked
+            path.append(segment)
+            continue
+        field = current.__fields__.get(segment) if current is not None else None
+        if field is None:
+            raise FieldDoesNotExistError(f"Field {'.'.join(path + [segment])} does not exist for model {model}")
+        path.append(field.alias)
+        if isinstance(field.type_, type) and issubclass(field.type_, MongoDBModel):
+            current = field.type_
+        elif field.type_ in (Any, dict) or field.shape in (SHAPE_MAPPING, SHAPE_DICT):
+            current = _OPEN
+        else:
+            current = None
+    return ".".join(path)
+
+
+def _is_document(value: Dict) -> bool:
+    """Whether a dict is a document to match by equality, rather than operators"""
+    return any(not key.startswith("$") for key in value)
+
+
+def _to_object_ids(value: Any, operator: Optional[str]) -> Any:
+    try:
+        if operator in ("$in", "$nin", "$all"):
+            return [ObjectId(str(each)) for each in value]
+        if operator in (None, "$ne", "$gt", "$gte", "$lt", "$lte"):
+            return ObjectId(str(value))
+    except InvalidId:
+        raise InvalidQueryError(f"Invalid ObjectId {value}.")
+    return value
@@ -0,0 +1,66 @@
+"""Typed references to documents of other models"""
+
+from typing import Any, ClassVar, Dict, Optional, Type
+
+from bson import ObjectId
+from bson.objectid import InvalidId
+
+__all__ = ["Reference"]
+
+
+class Reference(ObjectId):
+    """ObjectId of a document of another MongoDBModel, declared on a model as `Reference[Model]`.
+
+    References are stored as plain ObjectIds. The referenced model is available as `document` once
+    prefetched, e.g. with `find(prefetch=["customer"])`.
+
+    Example::
+
+        class Order(MongoDBModel):
+            customer: Reference[Customer]
+            total: float
+
+        for order in OrderRepository.find(prefetch=["customer"]):
+            order.customer.document.name
+    """
+
+    __slots__ = ("_document",)
+
+    model: ClassVar[Optional[Type]] = None
+    _typed: ClassVar[Dict[Type, Type["Reference"]]] = {}
+
+    def __class_getitem__(cls, model: Type) -> Type["Reference"]:
+        typed = cls._typed.get(model)
+        if typed is None:
+            name = getattr(model, "__name__", str(model))
+            typed = type(f"Reference[{name}]", (Reference,), {"__slots__": (), "model": model})
+            cls._typed[model] = typed
+        return typed
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, v: Any) -> "Reference":
+        if isinstance(v, cls):
+            return v
+        if cls.model is not None and isinstance(v, cls.model):
+            if v.id is None:
+                raise ValueError("Referenced model has no id, it must be saved first")
+            reference = cls(v.id)
+            reference._document = v
+            return reference
+        try:
+            return cls(str(v))
+        except (InvalidId, TypeError):
+            raise ValueError("Invalid object ID")
+
+    @property
+    def document(self) -> Optional[Any]:
+        """Referenced model, None if it was not prefetched or does not exist"""
+        return getattr(self, "_document", None)
+
+    @document.setter
+    def document(self, value: Optional[Any]) -> None:
+        self._document = value
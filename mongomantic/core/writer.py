@@ -0,0 +1,284 @@
+"""Write-behind writer buffering saves of a repository and flushing them in batches from a background thread"""
+
+from typing import TYPE_CHECKING, Callable, List, NamedTuple, Optional, Tuple, Type
+
+import atexit
+import contextvars
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+
+from bson import ObjectId
+from mongomantic.config import logger
+
+from .bulk import BulkOperations
+from .database import on_disconnect
+from .errors import FieldDoesNotExistError, InvalidQueryError, PartialWriteError, WriteError
+from .mongo_model import MongoDBModel
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .base_repository import BaseRepository
+
+__all__ = ["BatchWriter", "WriterStats"]
+
+ErrorCallback = Callable[[Exception, List[MongoDBModel]], None]
+
+_writers: "weakref.WeakSet[BatchWriter]" = weakref.WeakSet()
+
+
+@dataclass
+class WriterStats:
+    """Counters of a BatchWriter since it was created, flush times are in seconds"""
+
+    flushes: int = 0
+    written: int = 0
+    failed: int = 0
+    pending: int = 0
+    last_batch_size: int = 0
+    max_batch_size: int = 0
+    last_flush_time: float = 0.0
+    max_flush_time: float = 0.0
+    total_flush_time: float = 0.0
+
+    @property
+    def average_batch_size(self) -> float:
+        return (self.written + self.failed) / self.flushes if self.flushes else 0.0
+
+    @property
+    def average_flush_time(self) -> float:
+        return self.total_flush_time / self.flushes if self.flushes else 0.0
+
+
+class _Operation(NamedTuple):
+    model: MongoDBModel
+    on: Optional[Tuple[str, ...]]  # Fields to match on for upserts, None for inserts
+    added: float
+
+
+class BatchWriter:
+    """Buffers inserts and upserts of a repository, written with one bulk write per batch.
+
+    A background thread flushes the buffer as soon as it holds `batch_size` operations, or its oldest
+    operation is `max_age` seconds old. Once `max_pending` operations are buffered, `save` and `upsert`
+    block until there is room again (backpressure), raising WriteError after `timeout` seconds.
+
+    Writes happen after `save` returns, so failures are passed to `on_error` together with the models of the
+    batch: a PartialWriteError when some operations failed (e.g. duplicate keys), or the exception raised
+    when the batch could not be written at all. Without `on_error`, failures are logged.
+
+    Writers are flushed and stopped by `close`, when leaving a `with` block, when their connection is closed by
+    `disconnect` and at exit.
+
+    Example::
+
+        with EventRepository.writer(batch_size=1000, max_age=0.5, on_error=report) as writer:
+            for event in events:
+                writer.save(event)
+    """
+
+    def __init__(
+        self,
+        repository: Type["BaseRepository"],
+        batch_size: int = 500,
+        max_age: float = 1.0,
+        max_pending: int = 10000,
+        on_error: Optional[ErrorCallback] = None,
+    ):
+        if batch_size <= 0 or max_pending < batch_size:
+            raise ValueError("batch_size must be positive and max_pending at least batch_size")
+        self.repository = repository
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.on_error = on_error
+
+        self._buffer: List[_Operation] = []
+        self._in_flight = 0
+        self._flush_requested = False
+        self._closed = False
+        self._stats = WriterStats()
+        self._condition = threading.Condition()
+        # Connection the batches are written to, closing it closes the writer
+        self._alias = repository._route()[0]
+        # Batches are written with the connection overrides active where the writer was created
+        self._thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(self._run,),
+            name=f"BatchWriter-{repository.__name__}",
+            daemon=True,
+        )
+        self._thread.start()
+        _writers.add(self)
+
+    def __enter__(self) -> "BatchWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def save(self, model: MongoDBModel, timeout: Optional[float] = None) -> MongoDBModel:
+        """Buffers an insert of the model, or an upsert on its id if it already has one.
+
+        Models without an id are given one right away, so that they can be referenced before being written.
+
+        Raises:
+            WriteError: If the writer is closed, or the buffer stayed full for `timeout` seconds
+        """
+        if model.id is None:
+            model.id = ObjectId()
+            on = None
+        else:
+            # Already saved, or with an id of its own: inserting it again would fail on a duplicate key
+            on = ("id",)
+        self._add(_Operation(model, on, time.monotonic()), timeout)
+        return model
+
+    def upsert(self, model: MongoDBModel, on: List[str], timeout: Optional[float] = None) -> MongoDBModel:
+        """Buffers an upsert of the model, matching the stored document on the values of the `on` fields"""
+        if not on:
+            raise InvalidQueryError("upsert requires at least one field to match on")
+        for name in on:
+            if name in ("id", "_id"):
+                if model.id is None:
+                    raise InvalidQueryError("Cannot upsert on id, the model has no id")
+            elif name not in model.__fields__:
+                raise FieldDoesNotExistError(f"Field {name} does not exist for model {type(model)}")
+        self._add(_Operation(model, tuple(on), time.monotonic()), timeout)
+        return model
+
+    def _add(self, operation: _Operation, timeout: Optional[float]) -> None:
+        with self._condition:
+            has_room = self._condition.wait_for(
+                lambda: self._closed or len(self._buffer) < self.max_pending, timeout=timeout
+            )
+            if self._closed:
+                raise WriteError("BatchWriter is closed")
+            if not has_room:
+                raise WriteError(f"BatchWriter buffer is full ({self.max_pending} pending operations)")
+            self._buffer.append(operation)
+            # The background thread waits for a first operation to start its age timer, then for a full batch
+            if len(self._buffer) == 1 or len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Writes all buffered operations, waiting until they are written.
+
+        Returns:
+            bool: False if the operations were not all written within `timeout` seconds
+        """
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._buffer and not self._in_flight, timeout=timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flushes the buffered operations and stops the background thread. Further saves raise WriteError."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        _writers.discard(self)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self) -> WriterStats:
+        """Snapshot of the writer counters"""
+        with self._condition:
+            return WriterStats(**{**self._stats.__dict__, "pending": len(self._buffer) + self._in_flight})
+
+    def _next_batch(self) -> Optional[List[_Operation]]:
+        """Waits for a batch to write, None once closed and empty"""
+        with self._condition:
+            while True:
+                if self._buffer:
+                    age = time.monotonic() - self._buffer[0].added
+                    if (
+                        len(self._buffer) >= self.batch_size
+                        or age >= self.max_age
+                        or self._flush_requested
+                        or self._closed
+                    ):
+                        break
+                    self._condition.wait(self.max_age - age)
+                    continue
+                self._flush_requested = False
+                if self._closed:
+                    return None
+                self._condition.wait()
+
+            batch = self._buffer[: self.batch_size]
+            del self._buffer[: self.batch_size]
+            self._in_flight = len(batch)
+            # Room for blocked producers
+            self._condition.notify_all()
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            finally:
+                with self._condition:
+                    self._in_flight = 0
+                    self._condition.notify_all()
+
+    def _write(self, batch: List[_Operation]) -> None:
+        models = [operation.model for operation in batch]
+        start = time.perf_counter()
+        error: Optional[Exception] = None
+        failed = len(batch)
+        try:
+            operations = BulkOperations(self.repository)
+            for operation in batch:
+                if operation.on is None:
+                    operations.insert(operation.model)
+                else:
+                    operations.upsert(operation.model, list(operation.on))
+            result = operations.execute(chunk_size=len(batch))
+            failed = len(result.errors)
+            if result.errors:
+                error = PartialWriteError(
+                    f"{failed} of {len(batch)} buffered writes failed", errors=result.errors, result=result
+                )
+        except Exception as e:
+            error = e
+        elapsed = time.perf_counter() - start
+
+        with self._condition:
+            stats = self._stats
+            stats.flushes += 1
+            stats.written += len(batch) - failed
+            stats.failed += failed
+            stats.last_batch_size = len(batch)
+            stats.max_batch_size = max(stats.max_batch_size, len(batch))
+            stats.last_flush_time = elapsed
+            stats.max_flush_time = max(stats.max_flush_time, elapsed)
+            stats.total_flush_time += elapsed
+
+        if error is not None:
+            self._report(error, models)
+
+    def _report(self, error: Exception, models: List[MongoDBModel]) -> None:
+        if self.on_error is None:
+            logger.error(f"BatchWriter of {self.repository.__name__} failed to write a batch: {error}")
+            return
+        try:
+            self.on_error(error, models)
+        except Exception:
+            logger.exception("BatchWriter error callback failed")
+
+
+@on_disconnect
+@atexit.register
+def close_writers(alias: Optional[str] = None) -> None:
+    """Flushes and stops the open writers of the connection named `alias`, or all open writers"""
+    for writer in list(_writers):
+        if alias is None or writer._alias == alias:
+            writer.close()
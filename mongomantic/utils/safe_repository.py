@@ -1,7 +1,7 @@
 """SafeRepository is a subclass of BaseRepository that handles all raised errors
 """
 
-from typing import Dict, Iterator, List, Type
+from typing import Dict, Iterator, List, Optional, Type
 
 from mongomantic.config import logger
 from mongomantic.core.base_repository import BaseRepository
@@ -30,17 +30,17 @@ class SafeRepository(BaseRepository):
             return None
 
     @classmethod
-    def get(cls, **kwargs) -> Type[MongoDBModel]:
+    def get(cls, *queries, **kwargs) -> Type[MongoDBModel]:
         try:
-            return super().get(**kwargs)
+            return super().get(*queries, **kwargs)
         except (DoesNotExistError, MultipleObjectsReturnedError) as e:
             logger.error(e)
             return None
 
     @classmethod
-    def find(cls, **kwargs) -> Iterator[Type[MongoDBModel]]:
+    def find(cls, *queries, **kwargs) -> Iterator[Type[MongoDBModel]]:
         try:
-            gen = super().find(**kwargs)
+            gen = super().find(*queries, **kwargs)
             try:
                 yield from gen
             except InvalidQueryError as e:
@@ -52,9 +52,9 @@ class SafeRepository(BaseRepository):
             return None
 
     @classmethod
-    def aggregate(cls, pipeline: List[Dict]):
+    def aggregate(cls, pipeline: List[Dict], trusted: Optional[bool] = None, **kwargs):
         try:
-            gen = super().aggregate(pipeline)
+            gen = super().aggregate(pipeline, trusted=trusted, **kwargs)
             try:
                 yield from gen
             except InvalidQueryError as e:
@@ -0,0 +1,10 @@
+class CountingCollection:
+    """Wraps a collection, counting find calls"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.finds = 0
+
+    def find(self, *args, **kwargs):
+        self.finds += 1
+        return self.collection.find(*args, **kwargs)
@@ -1,6 +1,9 @@
 import pytest
-from mongomantic import BaseRepository, Index, MongoDBModel
-from mongomantic.core.errors import WriteError
+from mongomantic import BaseRepository, Index, MongoDBModel, connect, ensure_indexes
+from mongomantic.core.database import MongomanticClient
+from mongomantic.core.errors import PartialWriteError, WriteError
+from mongomantic.core.index import index_spec
+from pymongo import IndexModel
 
 
 class User(MongoDBModel):
@@ -66,3 +69,89 @@ def test_index_different_user(mongodb, repo):
 
     ok_user = User(name="John", age=30, email="otherotherjohn@mail.com")
     assert repo.save(ok_user)
+
+
+def test_index_save_many_partial_failure(mongodb, repo):
+    users = [
+        User(name="John", age=1, email="john@mail.com"),
+        User(name="Jane", age=2, email="john@mail.com"),
+        User(name="Jack", age=3, email="jack@mail.com"),
+        User(name="Jill", age=4, email="jack@mail.com"),
+        User(name="Joe", age=5, email="joe@mail.com"),
+    ]
+
+    with pytest.raises(PartialWriteError) as e:
+        repo.save_many(iter(users), chunk_size=2, returning="count")
+
+    assert e.value.result == 3
+    assert sorted(error["index"] for error in e.value.errors) == [1, 3]
+    assert repo.count() == 3
+
+
+def test_collection_handle_cached_per_connection(mongodb, repo):
+    collection = repo._get_collection()
+    assert repo._get_collection() is collection
+
+    collection.drop_indexes()
+    connect("localhost:27017", "other", mock=True)
+    # New connection, new handle and indexes
+    assert repo._get_collection() is not collection
+    assert "email_index" in repo._get_collection().index_information()
+
+
+def test_index_spec():
+    declared = Index(name="email_index", unique=True, fields=["+email"]).to_index_model().document
+    stored = {"key": [("email", 1.0)], "unique": True, "v": 2}
+    assert index_spec(declared) == index_spec(stored)
+    assert index_spec(declared) != index_spec({"key": [("email", 1)], "v": 2})
+
+    text = Index(fields=["$name", "$bio"]).to_index_model().document
+    stored_text = {"key": [("_fts", "text"), ("_ftsx", 1)], "weights": {"bio": 1, "name": 1}, "v": 2}
+    assert index_spec(text) == index_spec(stored_text)
+
+
+def test_ensure_indexes(mongodb, repo):
+    collection = MongomanticClient.db["user"]
+    collection.create_indexes(
+        [
+            # Same name, not unique
+            IndexModel([("email", 1)], name="email_index"),
+            # Same keys, other name
+            IndexModel([("age", 1), ("name", -1)], name="age_name"),
+            IndexModel([("name", 1)], name="stale"),
+        ]
+    )
+
+    (report,) = ensure_indexes([repo])
+    assert report.collection == "user"
+    assert sorted(report.conflicting) == ["age_name", "email_index"]
+    assert report.stale == ["stale"]
+    assert report.created == []
+    assert report.dropped == []
+    # Ready, the first query does not sync indexes again
+    assert repo.__dict__["_handles"]["default"][0] is MongomanticClient.db
+
+    (report,) = ensure_indexes([repo], drop=True)
+    assert sorted(report.dropped) == ["age_name", "email_index", "stale"]
+    assert sorted(report.created) == ["email_index", "name_age"]
+    indexes = collection.index_information()
+    assert sorted(indexes) == ["_id_", "email_index", "name_age"]
+    assert indexes["email_index"]["unique"]
+
+    (report,) = ensure_indexes([repo])
+    assert sorted(report.unchanged) == ["email_index", "name_age"]
+    assert not (report.created or report.conflicting or report.stale)
+
+
+def test_ensure_indexes_all_repositories(mongodb, repo):
+    class NoIndexes(BaseRepository):
+        class Meta:
+            model = User
+            collection = "no_indexes"
+
+    MongomanticClient.db["no_indexes"].create_index("name")
+    reports = {report.collection: report for report in ensure_indexes(drop=True)}
+
+    assert "no_indexes" not in reports
+    assert "name_1" in MongomanticClient.db["no_indexes"].index_information()
+    assert sorted(reports["user"].created) == ["email_index", "name_age"]
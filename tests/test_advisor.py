@@ -0,0 +1,97 @@
+import pytest
+from mongomantic import BaseRepository, Index, Q
+from mongomantic.core.advisor import INDEXED, PARTIAL, UNINDEXED, IndexAdvisor, QueryShape, classify, query_shapes
+from mongomantic.core.errors import UnindexedQueryError
+
+from .user import User, john
+
+
+class IndexedUserRepository(BaseRepository):
+    class Meta:
+        model = User
+        collection = "indexed_user"
+        indexes = [
+            Index(name="email_index", unique=True, fields=["+email"]),
+            Index(name="last_age", fields=["+last_name", "-age"]),
+            Index(name="first_last", fields=["+first_name", "+last_name"]),
+        ]
+
+
+def shape(equality=(), ranges=(), sort=()):
+    return QueryShape("indexed_user", tuple(equality), tuple(ranges), tuple(sort))
+
+
+def test_query_shapes():
+    assert query_shapes({}) == [(frozenset(), frozenset())]
+    assert query_shapes({"age": {"$gte": 18}, "email": "a", "last_name": {"$in": ["a", "b"]}}) == [
+        (frozenset({"email", "last_name"}), frozenset({"age"}))
+    ]
+    assert query_shapes({"$and": [{"age": {"$lt": 5}}, {"age": 3}]}) == [(frozenset({"age"}), frozenset())]
+    assert query_shapes({"age": 1, "$or": [{"email": "a"}, {"first_name": {"$ne": "b"}}], "$nor": [{"x": 1}]}) == [
+        (frozenset({"age", "email"}), frozenset()),
+        (frozenset({"age"}), frozenset({"first_name"})),
+    ]
+
+
+@pytest.mark.parametrize(
+    "query_shape, coverage, index",
+    [
+        (shape(), INDEXED, None),
+        (shape(["_id"]), INDEXED, "_id_"),
+        (shape(["email", "age"]), INDEXED, "email_index"),
+        (shape(["last_name"], ["age"]), INDEXED, "last_age"),
+        (shape(["last_name"], sort=[("age", 1)]), INDEXED, "last_age"),
+        (shape(["last_name"], ["age"], sort=[("age", -1)]), INDEXED, "last_age"),
+        (shape(["first_name"], sort=[("last_name", 1)]), INDEXED, "first_last"),
+        (shape(["first_name"], ["last_name"]), INDEXED, "first_last"),
+        (shape(["first_name", "last_name"], sort=[("first_name", -1), ("age", 1)]), PARTIAL, "last_age"),
+        (shape(["last_name", "age"], sort=[("first_name", 1)]), PARTIAL, "last_age"),
+        (shape(["last_name"], ["first_name"]), PARTIAL, "first_last"),
+        (shape(sort=[("last_name", 1), ("age", 1)]), PARTIAL, "last_age"),
+        (shape(ranges=["email"]), INDEXED, "email_index"),
+        (shape(["age"]), UNINDEXED, None),
+        (shape(sort=[("age", 1), ("_id", 1)]), UNINDEXED, None),
+    ],
+)
+def test_classify(query_shape, coverage, index):
+    assert classify(IndexedUserRepository, query_shape) == (coverage, index)
+
+
+def test_advisor_records_repository_calls(mongodb):
+    IndexedUserRepository.save_many([john(i) for i in range(3)])
+    IndexedUserRepository.count(age=20)
+
+    with IndexAdvisor() as advisor:
+        IndexedUserRepository.get(email="john0@google.com")
+        list(IndexedUserRepository.find(last_name="Smith", sort="-age"))
+        list(IndexedUserRepository.find(last_name="Smith", sort="first_name"))
+        for i in range(3):
+            IndexedUserRepository.count(age=20 + i)
+        IndexedUserRepository.exists(age=30)
+        IndexedUserRepository.delete_many(Q(first_name="John1") | Q(age__gt=21))
+        IndexedUserRepository.paginate(sort="age", limit=2)
+        list(IndexedUserRepository.find())
+
+    # Not recorded once stopped
+    IndexedUserRepository.count(age=20)
+
+    report = advisor.report()
+    assert [(usage.coverage, usage.calls, str(usage.shape)) for usage in report.shapes] == [
+        (UNINDEXED, 4, "indexed_user {age: eq}"),
+        (UNINDEXED, 1, "indexed_user {age: range}"),
+        (UNINDEXED, 1, "indexed_user {} sort [age, _id]"),
+        (PARTIAL, 1, "indexed_user {last_name: eq} sort [first_name]"),
+        (INDEXED, 1, "indexed_user {email: eq}"),
+        (INDEXED, 1, "indexed_user {first_name: eq}"),
+        (INDEXED, 1, "indexed_user {last_name: eq} sort [-age]"),
+        (INDEXED, 1, "indexed_user {}"),
+    ]
+    assert report.shapes[0].operations == {"count": 3, "exists": 1}
+    assert report.shapes[3].index == "first_last"
+    assert len(report.problems(allow_partial=True)) == 3
+
+    with pytest.raises(UnindexedQueryError, match="4 query shapes"):
+        report.check()
+
+    advisor.reset()
+    advisor.report().check()
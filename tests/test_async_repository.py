@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+import pytest
+from mongomantic import AsyncBaseRepository
+from mongomantic.core.async_repository import AsyncBackend, ThreadPoolBackend
+from mongomantic.core.errors import DoesNotExistError, InvalidQueryError
+
+from .user import User, john
+from .user_repository import UserRepository
+
+
+class AsyncUserRepository(AsyncBaseRepository):
+    class Meta:
+        model = User
+        collection = "user"
+
+
+class CountingBackend(AsyncBackend):
+    """Thread pool backend recording the highest number of calls running at once"""
+
+    def __init__(self):
+        self.pool = ThreadPoolBackend(max_workers=8)
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    async def run(self, func, *args, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            return await self.pool.run(func, *args, **kwargs)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_async_repository_definition():
+    assert AsyncUserRepository.sync_repository.Meta is AsyncUserRepository.Meta
+
+    with pytest.raises(NotImplementedError):
+
+        class NoMeta(AsyncBaseRepository):
+            pass
+
+    with pytest.raises(NotImplementedError):
+
+        class NoCollection(AsyncBaseRepository):
+            class Meta:
+                model = User
+
+
+def test_async_repository_crud(mongodb):
+    async def scenario():
+        saved = await AsyncUserRepository.save(john())
+        assert (await AsyncUserRepository.get(id=saved.id)) == saved
+
+        await AsyncUserRepository.save_many([john(i) for i in range(1, 5)])
+        assert await AsyncUserRepository.count() == 5
+        assert await AsyncUserRepository.exists(age=22)
+
+        names = [user.first_name async for user in AsyncUserRepository.find(age__gte=22, sort="age", chunk_size=2)]
+        assert names == ["John2", "John3", "John4"]
+
+        ages = [row["age"] async for row in AsyncUserRepository.aggregate([{"$sort": {"age": -1}}], raw=True)]
+        assert ages == [24, 23, 22, 21, 20]
+
+        await AsyncUserRepository.update_one({"id": saved.id}, {"age": 40})
+        assert (await AsyncUserRepository.get(id=saved.id)).age == 40
+
+        await AsyncUserRepository.delete(id=saved.id)
+        with pytest.raises(DoesNotExistError):
+            await AsyncUserRepository.get(id=saved.id)
+
+        await AsyncUserRepository.delete_many(age__lt=23)
+        assert await AsyncUserRepository.count() == 2
+
+    asyncio.run(scenario())
+
+    # Same collection as the synchronous repository
+    assert UserRepository.count() == 2
+
+
+def test_async_repository_find_errors_and_early_exit(mongodb):
+    async def scenario():
+        with pytest.raises(InvalidQueryError):
+            async for _ in AsyncUserRepository.find(age={"$bad": 1}):
+                pass
+
+        await AsyncUserRepository.save_many([john(i) for i in range(10)])
+        found = AsyncUserRepository.find(chunk_size=3)
+        async for user in found:
+            break
+        await found.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_async_repository_max_concurrency(mongodb):
+    backend = CountingBackend()
+
+    class LimitedUserRepository(AsyncBaseRepository):
+        class Meta:
+            model = User
+            collection = "user"
+            async_backend = backend
+            max_concurrency = 2
+
+    async def scenario():
+        await asyncio.gather(*(LimitedUserRepository.save(john(i)) for i in range(10)))
+        return await LimitedUserRepository.count()
+
+    assert asyncio.run(scenario()) == 10
+    assert backend.max_running == 2
+    backend.pool.close()
@@ -1,11 +1,18 @@
-from typing import Generator
+from typing import Generator, List, Optional
 
 import pytest
-from mongomantic import BaseRepository
+from bson import ObjectId
+from mongomantic import BaseRepository, MongoDBModel
 from mongomantic.core.database import connect
-from mongomantic.core.errors import DoesNotExistError, InvalidQueryError, MultipleObjectsReturnedError
-
-from .user import User
+from mongomantic.core.errors import (
+    DoesNotExistError,
+    FieldDoesNotExistError,
+    InvalidQueryError,
+    MultipleObjectsReturnedError,
+)
+from pydantic import BaseModel, Field
+
+from .user import User, john
 from .user_repository import SafeUserRepository, UserRepository
 
 
@@ -151,6 +158,28 @@ def test_repository_aggregate_error(example_user):
         )
 
 
+class AgeGroup(BaseModel):
+    age: int = Field(alias="_id")
+    count: int
+
+
+def test_repository_aggregate_output_model(mongodb):
+    UserRepository.save_many(john(i, age=20 + i % 2) for i in range(5))
+    pipeline = [{"$group": {"_id": "$age", "count": {"$sum": 1}}}, {"$sort": {"_id": 1}}]
+
+    groups = list(UserRepository.aggregate(pipeline, output_model=AgeGroup, batch_size=1, allow_disk_use=True))
+    assert groups == [AgeGroup(_id=20, count=3), AgeGroup(_id=21, count=2)]
+
+    trusted = list(UserRepository.aggregate(pipeline, output_model=AgeGroup, trusted=True))
+    assert [(group.age, group.count) for group in trusted] == [(20, 3), (21, 2)]
+
+    raw = list(UserRepository.aggregate(pipeline, raw=True, max_time_ms=1000))
+    assert raw == [{"_id": 20, "count": 3}, {"_id": 21, "count": 2}]
+
+    with pytest.raises(InvalidQueryError):
+        list(UserRepository.aggregate(pipeline))
+
+
 def test_safe_repository_aggregate_error(example_user):
     user = SafeUserRepository.aggregate(
         [
@@ -160,3 +189,294 @@ def test_safe_repository_aggregate_error(example_user):
 
     assert isinstance(user, Generator)
     assert list(user) == []
+
+
+def test_repository_find_trusted(example_user, repository):
+    users = list(repository.find(first_name="John", trusted=True))
+
+    assert len(users) == 1
+    assert isinstance(users[0], User)
+    assert users[0].id == example_user.id
+    assert users[0].age == 29
+    assert users[0].dict() == example_user.dict()
+
+
+def test_repository_trusted_reads_meta(mongodb):
+    class TrustedUserRepository(BaseRepository):
+        class Meta:
+            model = User
+            collection = "user"
+            trusted_reads = True
+
+    saved = TrustedUserRepository.save(User(first_name="John", last_name="Smith", email="john@google.com", age=29))
+    user = TrustedUserRepository.get(id=saved.id)
+    assert user.dict() == saved.dict()
+
+    johns = list(TrustedUserRepository.aggregate([{"$match": {"first_name": "John"}}]))
+    assert johns[0].id == saved.id
+
+    # Per-call override goes through validation
+    TrustedUserRepository._get_collection().update_one({"_id": saved.id}, {"$set": {"age": "30"}})
+    assert TrustedUserRepository.get(id=saved.id).age == "30"
+    assert TrustedUserRepository.get(id=saved.id, trusted=False).age == 30
+
+
+def test_repository_find_raw(example_user, repository):
+    documents = list(repository.find(first_name="John", raw=True))
+
+    assert len(documents) == 1
+    assert documents[0]["_id"] == example_user.id
+    assert documents[0]["email"] == "john@google.com"
+
+
+def test_repository_find_values_list(example_user, repository):
+    assert list(repository.find(first_name="John", values_list=["first_name", "age"])) == [("John", 29)]
+    assert list(repository.find(values_list=["id"], flat=True)) == [example_user.id]
+    assert list(repository.find(values_list=["age"], flat=True)) == [29]
+
+
+def test_repository_find_values_list_errors(example_user):
+    with pytest.raises(FieldDoesNotExistError):
+        list(UserRepository.find(values_list=["missing"]))
+
+    with pytest.raises(InvalidQueryError):
+        list(UserRepository.find(values_list=["first_name", "age"], flat=True))
+
+
+def test_repository_distinct(example_user):
+    UserRepository.save(User(first_name="Jane", last_name="Smith", email="jane@google.com", age=29))
+
+    assert sorted(UserRepository.distinct("first_name")) == ["Jane", "John"]
+    assert UserRepository.distinct("first_name", age=1) == []
+
+
+def test_repository_exists(example_user):
+    assert UserRepository.exists(first_name="John")
+    assert UserRepository.exists(id=example_user.id)
+    assert not UserRepository.exists(first_name="X")
+
+
+def test_repository_find_projection(example_user, repository):
+    users = list(repository.find(first_name="John", projection=["first_name", "age"]))
+
+    assert len(users) == 1
+    assert isinstance(users[0], User)
+    assert users[0].id == example_user.id
+    assert users[0].first_name == "John"
+    assert users[0].age == 29
+    assert not hasattr(users[0], "email")
+
+
+def test_repository_find_projection_exclusion(example_user, repository):
+    user = next(repository.find(projection={"email": False, "_id": False}))
+
+    assert user.id is None
+    assert user.last_name == "Smith"
+    assert not hasattr(user, "email")
+
+
+def test_repository_find_projection_id_only(example_user, repository):
+    user = next(repository.find(projection={"_id": 1}))
+
+    assert set(type(user).__fields__) == {"id"}
+    assert user.id == example_user.id
+    assert not hasattr(user, "first_name")
+
+
+class Geo(BaseModel):
+    lat: float
+    lng: float
+
+
+class Address(MongoDBModel):
+    city: str
+    zip: str
+    geo: Geo
+
+
+class Shipment(MongoDBModel):
+    name: str
+    destination: Address = Field(alias="dest")
+    stops: List[Address] = []
+
+
+class ShipmentRepository(BaseRepository):
+    class Meta:
+        model = Shipment
+        collection = "shipment"
+
+
+def test_repository_find_projection_embedded_fields(mongodb):
+    address = Address(city="Beirut", zip="1100", geo=Geo(lat=33.9, lng=35.5))
+    ShipmentRepository.save(Shipment(name="a", destination=address, stops=[address, address]))
+
+    projection = {"dest.city": 1, "dest.geo.lat": 1, "stops.zip": 1}
+    for trusted in (False, True):
+        shipment = next(ShipmentRepository.find(projection=projection, trusted=trusted))
+
+        assert shipment.destination.city == "Beirut"
+        assert shipment.destination.geo.lat == 33.9
+        assert not hasattr(shipment.destination, "zip")
+        assert not hasattr(shipment.destination.geo, "lng")
+        assert [stop.zip for stop in shipment.stops] == ["1100", "1100"]
+        assert not hasattr(shipment, "name")
+
+    # Whole fields win over their embedded paths
+    partial = Shipment.partial({"destination", "destination.city"})
+    assert partial.__fields__["destination"] is Shipment.__fields__["destination"]
+
+
+def test_repository_projected_model_cached(mongodb):
+    model = UserRepository._projected_model(["first_name"])
+
+    assert UserRepository._projected_model({"first_name": 1}) is model
+    assert set(model.__fields__) == {"id", "first_name"}
+    assert UserRepository._projected_model(None) is User
+    assert UserRepository._projected_model({"_id": 0}) is User
+
+
+def test_repository_save_many(mongodb, repository):
+    users = repository.save_many((john(i, age=i) for i in range(5)), chunk_size=2)
+
+    assert len(users) == 5
+    assert all(isinstance(user, User) and user.id for user in users)
+    assert [user.age for user in users] == list(range(5))
+    assert UserRepository.count() == 5
+
+
+def test_repository_save_many_returning(mongodb):
+    ids = UserRepository.save_many((john(i, age=i) for i in range(3)), chunk_size=2, returning="ids")
+    assert len(ids) == 3
+    assert UserRepository.exists(id=ids[2])
+
+    assert UserRepository.save_many((john(i, age=i) for i in range(3)), returning="count") == 3
+    assert UserRepository.save_many([], returning="count") == 0
+
+    with pytest.raises(ValueError):
+        UserRepository.save_many([john()], returning="nothing")
+
+
+def test_repository_save_many_to_db(mongodb):
+    users = UserRepository.save_many_to_db(
+        {"first_name": "John", "last_name": "Smith", "email": "john@google.com", "age": age} for age in range(3)
+    )
+
+    assert [user.age for user in users] == [0, 1, 2]
+
+
+def test_repository_get_or_create(mongodb):
+    user, created = UserRepository.get_or_create(
+        defaults={"last_name": "Smith", "age": 29}, first_name="John", email="john@google.com"
+    )
+    assert created
+    assert user.id
+    assert user.age == 29
+
+    same, created = UserRepository.get_or_create(
+        defaults={"last_name": "Doe", "age": 30}, first_name="John", email="john@google.com"
+    )
+    assert not created
+    assert same.id == user.id
+    assert same.last_name == "Smith"
+    assert UserRepository.count() == 1
+
+
+def test_repository_get_or_create_by_id(example_user):
+    user, created = UserRepository.get_or_create(id=example_user.id)
+    assert not created
+    assert user == example_user
+
+    new_id = ObjectId()
+    user, created = UserRepository.get_or_create(
+        defaults={"first_name": "Jane", "last_name": "Doe", "email": "jane@google.com", "age": 1}, id=new_id
+    )
+    assert created
+    assert user.id == new_id
+    assert UserRepository.get(id=new_id).first_name == "Jane"
+
+
+def test_repository_create_or_update(mongodb):
+    user, created = UserRepository.create_or_update(
+        defaults={"last_name": "Smith", "age": 29}, first_name="John", email="john@google.com"
+    )
+    assert created
+    assert user.age == 29
+
+    updated, created = UserRepository.create_or_update(
+        defaults={"age": 30}, first_name="John", email="john@google.com", last_name="Smith"
+    )
+    assert not created
+    assert updated.id == user.id
+    assert updated.age == 30
+    assert UserRepository.get(id=user.id).age == 30
+    assert UserRepository.count() == 1
+
+
+def test_repository_create_or_update_by_id(example_user):
+    updated, created = UserRepository.create_or_update(defaults={"age": 40}, id=example_user.id)
+
+    assert not created
+    assert updated.age == 40
+    assert updated.first_name == "John"
+    assert UserRepository.get(id=example_user.id).age == 40
+
+
+def test_repository_create_or_update_invalid_field(example_user):
+    with pytest.raises(InvalidQueryError):
+        UserRepository.create_or_update(defaults={"missing": 1}, first_name="John")
+
+
+def test_repository_save_changes(example_user, repository):
+    collection = UserRepository._get_collection()
+    example_user.age = 30
+    example_user.email = "johnny@google.com"
+
+    saved = repository.save(example_user)
+
+    assert saved.id == example_user.id
+    assert saved.get_changed_fields() == set()
+    assert collection.count_documents({}) == 1
+    assert collection.find_one({"_id": example_user.id})["age"] == 30
+    assert repository.get(id=example_user.id).email == "johnny@google.com"
+
+
+def test_repository_save_without_changes(example_user, repository):
+    collection = UserRepository._get_collection()
+    collection.update_one({"_id": example_user.id}, {"$set": {"age": 50}})
+
+    # Nothing is sent, so the concurrent change is kept
+    repository.save(example_user)
+    assert collection.find_one({"_id": example_user.id})["age"] == 50
+
+
+def test_repository_save_changes_partial_update(mongodb):
+    saved = UserRepository.save(User(first_name="John", last_name="Smith", email="john@google.com", age=29))
+    collection = UserRepository._get_collection()
+    collection.update_one({"_id": saved.id}, {"$set": {"first_name": "Jack"}})
+
+    saved.age = 31
+    UserRepository.save(saved)
+
+    stored = collection.find_one({"_id": saved.id})
+    assert stored["age"] == 31
+    assert stored["first_name"] == "Jack"
+
+
+def test_repository_save_changes_none_round_trip(mongodb):
+    class Account(MongoDBModel):
+        name: str
+        status: Optional[str] = "active"
+
+    class AccountRepository(BaseRepository):
+        class Meta:
+            model = Account
+            collection = "account"
+
+    account = AccountRepository.get(id=AccountRepository.save(Account(name="a")).id)
+    assert account.status == "active"
+
+    account.status = None
+    AccountRepository.save(account)
+
+    assert AccountRepository._get_collection().find_one({"_id": account.id})["status"] is None
+    assert AccountRepository.get(id=account.id).status is None
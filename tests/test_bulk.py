@@ -0,0 +1,113 @@
+import pytest
+from mongomantic import BaseRepository, Index, MongoDBModel
+from mongomantic.core.errors import FieldDoesNotExistError, InvalidQueryError
+from pydantic import Field
+
+
+class Product(MongoDBModel):
+    sku: str
+    name: str
+    stock: int = 0
+
+
+class Member(MongoDBModel):
+    nick: str = Field(alias="n")
+    level: int = 0
+
+
+class ProductRepository(BaseRepository):
+    class Meta:
+        model = Product
+        collection = "product"
+        indexes = [Index(name="sku_index", unique=True, fields=["+sku"])]
+
+
+class MemberRepository(BaseRepository):
+    class Meta:
+        model = Member
+        collection = "member"
+
+
+def test_bulk_insert_update_delete(mongodb):
+    kept = ProductRepository.save(Product(sku="a", name="A"))
+    deleted = ProductRepository.save(Product(sku="b", name="B"))
+
+    bulk = ProductRepository.bulk()
+    bulk.insert(Product(sku="c", name="C"))
+    bulk.update({"id": kept.id}, {"stock": 5})
+    bulk.delete(id=deleted.id)
+    assert len(bulk) == 3
+
+    result = bulk.execute(chunk_size=2)
+
+    assert result.inserted_count == 1
+    assert len(result.inserted_ids) == 1
+    assert result.modified_count == 1
+    assert result.deleted_count == 1
+    assert result.errors == []
+    assert len(bulk) == 0
+
+    assert ProductRepository.get(id=kept.id).stock == 5
+    assert ProductRepository.get(id=result.inserted_ids[0]).sku == "c"
+    assert not ProductRepository.exists(id=deleted.id)
+
+
+def test_bulk_upsert(mongodb):
+    ProductRepository.save(Product(sku="a", name="A"))
+
+    result = (
+        ProductRepository.bulk()
+        .upsert(Product(sku="a", name="A2", stock=1), on=["sku"])
+        .upsert(Product(sku="b", name="B", stock=2), on=["sku"])
+        .execute()
+    )
+
+    assert result.matched_count == 1
+    assert result.upserted_count == 1
+    assert ProductRepository.count() == 2
+    assert ProductRepository.get(sku="a").name == "A2"
+    assert ProductRepository.get(sku="b").stock == 2
+
+
+def test_bulk_upsert_aliased_fields(mongodb):
+    MemberRepository.save(Member(nick="joe", level=1))
+
+    result = (
+        MemberRepository.bulk()
+        .upsert(Member(nick="joe", level=2), on=["nick"])
+        .upsert(Member(nick="ann", level=3), on=["nick"])
+        .execute()
+    )
+
+    assert (result.matched_count, result.upserted_count) == (1, 1)
+    assert {member.nick: member.level for member in MemberRepository.find()} == {"joe": 2, "ann": 3}
+    assert MemberRepository._get_collection().find_one({"n": "joe"})["level"] == 2
+
+
+def test_bulk_errors_do_not_stop_batch(mongodb):
+    ProductRepository.save(Product(sku="a", name="A"))
+
+    result = (
+        ProductRepository.bulk()
+        .insert(Product(sku="a", name="duplicate"))
+        .insert(Product(sku="b", name="B"))
+        .execute()
+    )
+
+    assert result.inserted_count == 1
+    assert [error["index"] for error in result.errors] == [0]
+    assert ProductRepository.exists(sku="b")
+
+
+def test_bulk_invalid_fields(mongodb):
+    bulk = ProductRepository.bulk()
+
+    with pytest.raises(FieldDoesNotExistError):
+        bulk.update({"missing": 1}, {"stock": 1})
+
+    with pytest.raises(FieldDoesNotExistError):
+        bulk.upsert(Product(sku="a", name="A"), on=["missing"])
+
+    with pytest.raises(InvalidQueryError):
+        bulk.upsert(Product(sku="a", name="A"), on=["id"])
+    assert len(bulk) == 0
@@ -0,0 +1,112 @@
+import pytest
+from mongomantic import BaseRepository, connect, disconnect, use_connection
+from mongomantic.core.cache import ModelCache
+
+from .user import User
+from .user_repository import UserRepository
+
+
+class CachedUserRepository(BaseRepository):
+    class Meta:
+        model = User
+        collection = "user"
+        cache_size = 2
+
+
+@pytest.fixture()
+def cached_user(mongodb):
+    CachedUserRepository.cache_clear()
+    return CachedUserRepository.save(User(first_name="John", last_name="Smith", email="john@google.com", age=29))
+
+
+def test_model_cache_lru():
+    cache = ModelCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.size) == (3, 1, 1, 2)
+
+
+def test_model_cache_ttl():
+    now = [0.0]
+    cache = ModelCache(10, ttl=5, clock=lambda: now[0])
+    cache.set("a", 1)
+
+    now[0] = 4.9
+    assert cache.get("a") == 1
+    now[0] = 5
+    assert cache.get("a") is None
+    assert cache.stats().evictions == 1
+
+
+def test_repository_get_cached(cached_user):
+    before = CachedUserRepository.cache_stats()
+
+    first = CachedUserRepository.get(id=cached_user.id)
+    second = CachedUserRepository.get(id=cached_user.id)
+
+    stats = CachedUserRepository.cache_stats()
+    assert stats.misses == before.misses + 1
+    assert stats.hits == before.hits + 1
+    assert first == second
+    assert first is not second
+
+    # Mutating a returned model does not affect the cache
+    second.age = 1
+    assert CachedUserRepository.get(id=cached_user.id).age == 29
+
+
+def test_repository_get_cache_bypass(cached_user):
+    CachedUserRepository.get(id=cached_user.id)
+    CachedUserRepository._get_collection().update_one({"_id": cached_user.id}, {"$set": {"age": 40}})
+
+    assert CachedUserRepository.get(id=cached_user.id).age == 29
+    assert CachedUserRepository.get(id=cached_user.id, cache=False).age == 40
+    CachedUserRepository.cache_clear()
+    assert CachedUserRepository.get(id=cached_user.id).age == 40
+
+
+def test_repository_cache_invalidation(cached_user):
+    CachedUserRepository.get(id=cached_user.id)
+    CachedUserRepository.update_one({"id": cached_user.id}, {"age": 30})
+    assert CachedUserRepository.get(id=cached_user.id).age == 30
+
+    user = CachedUserRepository.get(id=cached_user.id)
+    user.age = 31
+    CachedUserRepository.save(user)
+    assert CachedUserRepository.get(id=cached_user.id).age == 31
+
+    CachedUserRepository.create_or_update(defaults={"age": 32}, id=cached_user.id)
+    assert CachedUserRepository.get(id=cached_user.id).age == 32
+
+    CachedUserRepository.delete(id=cached_user.id)
+    assert CachedUserRepository.cache_stats().size == 0
+    assert not CachedUserRepository.exists(id=cached_user.id)
+
+
+def test_repository_cache_disabled(mongodb):
+    assert UserRepository.cache_stats() is None
+
+
+def test_repository_cache_per_connection(cached_user):
+    connect("localhost:27017", "other", mock=True, alias="other")
+    try:
+        with use_connection("other"):
+            document = {**cached_user.to_mongo(), "_id": cached_user.id, "first_name": "Other"}
+            CachedUserRepository._get_collection().insert_one(document)
+
+        assert CachedUserRepository.get(id=cached_user.id).first_name == "John"
+        with use_connection("other"):
+            assert CachedUserRepository.get(id=cached_user.id).first_name == "Other"
+            assert [user.first_name for user in CachedUserRepository.get_many([cached_user.id])] == ["Other"]
+        assert CachedUserRepository.get_many([cached_user.id])[0].first_name == "John"
+        assert CachedUserRepository.cache_stats().size == 2
+    finally:
+        disconnect("other")
@@ -0,0 +1,110 @@
+from typing import Dict, List, Optional
+
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from mongomantic import BaseRepository, MongoDBModel
+from mongomantic.core.errors import FieldDoesNotExistError
+
+np = pytest.importorskip("numpy")
+pa = pytest.importorskip("pyarrow")
+
+
+class Measure(MongoDBModel):
+    name: str
+    value: float
+    count: int
+    valid: bool
+    taken: datetime
+    score: Optional[int] = None
+    tags: List[str] = []
+    extra: Dict[str, int] = {}
+
+
+class MeasureRepository(BaseRepository):
+    class Meta:
+        model = Measure
+        collection = "measure"
+
+
+@pytest.fixture()
+def measures(mongodb):
+    return MeasureRepository.save_many(
+        Measure(
+            name=f"m{i}",
+            value=i / 2,
+            count=i,
+            valid=i % 2 == 0,
+            taken=datetime(2021, 1, 1 + i),
+            score=i if i % 3 else None,
+            tags=["a"] * i,
+            extra={"x": i},
+        )
+        for i in range(10)
+    )
+
+
+def test_find_columns(measures):
+    columns = MeasureRepository.find_columns(count__gte=2, batch_size=3, sort="count")
+
+    assert columns["count"].dtype == np.int64
+    assert columns["count"].tolist() == list(range(2, 10))
+    assert columns["value"].dtype == np.float64
+    assert columns["valid"].dtype == np.bool_
+    assert columns["taken"].dtype == np.dtype("datetime64[ms]")
+    assert columns["taken"][0] == np.datetime64("2021-01-03")
+    assert columns["name"].dtype == object
+    assert columns["id"][0] == measures[2].id
+
+    # Optional integers are read as floats with NaN
+    assert columns["score"].dtype == np.float64
+    assert np.isnan(columns["score"][1])
+    assert columns["score"][0] == 2
+
+    assert columns["tags"][2] == ["a"] * 4
+    assert columns["extra"][0] == {"x": 2}
+
+
+def test_find_columns_projection(measures, monkeypatch):
+    collection = MeasureRepository._get_collection()
+    projections = []
+    find = collection.find
+
+    def recording_find(*args, **kwargs):
+        projections.append(kwargs.get("projection"))
+        return find(*args, **kwargs)
+
+    monkeypatch.setattr(collection, "find", recording_find)
+    monkeypatch.setattr(MeasureRepository, "_get_collection", classmethod(lambda cls: collection))
+
+    columns = MeasureRepository.find_columns(columns=["name", "count"], limit=4)
+    assert list(columns) == ["name", "count"]
+    assert len(columns["count"]) == 4
+    assert projections == [{"name": 1, "count": 1, "_id": 0}]
+
+
+def test_find_columns_empty(measures):
+    columns = MeasureRepository.find_columns(count=100, columns=["count", "name"])
+
+    assert columns["count"].dtype == np.int64
+    assert len(columns["count"]) == 0
+    assert len(columns["name"]) == 0
+
+
+def test_find_columns_invalid_field(measures):
+    with pytest.raises(FieldDoesNotExistError):
+        MeasureRepository.find_columns(columns=["missing"])
+
+
+def test_to_arrow(measures):
+    table = MeasureRepository.to_arrow(valid=True, batch_size=2)
+
+    assert table.num_rows == 5
+    assert table.schema.field("count").type == pa.int64()
+    assert table.schema.field("taken").type == pa.timestamp("ms")
+    assert table.schema.field("id").type == pa.string()
+    assert table.column("id")[0].as_py() == str(measures[0].id)
+    assert table.column("score").to_pylist() == [None, 2, 4, None, 8]
+    assert table.column("extra").to_pylist()[1] == {"x": 2}
+    assert ObjectId(table.column("id")[4].as_py()) == measures[8].id
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+
+import pytest
+from mongomantic import AsyncBaseRepository, BaseRepository, connect, disconnect, use_connection
+from mongomantic.core.database import MongomanticClient, connections, get_connection, to_read_preference
+from mongomantic.core.errors import ConnectionNotFoundError
+from pymongo import ReadPreference
+
+from .user import User, john
+from .user_repository import UserRepository
+
+
+class AnalyticsUserRepository(BaseRepository):
+    class Meta:
+        model = User
+        collection = "user"
+        connection = "analytics"
+        read_preference = "secondaryPreferred"
+
+
+class AsyncAnalyticsUserRepository(AsyncBaseRepository):
+    class Meta:
+        model = User
+        collection = "user"
+        connection = "analytics"
+
+
+@pytest.fixture()
+def analytics(mongodb):
+    yield connect("localhost:27017", "analytics", mock=True, alias="analytics", max_pool_size=10, compressors=["zlib"])
+    disconnect("analytics")
+
+
+def test_connect_registers_aliases(analytics):
+    assert set(connections()) == {"default", "analytics"}
+    assert get_connection("analytics") is analytics
+    assert get_connection().db is MongomanticClient.db
+    assert analytics.db.name == "analytics"
+
+    disconnect("analytics")
+    with pytest.raises(ConnectionNotFoundError):
+        get_connection("analytics")
+    assert MongomanticClient.db is not None
+
+    disconnect()
+    assert connections() == {}
+    assert MongomanticClient.db is None
+
+
+def test_client_options():
+    connection = connect(
+        "mongodb://localhost:27017",
+        "test",
+        alias="options",
+        max_pool_size=7,
+        min_pool_size=1,
+        read_preference="secondary_preferred",
+        connect=False,
+    )
+    try:
+        assert connection.client.options.pool_options.max_pool_size == 7
+        assert connection.client.options.pool_options.min_pool_size == 1
+        assert connection.client.read_preference == ReadPreference.SECONDARY_PREFERRED
+    finally:
+        disconnect("options")
+
+
+def test_to_read_preference():
+    assert to_read_preference(None) is None
+    assert to_read_preference("nearest") == ReadPreference.NEAREST
+    assert to_read_preference("primaryPreferred") == ReadPreference.PRIMARY_PREFERRED
+    assert to_read_preference(ReadPreference.SECONDARY) == ReadPreference.SECONDARY
+    with pytest.raises(ValueError):
+        to_read_preference("fastest")
+
+
+def test_repositories_routed_by_meta(analytics):
+    UserRepository.save(john(0))
+    AnalyticsUserRepository.save_many([john(1), john(2)])
+
+    assert UserRepository.count() == 1
+    assert AnalyticsUserRepository.count() == 2
+    assert analytics.db["user"].count_documents({}) == 2
+
+    collection = AnalyticsUserRepository._get_collection()
+    assert collection.read_preference == ReadPreference.SECONDARY_PREFERRED
+    assert AnalyticsUserRepository._get_collection() is collection
+    assert UserRepository._get_collection().read_preference == ReadPreference.PRIMARY
+
+
+def test_unknown_connection(mongodb):
+    with pytest.raises(ConnectionNotFoundError):
+        AnalyticsUserRepository._get_collection()
+
+
+def test_use_connection(analytics):
+    AnalyticsUserRepository.save(john())
+
+    with use_connection("default", repositories=[AnalyticsUserRepository]):
+        assert AnalyticsUserRepository.count() == 0
+        # Meta read preference kept
+        assert AnalyticsUserRepository._get_collection().read_preference == ReadPreference.SECONDARY_PREFERRED
+        assert UserRepository.count() == 0
+
+        with use_connection("analytics", read_preference=ReadPreference.NEAREST):
+            assert UserRepository.count() == 1
+            assert UserRepository._get_collection().read_preference == ReadPreference.NEAREST
+
+    assert AnalyticsUserRepository.count() == 1
+
+
+def test_use_connection_is_thread_local(analytics):
+    AnalyticsUserRepository.save(john())
+    counts = []
+
+    with use_connection("analytics"):
+        thread = threading.Thread(target=lambda: counts.append(UserRepository.count()))
+        thread.start()
+        thread.join()
+        counts.append(UserRepository.count())
+
+    assert counts == [0, 1]
+
+
+def test_use_connection_with_async_repositories(analytics):
+    AnalyticsUserRepository.save(john())
+
+    async def scenario():
+        with use_connection("default", repositories=[AsyncAnalyticsUserRepository]):
+            inside = await AsyncAnalyticsUserRepository.count()
+        return inside, await AsyncAnalyticsUserRepository.count()
+
+    assert asyncio.run(scenario()) == (0, 1)
+
+
+def test_writer_uses_overrides_of_its_creation(analytics):
+    with use_connection("analytics"):
+        writer = UserRepository.writer()
+    writer.save(john())
+    writer.close()
+
+    assert UserRepository.count() == 0
+    assert AnalyticsUserRepository.count() == 1
+
+
+def test_disconnect_closes_writers_of_its_connection(analytics):
+    analytics_writer = AnalyticsUserRepository.writer(max_age=60)
+    writer = UserRepository.writer(max_age=60)
+    analytics_writer.save(john(1))
+    collection = AnalyticsUserRepository._get_collection()
+
+    disconnect("analytics")
+    assert analytics_writer.closed
+    assert collection.count_documents({}) == 1
+    assert not writer.closed
+    writer.close()
@@ -0,0 +1,131 @@
+from typing import List, Optional
+
+import re
+from datetime import datetime
+
+import bson
+import pytest
+from bson import ObjectId
+from bson.raw_bson import RawBSONDocument
+from mongomantic import BaseRepository, MongoDBModel
+from mongomantic.core.errors import InvalidQueryError
+from mongomantic.core.lazy import element_offsets, from_raw
+from pydantic import ValidationError
+
+from .user import User
+from .user_repository import UserRepository
+
+
+class Item(MongoDBModel):
+    name: str
+    price: float
+
+
+class Order(MongoDBModel):
+    number: int
+    items: List[Item] = []
+    note: Optional[str] = None
+
+
+class OrderRepository(BaseRepository):
+    class Meta:
+        model = Order
+        collection = "order"
+
+
+def raw(document):
+    return RawBSONDocument(bson.encode(document))
+
+
+def test_element_offsets():
+    document = {
+        "_id": ObjectId(),
+        "s": "text",
+        "f": 1.5,
+        "i": 3,
+        "l": 2 ** 40,
+        "b": True,
+        "n": None,
+        "d": {"a": [1, {"b": 2}]},
+        "bin": b"\x00\x01",
+        "t": datetime(2021, 1, 1),
+        "r": re.compile("^a", re.I),
+    }
+    encoded = bson.encode(document)
+    offsets = element_offsets(encoded)
+
+    assert list(offsets) == list(document)
+    assert offsets["_id"][0] == 4
+    assert offsets["r"][1] == len(encoded) - 1
+
+
+def test_from_raw_decodes_on_access():
+    id = ObjectId()
+    user = from_raw(User, raw({"_id": id, "first_name": "John", "last_name": "Smith", "email": "j@x.com", "age": "29"}))
+
+    assert isinstance(user, User)
+    assert user.__dict__ == {}
+    assert user.age == 29
+    assert user.__dict__ == {"age": 29}
+    assert user.__fields_set__ == {"id", "first_name", "last_name", "email", "age"}
+
+    assert user.dict() == {"id": id, "first_name": "John", "last_name": "Smith", "email": "j@x.com", "age": 29}
+    assert list(user.__dict__) == ["id", "first_name", "last_name", "email", "age"]
+    assert user._lazy_state is None
+
+
+def test_from_raw_validation():
+    user = from_raw(User, raw({"_id": ObjectId(), "first_name": "John", "age": "old"}))
+
+    assert user.first_name == "John"
+    with pytest.raises(ValidationError):
+        user.age
+    with pytest.raises(ValidationError):
+        user.email
+
+    trusted = from_raw(User, raw({"_id": ObjectId(), "first_name": "John", "age": "old"}), trusted=True)
+    assert trusted.age == "old"
+
+    assert from_raw(User, {}) is None
+
+
+def test_from_raw_embedded_and_dict_documents():
+    item_id = ObjectId()
+    document = {"_id": ObjectId(), "number": 1, "items": [{"_id": item_id, "name": "pen", "price": 2}]}
+
+    for source in (raw(document), dict(document)):
+        order = from_raw(Order, source)
+        assert order.items[0].id == item_id
+        assert order.items[0].price == 2.0
+        assert order.note is None
+
+        trusted = from_raw(Order, source, trusted=True)
+        assert isinstance(trusted.items[0], Item)
+        assert trusted == order
+
+
+def test_repository_lazy_find_and_get(mongodb):
+    orders = OrderRepository.save_many(
+        Order(number=i, items=[Item(name=f"item{i}", price=i)], note="fragile" if i % 2 else None) for i in range(3)
+    )
+
+    lazy = list(OrderRepository.find(lazy=True, sort="number"))
+    assert [order.number for order in lazy] == [0, 1, 2]
+    assert lazy == orders
+
+    projected = list(OrderRepository.find(lazy=True, projection=["number"], number=1))
+    assert projected[0].number == 1
+    assert not hasattr(projected[0], "items")
+
+    order = OrderRepository.get(id=orders[1].id, lazy=True)
+    assert order.note == "fragile"
+
+    # Changes of lazy models are saved like any other
+    order.note = "handle with care"
+    OrderRepository.save(order)
+    assert OrderRepository.get(id=orders[1].id).note == "handle with care"
+
+
+def test_repository_lazy_errors(mongodb):
+    with pytest.raises(InvalidQueryError):
+        next(UserRepository.find(lazy=True, raw=True))
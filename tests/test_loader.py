@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from mongomantic import connect, disconnect, use_connection
+from mongomantic.core.errors import DoesNotExistError, InvalidQueryError
+
+from .counting_collection import CountingCollection
+from .user import john
+from .user_repository import UserRepository
+
+
+@pytest.fixture()
+def users(mongodb):
+    return UserRepository.save_many(john(i, age=i) for i in range(3))
+
+
+@pytest.fixture()
+def collection(monkeypatch, users):
+    counting = CountingCollection(UserRepository._get_collection())
+    monkeypatch.setattr(UserRepository, "_get_collection", classmethod(lambda cls: counting))
+    return counting
+
+
+def test_get_many(users, collection):
+    missing = ObjectId()
+    ids = [users[2].id, missing, str(users[0].id), users[2].id]
+
+    result = UserRepository.get_many(ids)
+
+    assert collection.finds == 1
+    assert [user.age if user else None for user in result] == [2, None, 0, 2]
+    assert result[0] is not result[3]
+
+
+def test_get_many_errors(users):
+    with pytest.raises(DoesNotExistError):
+        UserRepository.get_many([users[0].id, ObjectId()], raise_missing=True)
+
+    with pytest.raises(InvalidQueryError):
+        UserRepository.get_many(["invalid"])
+
+
+def test_loader_sync(users, collection):
+    with UserRepository.loader() as loader:
+        results = [loader.load(user.id) for user in reversed(users)]
+        missing = loader.load(ObjectId())
+        assert collection.finds == 0
+
+        assert [result.result().age for result in results] == [2, 1, 0]
+        assert missing.result() is None
+        assert collection.finds == 1
+
+        # Memoized
+        assert loader.load(users[0].id).result().age == 0
+        assert loader.load_many([user.id for user in users])[1].age == 1
+        assert collection.finds == 1
+
+
+def test_loader_async(users, collection):
+    loader = UserRepository.loader()
+
+    async def resolve():
+        return await asyncio.gather(*(loader.load_async(user.id) for user in users), loader.load_async(users[0].id))
+
+    result = asyncio.run(resolve())
+
+    assert [user.age for user in result] == [0, 1, 2, 0]
+    assert collection.finds == 1
+
+
+def test_loader_async_uses_connection_overrides(users):
+    connect("localhost:27017", "analytics", mock=True, alias="analytics")
+    try:
+        with use_connection("analytics"):
+            analytics_users = UserRepository.save_many(john(i) for i in range(10, 12))
+        loader = UserRepository.loader()
+
+        async def resolve():
+            with use_connection("analytics"):
+                return await asyncio.gather(*(loader.load_async(user.id) for user in analytics_users))
+
+        assert [user.age for user in asyncio.run(resolve())] == [30, 31]
+    finally:
+        disconnect("analytics")
@@ -0,0 +1,161 @@
+import bson
+import pytest
+from bson.raw_bson import RawBSONDocument
+from mongomantic.core.errors import DoesNotExistError, InvalidQueryError
+from mongomantic.core.metrics import (
+    Histogram,
+    MetricsCollector,
+    SlowQueryLog,
+    add_hook,
+    fingerprint,
+    measure,
+    measure_sizes,
+    remove_hook,
+)
+
+from .user import john
+from .user_repository import UserRepository
+
+
+@pytest.fixture()
+def events():
+    recorded = []
+    add_hook(recorded.append)
+    yield recorded
+    remove_hook(recorded.append)
+
+
+def test_fingerprint():
+    assert fingerprint({"age": {"$gte": 18}, "email": "a"}) == fingerprint({"email": "b", "age": {"$gte": 65}})
+    assert fingerprint({"age": {"$in": [1, 2, 3]}}) == fingerprint({"age": {"$in": [4]}}) == '{"age": {"$in": ["?"]}}'
+    assert fingerprint({"$or": [{"a": 1}, {"b": 2}]}) == '{"$or": [{"a": "?"}, {"b": "?"}]}'
+    assert fingerprint({"age": 1}, [("age", -1)]) == '{"age": "?"} sort [["age", -1]]'
+    assert fingerprint({"age": 1}) != fingerprint({"age": {"$ne": 1}})
+
+
+def test_not_measured_without_hooks(mongodb):
+    with measure(UserRepository, "find", {}) as measurement:
+        assert measurement is None
+
+
+def test_events(mongodb, events):
+    UserRepository.save_many([john(i) for i in range(5)])
+    users = list(UserRepository.find(age__gte=22, sort="age"))
+    UserRepository.get(id=users[0].id)
+    UserRepository.count(age=20)
+    with pytest.raises(DoesNotExistError):
+        UserRepository.get(age=100)
+    with pytest.raises(InvalidQueryError):
+        list(UserRepository.find(age={"$bad": 1}))
+
+    assert [(event.repository, event.operation) for event in events] == [
+        ("UserRepository", "save_many"),
+        ("UserRepository", "find"),
+        ("UserRepository", "get"),
+        ("UserRepository", "count"),
+        ("UserRepository", "get"),
+        ("UserRepository", "find"),
+    ]
+    find = events[1]
+    assert find.collection == "user"
+    assert find.query == {"age": {"$gte": 22}}
+    assert find.sort == [("age", 1)]
+    assert find.documents == 3
+    assert find.bytes == 0
+    assert find.server_time > 0 and find.decode_time > 0
+    assert find.error is None
+    assert events[2].documents == 1
+    assert isinstance(events[4].error, DoesNotExistError)
+    assert isinstance(events[5].error, InvalidQueryError)
+
+
+def test_event_sizes(mongodb, events):
+    document = john().to_mongo()
+    size = len(bson.encode(document))
+
+    with measure(UserRepository, "find", {}) as measurement:
+        measurement.fetched(RawBSONDocument(bson.encode(document)))
+        measurement.fetched(document)
+    measure_sizes()
+    try:
+        with measure(UserRepository, "find", {}) as measurement:
+            measurement.fetched(RawBSONDocument(bson.encode(document)))
+            measurement.fetched(document)
+    finally:
+        measure_sizes(False)
+
+    assert [(event.documents, event.bytes) for event in events] == [(2, size), (2, 2 * size)]
+
+
+def test_save_changes_and_parallel_find_events(mongodb, events):
+    user = UserRepository.save(john())
+    user.age = 30
+    UserRepository.save(user)
+    UserRepository.save_many([john(i) for i in range(1, 4)])
+    assert len(list(UserRepository.parallel_find(partitions=2))) == 4
+
+    assert [event.operation for event in events] == ["save", "save", "save_many", "parallel_find"]
+    assert events[1].query == {"_id": user.id}
+    assert events[3].documents == 4
+    assert events[3].sort == [("_id", 1)]
+
+
+def test_collector_and_prometheus(mongodb):
+    collector = add_hook(MetricsCollector())
+    try:
+        UserRepository.save(john())
+        for _ in range(3):
+            list(UserRepository.find())
+            list(UserRepository.aggregate([{"$match": {"age": 20}}], raw=True))
+    finally:
+        remove_hook(collector)
+
+    snapshot = collector.snapshot()
+    assert set(snapshot) == {
+        ("UserRepository", "save"),
+        ("UserRepository", "find"),
+        ("UserRepository", "aggregate"),
+    }
+    find = snapshot[("UserRepository", "find")]
+    assert find.calls == 3
+    assert find.documents == 3
+    assert find.server_time.count == 3
+    assert find.server_time.cumulative()[-1] == (float("inf"), 3)
+
+    text = collector.prometheus()
+    assert '# TYPE mongomantic_server_seconds histogram' in text
+    assert 'mongomantic_operations_total{repository="UserRepository",operation="find"} 3' in text
+    assert 'mongomantic_documents_total{repository="UserRepository",operation="aggregate"} 3' in text
+    assert 'mongomantic_decode_seconds_bucket{repository="UserRepository",operation="find",le="+Inf"} 3' in text
+
+    collector.reset()
+    assert collector.snapshot() == {}
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.cumulative() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.mean == pytest.approx(2.65 / 4)
+
+
+def test_slow_query_log(mongodb):
+    slow_queries = add_hook(SlowQueryLog(threshold=0, thresholds={"UserRepository.count": 60}, log=False))
+    try:
+        UserRepository.save_many([john(i) for i in range(3)])
+        for i in range(3):
+            UserRepository.get(age=20 + i)
+        UserRepository.count()
+    finally:
+        remove_hook(slow_queries)
+
+    assert [event.operation for event in slow_queries.entries()] == ["save_many", "get", "get", "get"]
+    summaries = {summary.operation: summary for summary in slow_queries.summary()}
+    assert summaries["get"].count == 3
+    assert summaries["get"].fingerprint == '{"age": "?"}'
+    assert summaries["get"].max_time > 0
+
+    slow_queries.clear()
+    assert slow_queries.entries() == []
@@ -0,0 +1,150 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from mongomantic import MongoDBModel
+from mongomantic.core.mongo_model import OID
+from pydantic import BaseModel
+
+
+class Address(MongoDBModel):
+    city: str
+
+
+class Point(BaseModel):
+    x: int
+    y: int = 0
+
+
+class Place(BaseModel):
+    name: str
+    point: Point
+
+
+class Profile(MongoDBModel):
+    name: str
+    extra: Optional[Any]
+    address: Optional[Address]
+    previous: List[Address] = []
+
+
+def test_from_mongo_maps_id():
+    oid = ObjectId()
+    profile = Profile.from_mongo({"_id": oid, "name": "John"})
+
+    assert profile.id == oid
+    assert profile.name == "John"
+
+
+def test_from_mongo_empty_document():
+    assert Profile.from_mongo({}) is None
+
+
+def test_from_mongo_json_coercion():
+    profile = Profile.from_mongo({"_id": ObjectId(), "name": "John", "extra": {"a": 1}})
+
+    assert json.loads(profile.extra) == {"a": 1}
+
+
+def test_from_mongo_embedded_documents():
+    oid = ObjectId()
+    profile = Profile.from_mongo(
+        {
+            "_id": ObjectId(),
+            "name": "John",
+            "address": {"_id": oid, "city": "Beirut"},
+            "previous": [{"_id": oid, "city": "Paris"}],
+        }
+    )
+
+    assert profile.address.id == oid
+    assert profile.address.city == "Beirut"
+    assert profile.previous[0].id == oid
+
+
+def test_decoder_built_once_per_class():
+    class Child(Profile):
+        age: int = 0
+
+    decoder = Profile.decoder()
+    assert Profile.decoder() is decoder
+    assert Child.decoder() is not decoder
+    assert Child.decoder().model is Child
+    assert decoder.json_fields == ("extra",)
+
+
+def test_from_mongo_trusted():
+    oid = ObjectId()
+    document = {
+        "_id": oid,
+        "name": "John",
+        "extra": {"a": 1},
+        "address": {"_id": oid, "city": "Beirut"},
+        "previous": [{"city": "Paris"}],
+        "unknown": True,
+    }
+
+    validated = Profile.from_mongo(dict(document, address=dict(document["address"])))
+    trusted = Profile.from_mongo(document, trusted=True)
+
+    assert trusted.dict() == validated.dict()
+    assert isinstance(trusted.address, Address)
+    assert trusted.address.id == oid
+    assert isinstance(trusted.previous[0], Address)
+    assert not hasattr(trusted, "unknown")
+
+
+class Atlas(MongoDBModel):
+    addresses: Dict[str, Address] = {}
+    owners: Dict[str, OID] = {}
+    point: Optional[Point]
+    places: List[Place] = []
+    route: Tuple[Point, ...] = ()
+    legs: List[Tuple[Point, Point]] = []
+
+
+def test_from_mongo_trusted_shapes():
+    oid = ObjectId()
+    document = {
+        "_id": oid,
+        "addresses": {"home": {"_id": oid, "city": "Beirut"}},
+        "owners": {"home": str(oid)},
+        "point": {"x": 1},
+        "places": [{"name": "Port", "point": {"x": 2, "y": 3}}],
+        "route": [{"x": 4}],
+        "legs": [[{"x": 5}, {"x": 6}]],
+    }
+
+    validated = Atlas.from_mongo(json.loads(json.dumps(document, default=str)))
+    trusted = Atlas.from_mongo(document, trusted=True)
+
+    assert trusted.dict() == validated.dict()
+    assert isinstance(trusted.addresses["home"], Address)
+    assert trusted.addresses["home"].id == oid
+    assert trusted.owners == {"home": oid}
+    assert isinstance(trusted.point, Point)
+    assert isinstance(trusted.places[0].point, Point)
+    assert trusted.route == (Point(x=4),)
+    assert trusted.legs == [(Point(x=5), Point(x=6))]
+
+    decoder = Atlas.decoder()
+    assert decoder.construct_value("addresses", {"work": {"city": "Paris"}}) == {"work": Address(city="Paris")}
+    assert decoder.construct_value("point", {"x": 7}) == Point(x=7)
+
+
+def test_changed_fields_tracking():
+    profile = Profile(name="John")
+    assert profile.get_changed_fields() is None
+    profile.name = "Jane"
+    assert profile.get_changed_fields() is None
+
+    loaded = Profile.from_mongo({"_id": ObjectId(), "name": "John"})
+    assert loaded.get_changed_fields() == set()
+
+    loaded.name = "Jane"
+    loaded.previous.append(Address(city="Paris"))
+    loaded.mark_changed("previous")
+    assert loaded.get_changed_fields() == {"name", "previous"}
+
+    loaded.track_changes()
+    assert loaded.get_changed_fields() == set()
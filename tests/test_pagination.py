@@ -0,0 +1,157 @@
+from typing import Optional
+
+import pytest
+from mongomantic import BaseRepository, MongoDBModel
+from mongomantic.core.errors import FieldDoesNotExistError, InvalidQueryError
+from pymongo.errors import OperationFailure
+
+from .user import User, john
+from .user_repository import UserRepository
+
+
+@pytest.fixture()
+def users(mongodb):
+    # Ages repeat, so that _id breaks ties
+    return UserRepository.save_many(john(i, age=i // 3) for i in range(10))
+
+
+def test_find_sort(users):
+    ages = list(UserRepository.find(sort="-age", values_list=["age"], flat=True))
+    assert ages == sorted(ages, reverse=True)
+
+    names = list(UserRepository.find(sort=["-age", "+first_name"], values_list=["first_name"], flat=True))
+    assert names[:3] == ["John9", "John6", "John7"]
+
+
+def test_find_sort_invalid_field(users):
+    with pytest.raises(FieldDoesNotExistError):
+        list(UserRepository.find(sort="-missing"))
+
+
+@pytest.mark.parametrize("sort", ["age", "-age", "_id", "-id"])
+def test_paginate(users, sort):
+    descending = sort.startswith("-")
+    key = (lambda user: user.id) if sort.endswith("id") else (lambda user: (user.age, user.id))
+    expected = [user.id for user in sorted(users, key=key, reverse=descending)]
+
+    seen = []
+    token = None
+    pages = 0
+    while True:
+        page = UserRepository.paginate(sort=sort, limit=3, after=token)
+        seen.extend(user.id for user in page.items)
+        pages += 1
+        if not page.has_next:
+            break
+        token = page.next_token
+
+    assert seen == expected
+    assert pages == 4
+
+
+def test_paginate_with_filter(users):
+    page = UserRepository.paginate(sort="-age", limit=2, age=1)
+    assert [user.age for user in page.items] == [1, 1]
+
+    page = UserRepository.paginate(sort="-age", limit=2, after=page.next_token, age=1)
+    assert [user.age for user in page.items] == [1]
+    assert page.next_token is None
+
+
+def test_paginate_invalid_token(users):
+    page = UserRepository.paginate(sort="age", limit=2)
+
+    with pytest.raises(InvalidQueryError):
+        UserRepository.paginate(sort="-age", after=page.next_token)
+
+    with pytest.raises(InvalidQueryError):
+        UserRepository.paginate(sort="age", after="not a token")
+
+
+def test_find_with_total(users):
+    models, total = UserRepository.find_with_total(age__gte=1, sort="-age", skip=1, limit=3)
+
+    assert total == 7
+    assert [user.age for user in models] == [2, 2, 2]
+    assert all(isinstance(user, User) for user in models)
+
+
+def test_find_with_total_projection(users):
+    models, total = UserRepository.find_with_total(age=0, projection=["first_name"])
+
+    assert total == 3
+    assert {user.first_name for user in models} == {"John0", "John1", "John2"}
+    assert not hasattr(models[0], "age")
+
+
+def test_find_with_total_no_match(users):
+    assert UserRepository.find_with_total(age=100, limit=5) == ([], 0)
+
+
+def test_find_with_total_fallback(users, monkeypatch):
+    collection = UserRepository._get_collection()
+
+    class NoFacetCollection:
+        def __getattr__(self, name):
+            return getattr(collection, name)
+
+        def aggregate(self, pipeline):
+            raise NotImplementedError("$facet")
+
+    monkeypatch.setattr(UserRepository, "_get_collection", classmethod(lambda cls: NoFacetCollection()))
+
+    models, total = UserRepository.find_with_total(age__gte=1, sort="-age", skip=1, limit=3)
+    assert total == 7
+    assert [user.age for user in models] == [2, 2, 2]
+
+
+@pytest.mark.parametrize("code, fallback", [(40324, True), (50, False), (13, False)])
+def test_find_with_total_server_errors(users, monkeypatch, code, fallback):
+    collection = UserRepository._get_collection()
+
+    class FailingCollection:
+        def __getattr__(self, name):
+            return getattr(collection, name)
+
+        def aggregate(self, pipeline):
+            raise OperationFailure("aggregate failed", code=code)
+
+    monkeypatch.setattr(UserRepository, "_get_collection", classmethod(lambda cls: FailingCollection()))
+
+    if fallback:
+        assert UserRepository.find_with_total(age__gte=1, limit=2)[1] == 7
+    else:
+        # Only servers without $facet fall back, other failures would run the query twice
+        with pytest.raises(InvalidQueryError):
+            UserRepository.find_with_total(age__gte=1)
+
+
+class Player(MongoDBModel):
+    name: str
+    rank: Optional[int] = None
+
+
+class PlayerRepository(BaseRepository):
+    class Meta:
+        model = Player
+        collection = "player"
+
+
+@pytest.mark.parametrize("sort", ["rank", "-rank"])
+def test_paginate_null_and_missing_sort_keys(mongodb, sort):
+    PlayerRepository.save_many([Player(name=f"null{i}") for i in range(3)])
+    PlayerRepository.save_many([Player(name=f"ranked{i}", rank=i) for i in range(3)])
+    PlayerRepository._get_collection().insert_many([{"name": f"missing{i}"} for i in range(2)])
+
+    names = []
+    token = None
+    while True:
+        page = PlayerRepository.paginate(sort=sort, limit=2, after=token)
+        names.extend(player.name for player in page.items)
+        if not page.has_next:
+            break
+        token = page.next_token
+
+    expected = list(PlayerRepository.find(sort=[sort, sort.replace("rank", "_id")], values_list=["name"], flat=True))
+    assert len(expected) == 8
+    assert names == expected
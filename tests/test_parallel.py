@@ -0,0 +1,142 @@
+import time
+
+import pytest
+from mongomantic.core.errors import InvalidQueryError
+from mongomantic.core.parallel import partition_bounds, range_filters, read_ahead
+
+from .user import User, john
+from .user_repository import UserRepository
+
+
+@pytest.fixture()
+def users(mongodb):
+    return UserRepository.save_many(john(i, age=i % 7) for i in range(100))
+
+
+def test_partition_bounds(users):
+    collection = UserRepository._get_collection()
+    bounds = partition_bounds(collection, {}, "_id", 4)
+    assert bounds == [users[25].id, users[50].id, users[75].id]
+
+    # Repeated values are dropped
+    assert partition_bounds(collection, {}, "age", 20) == [1, 2, 3, 4, 5, 6]
+    assert partition_bounds(collection, {"age": 100}, "age", 4) == []
+
+
+def test_partition_bounds_bucket_auto():
+    class BucketCollection:
+        def aggregate(self, pipeline, **kwargs):
+            self.pipeline = pipeline
+            buckets = [(None, 1), (1, 3), (3, 3), (3, 9)]
+            return iter({"_id": {"min": low, "max": high}, "count": 10} for low, high in buckets)
+
+        def find(self, *args, **kwargs):
+            raise AssertionError("Bounds are read with a single aggregation")
+
+    collection = BucketCollection()
+    assert partition_bounds(collection, {"age": {"$gte": 0}}, "age", 4) == [1, 3]
+    assert collection.pipeline == [
+        {"$match": {"age": {"$gte": 0}}},
+        {"$bucketAuto": {"groupBy": "$age", "buckets": 4}},
+    ]
+
+
+def test_range_filters_cover_all_documents(users):
+    collection = UserRepository._get_collection()
+    collection.insert_one({"first_name": "No age"})
+    bounds = partition_bounds(collection, {}, "age", 3)
+
+    counts = [collection.count_documents(part) for part in range_filters({}, "age", bounds)]
+    assert sum(counts) == 101
+
+
+def test_parallel_find_ordered(users):
+    results = list(UserRepository.parallel_find(partitions=4, chunk_size=7, queue_size=1))
+
+    assert [user.id for user in results] == [user.id for user in users]
+    assert all(isinstance(user, User) for user in results)
+
+
+def test_parallel_find_unordered(users):
+    results = list(UserRepository.parallel_find(age__gte=3, partitions=3, partition_key="age", ordered=False))
+
+    assert sorted(user.first_name for user in results) == sorted(user.first_name for user in users if user.age >= 3)
+
+
+def test_parallel_find_raw_projection(users):
+    results = list(UserRepository.parallel_find(projection=["age"], raw=True, partitions=2))
+
+    assert len(results) == 100
+    assert set(results[0]) == {"_id", "age"}
+
+
+def test_parallel_find_processes(users):
+    results = list(UserRepository.parallel_find(partitions=2, processes=2, chunk_size=10, trusted=True))
+
+    assert [user.dict() for user in results] == [user.dict() for user in users]
+
+
+def test_parallel_find_close_early(users):
+    results = UserRepository.parallel_find(partitions=4, chunk_size=1, queue_size=1)
+    assert next(results).id == users[0].id
+    results.close()
+
+
+def test_parallel_find_errors(users):
+    with pytest.raises(InvalidQueryError):
+        next(UserRepository.parallel_find(limit=10))
+
+    with pytest.raises(InvalidQueryError):
+        next(UserRepository.parallel_find(projection=["age"], processes=2))
+
+    with pytest.raises(InvalidQueryError):
+        next(UserRepository.parallel_find(age={"$bad": 1}))
+
+
+def test_read_ahead_is_bounded():
+    produced = []
+
+    def documents():
+        for i in range(100):
+            produced.append(i)
+            yield {"i": i}
+
+    results = read_ahead(documents(), depth=2, chunk_size=1)
+    assert next(results) == {"i": 0}
+
+    # Two chunks queued, and one waiting to be queued
+    deadline = time.monotonic() + 5
+    while len(produced) < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert len(produced) == 4
+
+    assert [document["i"] for document in results] == list(range(1, 100))
+
+
+def test_read_ahead_errors_and_close():
+    def failing():
+        yield {"i": 0}
+        raise ValueError("network")
+
+    results = read_ahead(failing(), depth=1, chunk_size=1)
+    assert next(results) == {"i": 0}
+    with pytest.raises(ValueError):
+        next(results)
+
+    results = read_ahead(({"i": i} for i in range(100)), depth=1, chunk_size=1)
+    next(results)
+    results.close()
+
+
+def test_find_read_ahead(users):
+    results = list(UserRepository.find(age__gte=2, read_ahead=2, batch_size=7, sort="first_name"))
+    expected = list(UserRepository.find(age__gte=2, sort="first_name"))
+    assert results == expected
+    assert len(results) == len([user for user in users if user.age >= 2])
+
+    ages = list(UserRepository.find(read_ahead=1, values_list=["age"], flat=True, limit=5))
+    assert len(ages) == 5
+
+    with pytest.raises(InvalidQueryError):
+        list(UserRepository.find(age={"$bad": 1}, read_ahead=1))
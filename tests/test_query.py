@@ -0,0 +1,114 @@
+from typing import Any, Dict, List, Optional
+
+import pytest
+from bson import ObjectId
+from mongomantic import BaseRepository, MongoDBModel, Q
+from mongomantic.core.errors import FieldDoesNotExistError, InvalidQueryError
+from mongomantic.core.query import compile_lookups
+
+
+class Address(MongoDBModel):
+    city: str
+    zip_code: Optional[str]
+
+
+class Person(MongoDBModel):
+    name: str
+    age: int
+    tags: List[str] = []
+    address: Optional[Address]
+    extra: Dict[str, Any] = {}
+
+
+class PersonRepository(BaseRepository):
+    class Meta:
+        model = Person
+        collection = "person"
+
+
+@pytest.fixture()
+def people(mongodb):
+    return PersonRepository.save_many(
+        [
+            Person(name="John", age=20, tags=["a"], address=Address(city="Paris")),
+            Person(name="Jane", age=30, tags=["a", "b"], address=Address(city="Beirut", zip_code="1100")),
+            Person(name="Jack", age=40, extra={"score": 3}),
+        ]
+    )
+
+
+def names(people):
+    return sorted(person.name for person in people)
+
+
+def test_compile_lookups():
+    oid = ObjectId()
+
+    assert compile_lookups(Person, {"age__gte": 18, "age__lt": 30, "name": "John"}) == {
+        "age": {"$gte": 18, "$lt": 30},
+        "name": "John",
+    }
+    assert compile_lookups(Person, {"address__city__in": ["Paris"]}) == {"address.city": {"$in": ["Paris"]}}
+    assert compile_lookups(Person, {"id__in": [str(oid)]}) == {"_id": {"$in": [oid]}}
+    assert compile_lookups(Person, {"id": str(oid)}) == {"_id": oid}
+    assert compile_lookups(Person, {"extra__score__gt": 1}) == {"extra.score": {"$gt": 1}}
+
+
+def test_compile_lookups_errors():
+    with pytest.raises(FieldDoesNotExistError):
+        compile_lookups(Person, {"missing__gte": 1})
+
+    with pytest.raises(FieldDoesNotExistError):
+        compile_lookups(Person, {"address__country": "France"})
+
+    with pytest.raises(FieldDoesNotExistError):
+        compile_lookups(Person, {"age__between": 1})
+
+    with pytest.raises(InvalidQueryError):
+        compile_lookups(Person, {"id__in": ["invalid"]})
+
+
+def test_q_compile():
+    q = Q(name="John") | (Q(age__gte=30) & ~Q(address__city="Beirut"))
+
+    assert q.compile(Person) == {
+        "$or": [
+            {"name": "John"},
+            {"$and": [{"age": {"$gte": 30}}, {"$nor": [{"address.city": "Beirut"}]}]},
+        ]
+    }
+
+
+def test_q_double_negation():
+    q = Q(name="John") | Q(age__gte=30)
+
+    assert (~~Q(name="John")).compile(Person) == Q(name="John").compile(Person) == {"name": "John"}
+    assert (~~q).compile(Person) == q.compile(Person)
+    assert (~q).compile(Person) == {"$nor": [q.compile(Person)]}
+    assert (~~q & Q(age=20)).compile(Person) == {"$and": [q.compile(Person), {"age": 20}]}
+
+
+def test_find_lookups(people):
+    assert names(PersonRepository.find(age__gte=30)) == ["Jack", "Jane"]
+    assert names(PersonRepository.find(age__gt=20, age__lt=40)) == ["Jane"]
+    assert names(PersonRepository.find(tags__all=["a", "b"])) == ["Jane"]
+    assert names(PersonRepository.find(extra__score__exists=True)) == ["Jack"]
+    assert names(PersonRepository.find(name__regex="^J[ao]")) == ["Jack", "Jane", "John"]
+    assert names(PersonRepository.find(address__city__in=["Paris", "Beirut"])) == ["Jane", "John"]
+    assert names(PersonRepository.find(id__in=[people[0].id, people[2].id])) == ["Jack", "John"]
+
+
+def test_find_q(people):
+    assert names(PersonRepository.find(Q(age=20) | Q(address__city="Beirut"))) == ["Jane", "John"]
+    assert names(PersonRepository.find(~Q(age__gte=30))) == ["John"]
+    assert names(PersonRepository.find(Q(age__gte=30) | Q(name="John"), tags__size=2)) == ["Jane"]
+
+
+def test_other_methods_accept_lookups(people):
+    assert PersonRepository.count(age__gte=30) == 2
+    assert PersonRepository.exists(Q(name="John") & Q(age=20))
+    assert PersonRepository.get(Q(address__zip_code="1100")).name == "Jane"
+    assert sorted(PersonRepository.distinct("name", age__lt=35)) == ["Jane", "John"]
+
+    PersonRepository.delete_many(age__gt=25)
+    assert names(PersonRepository.find()) == ["John"]
@@ -0,0 +1,96 @@
+from typing import List
+
+import pytest
+from bson import ObjectId
+from mongomantic import BaseRepository, MongoDBModel, Reference
+from mongomantic.core.errors import FieldDoesNotExistError, InvalidQueryError
+
+from .counting_collection import CountingCollection
+
+
+class Customer(MongoDBModel):
+    name: str
+
+
+class Line(MongoDBModel):
+    product: Reference[Customer]
+    quantity: int = 1
+
+
+class Order(MongoDBModel):
+    customer: Reference[Customer]
+    lines: List[Line] = []
+    total: float = 0
+
+
+class CustomerRepository(BaseRepository):
+    class Meta:
+        model = Customer
+        collection = "customer"
+
+
+class OrderRepository(BaseRepository):
+    class Meta:
+        model = Order
+        collection = "order"
+
+
+@pytest.fixture()
+def orders(mongodb):
+    customers = CustomerRepository.save_many(Customer(name=f"Customer {i}") for i in range(3))
+    return OrderRepository.save_many(
+        Order(customer=customers[i % 3], lines=[Line(product=customers[0].id)], total=i) for i in range(10)
+    )
+
+
+def test_reference_validation():
+    customer = Customer(id=ObjectId(), name="John")
+
+    order = Order(customer=customer)
+    assert isinstance(order.customer, Reference[Customer])
+    assert order.customer == customer.id
+    assert order.customer.document is customer
+
+    order = Order(customer=str(customer.id))
+    assert order.customer == customer.id
+    assert order.customer.document is None
+
+    assert Reference[Customer] is Reference[Customer]
+    with pytest.raises(ValueError):
+        Order(customer="invalid")
+
+
+def test_reference_stored_as_object_id(orders):
+    document = OrderRepository._get_collection().find_one({"_id": orders[0].id})
+
+    assert type(document["customer"]) in (ObjectId, Reference[Customer])
+    assert OrderRepository.get(id=orders[0].id).customer == orders[0].customer
+    assert OrderRepository.get(id=orders[0].id, trusted=True).customer.__class__ is Reference[Customer]
+
+
+def test_find_prefetch(orders, monkeypatch):
+    collection = CountingCollection(CustomerRepository._get_collection())
+    monkeypatch.setattr(CustomerRepository, "_get_collection", classmethod(lambda cls: collection))
+
+    result = list(OrderRepository.find(prefetch=["customer", "lines.product"]))
+
+    assert len(result) == 10
+    assert collection.finds == 2
+    assert [order.customer.document.name for order in result[:4]] == [
+        "Customer 0",
+        "Customer 1",
+        "Customer 2",
+        "Customer 0",
+    ]
+    assert all(order.lines[0].product.document.name == "Customer 0" for order in result)
+
+
+def test_find_prefetch_invalid_paths(orders):
+    with pytest.raises(FieldDoesNotExistError):
+        list(OrderRepository.find(prefetch=["missing"]))
+
+    with pytest.raises(InvalidQueryError):
+        list(OrderRepository.find(prefetch=["total"]))
+
+    with pytest.raises(InvalidQueryError):
+        list(OrderRepository.find(prefetch=["customer"], raw=True))
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+from bson import ObjectId
+from mongomantic import BaseRepository, Index, MongoDBModel, connect, disconnect
+from mongomantic.core.errors import InvalidQueryError, PartialWriteError, WriteError
+
+
+class Event(MongoDBModel):
+    key: str
+    value: int = 0
+
+
+class EventRepository(BaseRepository):
+    class Meta:
+        model = Event
+        collection = "event"
+        indexes = [Index(name="key_index", unique=True, fields=["+key"])]
+
+
+def test_writer_flushes_on_batch_size(mongodb):
+    with EventRepository.writer(batch_size=10, max_age=60) as writer:
+        events = [writer.save(Event(key=f"e{i}")) for i in range(25)]
+        assert all(event.id is not None for event in events)
+
+        deadline = time.monotonic() + 5
+        while writer.stats().written < 20 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert EventRepository.count() == 20
+        assert writer.stats().pending == 5
+
+    stats = writer.stats()
+    assert stats.flushes == 3
+    assert stats.written == 25
+    assert stats.max_batch_size == 10
+    assert stats.average_batch_size == 25 / 3
+    assert stats.total_flush_time > 0
+    assert EventRepository.get(id=events[24].id).key == "e24"
+
+
+def test_writer_flushes_on_age(mongodb):
+    writer = EventRepository.writer(batch_size=100, max_age=0.05)
+    writer.save(Event(key="a"))
+
+    deadline = time.monotonic() + 5
+    while EventRepository.count() == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert EventRepository.count() == 1
+    writer.close()
+
+
+def test_writer_flush_and_upsert(mongodb):
+    EventRepository.save(Event(key="a", value=1))
+
+    writer = EventRepository.writer(batch_size=100, max_age=60)
+    writer.upsert(Event(key="a", value=2), on=["key"])
+    writer.upsert(Event(key="b", value=3), on=["key"])
+    assert writer.flush(timeout=5)
+
+    assert {event.key: event.value for event in EventRepository.find()} == {"a": 2, "b": 3}
+    writer.close()
+
+    with pytest.raises(WriteError):
+        writer.save(Event(key="c"))
+
+
+def test_writer_upsert_on_missing_id(mongodb):
+    with EventRepository.writer() as writer:
+        with pytest.raises(InvalidQueryError):
+            writer.upsert(Event(key="a"), on=["id"])
+        assert writer.stats().pending == 0
+
+
+def test_writer_save_models_with_id(mongodb):
+    stored = EventRepository.save(Event(key="a", value=1))
+    new = Event(id=ObjectId(), key="b", value=2)
+    errors = []
+
+    with EventRepository.writer(batch_size=100, max_age=60, on_error=lambda e, models: errors.append(e)) as writer:
+        stored.value = 10
+        writer.save(stored)
+        writer.save(new)
+        assert writer.flush(timeout=5)
+
+        new.value = 20
+        writer.save(new)
+
+    assert errors == []
+    assert {event.id: event.value for event in EventRepository.find()} == {stored.id: 10, new.id: 20}
+
+
+def test_writer_reports_errors(mongodb):
+    errors = []
+    writer = EventRepository.writer(batch_size=100, max_age=60, on_error=lambda e, models: errors.append((e, models)))
+    writer.save(Event(key="a"))
+    writer.save(Event(key="a"))
+    writer.save(Event(key="b"))
+    writer.flush()
+
+    assert len(errors) == 1
+    error, models = errors[0]
+    assert isinstance(error, PartialWriteError)
+    assert [e["index"] for e in error.errors] == [1]
+    assert [model.key for model in models] == ["a", "a", "b"]
+    assert writer.stats().failed == 1
+    assert writer.stats().written == 2
+    writer.close()
+
+
+def test_writer_backpressure(mongodb):
+    writer = EventRepository.writer(batch_size=2, max_age=60, max_pending=2)
+    # Block the background thread so that nothing is flushed
+    with writer._condition:
+        writer.save(Event(key="a"))
+        writer.save(Event(key="b"))
+        with pytest.raises(WriteError):
+            writer._add(writer._buffer[0], timeout=0)
+
+    # Producers wait for the buffer to be flushed
+    saved = threading.Event()
+    thread = threading.Thread(target=lambda: (writer.save(Event(key="c"), timeout=5), saved.set()))
+    thread.start()
+    thread.join(5)
+    assert saved.is_set()
+    writer.close()
+    assert EventRepository.count() == 3
+
+
+def test_disconnect_flushes_writers():
+    connect("localhost:27017", "test", mock=True)
+    writer = EventRepository.writer(batch_size=100, max_age=60)
+    writer.save(Event(key="a"))
+    collection = EventRepository._get_collection()
+
+    disconnect()
+    assert writer.closed
+    assert collection.count_documents({}) == 1
@@ -7,3 +7,10 @@ class User(MongoDBModel):
     last_name: str
     email: str
     age: int
+
+
+def john(i: int = 0, **fields) -> User:
+    """User John<i>, aged 20 + i unless other values are given"""
+    values = dict(first_name=f"John{i}", last_name="Smith", email=f"john{i}@google.com", age=20 + i)
+    values.update(fields)
+    return User(**values)